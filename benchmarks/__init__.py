@@ -0,0 +1,9 @@
+"""
+Benchmarks of pypeliner scheduling overhead
+
+Run individual benchmarks as scripts from the root of the repository, for
+example::
+
+    python -m benchmarks.scaling --shapes wide chain --sizes 1000 10000
+
+"""
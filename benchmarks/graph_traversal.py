@@ -0,0 +1,158 @@
+"""
+Benchmark of dependency graph traversals on a split/merge workflow
+
+Builds the job graph of a workflow that splits an input into a given
+number of chunks, transforms each chunk, and merges the results, then
+times the forward and reverse traversals of the dependency graph.  The
+previous restarting traversals are timed for comparison for chunk counts
+up to a configurable limit, beyond which they take too long to be useful.
+
+Usage::
+
+    python benchmarks/graph_traversal.py --chunks 1000 10000 100000
+
+"""
+
+import argparse
+import time
+
+import pypeliner.graph
+import pypeliner.identifiers
+
+
+class BenchmarkResource(object):
+    is_temp = True
+    exists = True
+    createtime = 0
+    def __init__(self, name, node):
+        self.id = (name, node)
+
+
+class BenchmarkJob(object):
+    def __init__(self, name, node, inputs, outputs):
+        self.id = (node, name)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.is_required_downstream = False
+    @property
+    def output_resources(self):
+        return iter(self.outputs)
+    def out_of_date(self):
+        return False
+
+
+def create_split_merge_jobs(num_chunks):
+    """ Create job instances for a split, per chunk transform, and merge.
+    """
+    root = pypeliner.identifiers.Node()
+    source = BenchmarkResource('source', root)
+    source.is_temp = False
+    chunks = BenchmarkResource('chunk', root)
+
+    split_outputs = [chunks]
+    transform_jobs = []
+    merge_inputs = []
+    for chunk in xrange(num_chunks):
+        node = root + pypeliner.identifiers.AxisInstance('chunk', chunk)
+        split_file = BenchmarkResource('split', node)
+        transform_file = BenchmarkResource('transform', node)
+        split_outputs.append(split_file)
+        merge_inputs.append(transform_file)
+        transform_jobs.append(BenchmarkJob('transform', node, [chunks, split_file], [transform_file]))
+
+    jobs = [BenchmarkJob('split', root, [source], split_outputs)]
+    jobs.extend(transform_jobs)
+    jobs.append(BenchmarkJob('merge', root, [chunks] + merge_inputs, [BenchmarkResource('merged', root)]))
+
+    return dict([(job.id, job) for job in jobs])
+
+
+def legacy_traverse_jobs_forward(graph):
+    created_resources = set(graph.inputs)
+    adjacent_jobs = set()
+    for job in graph.jobs.itervalues():
+        if len(list(job.inputs)) == 0:
+            adjacent_jobs.add(job.id)
+    for resource_id in created_resources:
+        for job_id in graph.dependant_jobs[resource_id]:
+            adjacent_jobs.add(job_id)
+    while len(adjacent_jobs) > 0:
+        for job_id in list(adjacent_jobs):
+            job = graph.jobs[job_id]
+            if all([i.id in created_resources for i in job.inputs]):
+                yield job
+                adjacent_jobs.remove(job_id)
+                for o in job.outputs:
+                    created_resources.add(o.id)
+                    for dependent_job_id in graph.dependant_jobs[o.id]:
+                        adjacent_jobs.add(dependent_job_id)
+                break
+
+
+def legacy_traverse_jobs_reverse(graph):
+    visited_resources = set(graph.outputs)
+    visited_jobs = set()
+    adjacent_resources = set()
+    adjacent_jobs = set()
+    for job in graph.jobs.itervalues():
+        if len(list(job.outputs)) == 0:
+            adjacent_jobs.add(job.id)
+    for resource_id in visited_resources:
+        if resource_id in graph.creating_job:
+            adjacent_jobs.add(graph.creating_job[resource_id])
+    while len(adjacent_jobs) > 0 or len(adjacent_resources) > 0:
+        for job_id in list(adjacent_jobs):
+            job = graph.jobs[job_id]
+            if all([o.id in visited_resources for o in job.outputs]):
+                yield job
+                adjacent_jobs.remove(job_id)
+                visited_jobs.add(job_id)
+                for i in job.inputs:
+                    adjacent_resources.add(i.id)
+                break
+        for resource_id in list(adjacent_resources):
+            if all([job_id in visited_jobs for job_id in graph.dependant_jobs[resource_id]]):
+                adjacent_resources.remove(resource_id)
+                visited_resources.add(resource_id)
+                if resource_id in graph.creating_job:
+                    adjacent_jobs.add(graph.creating_job[resource_id])
+
+
+def time_traversal(traversal):
+    start = time.time()
+    num_jobs = len(list(traversal))
+    return num_jobs, time.time() - start
+
+
+def run_benchmark(num_chunks, legacy):
+    graph = pypeliner.graph.DependencyGraph()
+    graph.regenerate(create_split_merge_jobs(num_chunks))
+
+    timings = [
+        ('forward', graph.traverse_jobs_forward()),
+        ('reverse', graph.traverse_jobs_reverse()),
+    ]
+    if legacy:
+        timings.extend([
+            ('legacy forward', legacy_traverse_jobs_forward(graph)),
+            ('legacy reverse', legacy_traverse_jobs_reverse(graph)),
+        ])
+
+    for name, traversal in timings:
+        num_jobs, duration = time_traversal(traversal)
+        print '{0:>8} chunks {1:>16} {2:>8} jobs {3:10.3f}s'.format(num_chunks, name, num_jobs, duration)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+
+    argparser.add_argument('--chunks', type=int, nargs='+', default=[1000, 10000, 100000],
+        help='Number of chunks of the split axis')
+
+    argparser.add_argument('--legacy_max_chunks', type=int, default=10000,
+        help='Largest number of chunks for which to time legacy traversals')
+
+    args = vars(argparser.parse_args())
+
+    for num_chunks in args['chunks']:
+        run_benchmark(num_chunks, num_chunks <= args['legacy_max_chunks'])
@@ -0,0 +1,74 @@
+"""
+Benchmark of pypeliner import times
+
+Imports each module in a fresh interpreter, as ``pypeliner_delegate`` does
+for every job, and reports the median time taken by the import statement,
+the median run time of the interpreter less that of an interpreter that
+imports nothing, and the number of modules loaded by the import.
+
+Usage::
+
+    python benchmarks/import_time.py --repeats 20 pypeliner.delegator pypeliner.jobs
+
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+
+default_modules = ['pypeliner', 'pypeliner.delegator', 'pypeliner.jobs', 'pypeliner.app']
+
+measure_script = """
+import sys, time
+start = time.time()
+{0}
+print time.time() - start, len(sys.modules)
+"""
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) / 2]
+
+
+def time_interpreter(statement, repeats):
+    """ Median import and interpreter times, and modules loaded by a statement.
+    """
+    import_times = []
+    process_times = []
+    for _ in xrange(repeats):
+        start = time.time()
+        output = subprocess.check_output([sys.executable, '-c', measure_script.format(statement)])
+        process_times.append(time.time() - start)
+        import_time, num_modules = output.split()
+        import_times.append(float(import_time))
+    return median(import_times), median(process_times), int(num_modules)
+
+
+def run_benchmark(modules, repeats):
+    # Compile modules and warm the file system cache
+    time_interpreter('import ' + ', '.join(modules), 1)
+
+    _, baseline_time, baseline_modules = time_interpreter('pass', repeats)
+    print '{0:>24} {1:>10} {2:>10} {3:>8}'.format('module', 'import', 'process', 'modules')
+    for module in modules:
+        import_time, process_time, num_modules = time_interpreter('import ' + module, repeats)
+        print '{0:>24} {1:9.1f}ms {2:9.1f}ms {3:>8}'.format(
+            module, import_time * 1000., (process_time - baseline_time) * 1000.,
+            num_modules - baseline_modules)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+
+    argparser.add_argument('modules', nargs='*', default=default_modules,
+        help='Modules to import')
+
+    argparser.add_argument('--repeats', type=int, default=20,
+        help='Number of interpreters started per module')
+
+    args = vars(argparser.parse_args())
+
+    run_benchmark(args['modules'], args['repeats'])
@@ -0,0 +1,122 @@
+"""
+Benchmark of scheduler memory use per job
+
+Runs a synthetic workflow, see :py:mod:`benchmarks.workflows`, to completion,
+then in a fresh process measures the increase in resident memory caused by
+creating the job instances of the top level workflow, as done by the
+scheduler when restarting a workflow with all chunks known.
+
+Usage::
+
+    python -m benchmarks.memory --shapes wide nested --sizes 10000 100000
+
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pypeliner.database
+import pypeliner.graph
+import pypeliner.runskip
+import pypeliner.storage
+
+import benchmarks.scaling
+import benchmarks.workflows
+
+
+def current_rss():
+    """ Current resident memory in bytes, from /proc on linux.
+    """
+    with open('/proc/self/statm', 'r') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def create_workflow(shape, size, work_dir):
+    input_filename = os.path.join(work_dir, 'input')
+    output_filename = os.path.join(work_dir, 'output')
+    return benchmarks.workflows.shapes[shape](size, input_filename, output_filename)
+
+
+def setup_case(shape, size, work_dir):
+    """ Run the workflow to completion so that all chunks are known.
+    """
+    with open(os.path.join(work_dir, 'input'), 'w'):
+        pass
+    workflow = create_workflow(shape, size, work_dir)
+    scheduler = benchmarks.scaling.create_scheduler(work_dir)
+    with pypeliner.storage.create('local', scheduler.workflow_dir) as storage:
+        benchmarks.scaling.time_run(scheduler, workflow, storage)
+
+
+def measure_case(shape, size, work_dir):
+    """ Measure memory used by the job instances of the top level workflow.
+    """
+    workflow = create_workflow(shape, size, work_dir)
+    scheduler = benchmarks.scaling.create_scheduler(work_dir)
+    with pypeliner.storage.create('local', scheduler.workflow_dir) as storage:
+        with pypeliner.database.WorkflowDatabaseFactory(scheduler.temps_dir, scheduler.workflow_dir,
+                                                        scheduler.logs_dir, storage) as db_factory:
+            gc.collect()
+            start_rss = current_rss()
+            workflow_instance = pypeliner.graph.WorkflowInstance(
+                workflow, db_factory, pypeliner.runskip.BasicRunSkip())
+            gc.collect()
+            rss = current_rss() - start_rss
+            num_jobs = len(workflow_instance.graph.jobs)
+    return {'shape': shape, 'size': size, 'jobs': num_jobs, 'rss': rss, 'per_job': rss / float(num_jobs)}
+
+
+def run_case_process(shape, size):
+    """ Benchmark a single workflow in new processes, in a new directory.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        case = [shape, str(size), work_dir]
+        subprocess.check_call([sys.executable, '-m', 'benchmarks.memory', '--setup'] + case)
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.memory', '--measure'] + case)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+
+    argparser.add_argument('--shapes', nargs='+', default=['wide', 'nested'],
+        choices=sorted(benchmarks.workflows.shapes.keys()),
+        help='Shapes of workflows')
+
+    argparser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+        help='Number of chunks, or length of chains')
+
+    argparser.add_argument('--setup', nargs=3, metavar=('SHAPE', 'SIZE', 'WORKDIR'),
+        help=argparse.SUPPRESS)
+
+    argparser.add_argument('--measure', nargs=3, metavar=('SHAPE', 'SIZE', 'WORKDIR'),
+        help=argparse.SUPPRESS)
+
+    args = vars(argparser.parse_args())
+
+    if args['setup'] is not None:
+        shape, size, work_dir = args['setup']
+        setup_case(shape, int(size), work_dir)
+        sys.exit(0)
+
+    if args['measure'] is not None:
+        shape, size, work_dir = args['measure']
+        print json.dumps(measure_case(shape, int(size), work_dir))
+        sys.exit(0)
+
+    print '{0:>14} {1:>8} {2:>8} {3:>10} {4:>10}'.format('shape', 'size', 'jobs', 'rss', 'per job')
+    for shape in args['shapes']:
+        for size in args['sizes']:
+            results = run_case_process(shape, size)
+            print '{0:>14} {1:>8} {2:>8} {3:8.1f}MB {4:9.0f}B'.format(
+                results['shape'], results['size'], results['jobs'],
+                results['rss'] / 1024. / 1024., results['per_job'])
@@ -0,0 +1,186 @@
+"""
+Scaling benchmark of the scheduler on large synthetic workflows
+
+For each shape and size, see :py:mod:`benchmarks.workflows`, the following
+are measured in a separate process:
+
+    run
+        Time to run the workflow from scratch using a single threaded
+        in-process exec queue, see
+        :py:class:`pypeliner.execqueue.inprocess.InProcessJobQueue`.
+
+    construct
+        Time to create the job instances and dependency graph of the top level
+        workflow, with all chunks known from the previous run.
+
+    regenerate
+        Time to regenerate the dependency graph of the top level workflow from
+        existing job instances.
+
+    pop
+        Rate at which jobs are popped from the workflow and completed, without
+        running them, including expanding subworkflows.
+
+    restart
+        Time to run the workflow again, with all jobs up to date.
+
+    rss
+        Peak resident memory of the process.
+
+Usage::
+
+    python -m benchmarks.scaling --shapes chain wide nested subworkflows --sizes 1000 10000
+
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pypeliner.database
+import pypeliner.execqueue.inprocess
+import pypeliner.graph
+import pypeliner.runskip
+import pypeliner.scheduler
+import pypeliner.storage
+
+import benchmarks.workflows
+
+
+def create_scheduler(work_dir):
+    scheduler = pypeliner.scheduler.Scheduler()
+    scheduler.workflow_dir = os.path.join(work_dir, 'pipeline')
+    scheduler.temps_dir = os.path.join(work_dir, 'tmp')
+    scheduler.logs_dir = os.path.join(work_dir, 'log')
+    scheduler.max_jobs = 1000
+    return scheduler
+
+
+def time_run(scheduler, workflow, storage):
+    exec_queue = pypeliner.execqueue.inprocess.InProcessJobQueue(num_threads=1)
+    start = time.time()
+    with exec_queue:
+        scheduler.run(workflow, exec_queue, storage, pypeliner.runskip.BasicRunSkip())
+    return time.time() - start
+
+
+def time_workflow_instance(scheduler, workflow, storage):
+    """ Time creation and regeneration of the top level workflow instance, and
+    popping all jobs.
+    """
+    results = dict()
+    with pypeliner.database.WorkflowDatabaseFactory(scheduler.temps_dir, scheduler.workflow_dir,
+                                                    scheduler.logs_dir, storage) as db_factory:
+        # Rerun so that subworkflows are expanded when popped
+        runskip = pypeliner.runskip.BasicRunSkip(rerun=True)
+
+        start = time.time()
+        workflow_instance = pypeliner.graph.WorkflowInstance(workflow, db_factory, runskip)
+        results['construct'] = time.time() - start
+
+        jobs = dict(workflow_instance.graph.jobs)
+        start = time.time()
+        workflow_instance.graph.regenerate(jobs)
+        results['regenerate'] = time.time() - start
+
+        num_jobs = 0
+        start = time.time()
+        while True:
+            try:
+                job = workflow_instance.pop_next_job()
+            except pypeliner.graph.NoJobs:
+                break
+            job.workflow.notify_completed(job.id)
+            num_jobs += 1
+        duration = time.time() - start
+        results['jobs'] = num_jobs
+        results['pop'] = num_jobs / max(duration, 1e-9)
+
+    return results
+
+
+def run_case(shape, size, work_dir):
+    """ Benchmark a single workflow in the current process.
+    """
+    input_filename = os.path.join(work_dir, 'input')
+    output_filename = os.path.join(work_dir, 'output')
+    with open(input_filename, 'w'):
+        pass
+
+    workflow = benchmarks.workflows.shapes[shape](size, input_filename, output_filename)
+    scheduler = create_scheduler(work_dir)
+    storage = pypeliner.storage.create('local', scheduler.workflow_dir)
+
+    results = {'shape': shape, 'size': size}
+    with storage:
+        results['run'] = time_run(scheduler, workflow, storage)
+        results.update(time_workflow_instance(scheduler, workflow, storage))
+        results['restart'] = time_run(scheduler, workflow, storage)
+    results['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+    return results
+
+
+def run_case_process(shape, size):
+    """ Benchmark a single workflow in a new process, in a new directory.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.scaling', '--case', shape, str(size), work_dir])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def print_header():
+    print '{0:>14} {1:>8} {2:>8} {3:>9} {4:>10} {5:>11} {6:>11} {7:>9} {8:>8}'.format(
+        'shape', 'size', 'jobs', 'run', 'construct', 'regenerate', 'pop', 'restart', 'rss')
+
+
+def print_results(results):
+    print '{0:>14} {1:>8} {2:>8} {3:8.2f}s {4:9.3f}s {5:10.3f}s {6:6.0f}job/s {7:8.2f}s {8:6.0f}MB'.format(
+        results['shape'], results['size'], results['jobs'], results['run'], results['construct'],
+        results['regenerate'], results['pop'], results['restart'], results['rss'])
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+
+    argparser.add_argument('--shapes', nargs='+', default=['chain', 'wide', 'nested', 'subworkflows'],
+        choices=sorted(benchmarks.workflows.shapes.keys()),
+        help='Shapes of workflows')
+
+    argparser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+        help='Number of chunks, or length of chains')
+
+    argparser.add_argument('--json',
+        help='Also write results to this json file')
+
+    argparser.add_argument('--case', nargs=3, metavar=('SHAPE', 'SIZE', 'WORKDIR'),
+        help=argparse.SUPPRESS)
+
+    args = vars(argparser.parse_args())
+
+    if args['case'] is not None:
+        shape, size, work_dir = args['case']
+        print json.dumps(run_case(shape, int(size), work_dir))
+        sys.exit(0)
+
+    print_header()
+    all_results = list()
+    for shape in args['shapes']:
+        for size in args['sizes']:
+            results = run_case_process(shape, size)
+            print_results(results)
+            all_results.append(results)
+
+    if args['json'] is not None:
+        with open(args['json'], 'w') as f:
+            json.dump(all_results, f, indent=2)
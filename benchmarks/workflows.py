@@ -0,0 +1,144 @@
+"""
+Synthetic workflows for benchmarking
+
+Workflows of configurable shape and size, in which every job creates its
+output file and does nothing else.  Each workflow reads a single input
+file and writes a single output file.
+
+"""
+
+import math
+
+import pypeliner.workflow
+import pypeliner.managed as mgd
+
+
+def touch(output_filename, *inputs):
+    with open(output_filename, 'w'):
+        pass
+
+
+def create_chain_workflow(size, input_filename, output_filename):
+    """ Chain of size jobs, each depending on the previous job.
+    """
+    workflow = pypeliner.workflow.Workflow()
+
+    previous = mgd.InputFile(input_filename)
+    for idx in xrange(size):
+        if idx < size - 1:
+            output = mgd.TempOutputFile('chain_{0}'.format(idx))
+        else:
+            output = mgd.OutputFile(output_filename)
+        workflow.transform(
+            name='step_{0}'.format(idx),
+            func=touch,
+            args=(output, previous))
+        previous = mgd.TempInputFile('chain_{0}'.format(idx))
+
+    return workflow
+
+
+def create_wide_workflow(size, input_filename, output_filename):
+    """ Split into size chunks, transform each chunk, and merge.
+    """
+    workflow = pypeliner.workflow.Workflow()
+
+    workflow.setobj(obj=mgd.OutputChunks('chunk'), value=range(size))
+
+    workflow.transform(
+        name='transform',
+        axes=('chunk',),
+        func=touch,
+        args=(
+            mgd.TempOutputFile('transformed', 'chunk'),
+            mgd.InputFile(input_filename)))
+
+    workflow.transform(
+        name='merge',
+        func=touch,
+        args=(
+            mgd.OutputFile(output_filename),
+            mgd.TempInputFile('transformed', 'chunk')))
+
+    return workflow
+
+
+def _factor(size):
+    """ Split size into outer and inner counts of roughly equal size.
+    """
+    num_outer = max(int(round(math.sqrt(size))), 1)
+    return num_outer, max(size / num_outer, 1)
+
+
+def create_nested_workflow(size, input_filename, output_filename):
+    """ Split into outer chunks, and each outer chunk into inner chunks, for
+    a total of roughly size chunks, transform each chunk, and merge inner then
+    outer chunks.
+    """
+    num_outer, num_inner = _factor(size)
+
+    workflow = pypeliner.workflow.Workflow()
+
+    workflow.setobj(obj=mgd.OutputChunks('outer'), value=range(num_outer))
+    workflow.setobj(obj=mgd.OutputChunks('outer', 'inner'), value=range(num_inner), axes=('outer',))
+
+    workflow.transform(
+        name='transform',
+        axes=('outer', 'inner'),
+        func=touch,
+        args=(
+            mgd.TempOutputFile('transformed', 'outer', 'inner'),
+            mgd.InputFile(input_filename)))
+
+    workflow.transform(
+        name='merge_inner',
+        axes=('outer',),
+        func=touch,
+        args=(
+            mgd.TempOutputFile('merged', 'outer'),
+            mgd.TempInputFile('transformed', 'outer', 'inner')))
+
+    workflow.transform(
+        name='merge_outer',
+        func=touch,
+        args=(
+            mgd.OutputFile(output_filename),
+            mgd.TempInputFile('merged', 'outer')))
+
+    return workflow
+
+
+def create_subworkflows_workflow(size, input_filename, output_filename):
+    """ Subworkflows, each a wide workflow, for a total of roughly size chunks.
+    """
+    num_subworkflows, num_chunks = _factor(size)
+
+    workflow = pypeliner.workflow.Workflow()
+
+    workflow.setobj(obj=mgd.OutputChunks('sub'), value=range(num_subworkflows))
+
+    workflow.subworkflow(
+        name='wide',
+        axes=('sub',),
+        func=create_wide_workflow,
+        args=(
+            num_chunks,
+            mgd.InputFile(input_filename),
+            mgd.TempOutputFile('merged', 'sub')))
+
+    workflow.transform(
+        name='merge',
+        func=touch,
+        args=(
+            mgd.OutputFile(output_filename),
+            mgd.TempInputFile('merged', 'sub')))
+
+    return workflow
+
+
+shapes = {
+    'chain': create_chain_workflow,
+    'wide': create_wide_workflow,
+    'nested': create_nested_workflow,
+    'subworkflows': create_subworkflows_workflow,
+}
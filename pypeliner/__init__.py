@@ -1,10 +1,46 @@
+"""
+Library for creating informatic workflows or pipelines
+
+Submodules are imported on first use, so that importing a single submodule,
+as done by ``pypeliner_delegate`` for every job, does not import the
+scheduler and its dependencies.  Until imported, each submodule of the
+package, and of the ``execqueue`` package, is bound to a placeholder module
+that imports the submodule on first attribute access, so that for instance
+``pypeliner.app`` can be used after ``import pypeliner``.
+
+"""
+
+import sys
+import types
+import pkgutil
+import importlib
+
 __all__ = ['helpers', 'scheduler', 'commandline', 'execqueue', 'delegator', 'app']
-import helpers
-import scheduler
-import execqueue
-import commandline
-import delegator
-import app
+
+
+class _LazySubmodule(types.ModuleType):
+    """ Placeholder for a submodule, importing the submodule on first attribute
+    access.  The package attribute is replaced by the submodule on import.
+    """
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        return getattr(module, name)
+    def __repr__(self):
+        return '<module {0!r} (not yet imported)>'.format(self.__name__)
+
+
+def _bind_submodules(namespace):
+    """ Bind each submodule of the package with the given globals to the
+    submodule if imported, or to a placeholder.
+    """
+    for module_loader, name, is_package in pkgutil.iter_modules(namespace['__path__']):
+        if name.startswith('_') or name in namespace:
+            continue
+        full_name = namespace['__name__'] + '.' + name
+        namespace[name] = sys.modules.get(full_name) or _LazySubmodule(full_name)
+
+
+_bind_submodules(globals())
 
 from ._version import get_versions
 __version__ = get_versions()['version']
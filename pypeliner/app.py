@@ -65,6 +65,55 @@ by calling :py:func:`pypeliner.app.add_arguments` on an
         The maximum number of jobs to execute in parallel, either on a cluster or
         using subprocess to create multiple processes.
 
+    maxmem
+        Total memory in GB available to jobs running in parallel.  If set, jobs are only
+        submitted if the memory requested by their `mem` context entry fits within the
+        memory not requested by running jobs.
+
+    maxcpus
+        Total number of cpus available to jobs running in parallel.  If set, jobs are only
+        submitted if the cpus requested by their `ncpus` context entry fit within the cpus
+        not requested by running jobs.
+
+    schedule
+        Order in which ready jobs are submitted.  Valid schedules are:
+            - fifo: submit jobs in the order they become ready
+            - critical_path: submit jobs with the longest downstream path first,
+              weighting jobs by the durations of their task recorded in previous
+              runs, or by the `duration` entry of the job's context
+
+    fairshare
+        How ready jobs are chosen between sibling subworkflows.  Valid policies are:
+            - none: jobs are taken from the first created subworkflow with ready jobs
+            - round_robin: subworkflows take turns, weighted by the `share` entry of
+              the context of their subworkflow job
+            - least_running: jobs are taken from the subworkflow with the fewest
+              running jobs relative to its share
+
+    lazyjobs
+        Create the instances of a job only once its inputs could be ready, rather than
+        creating all jobs when a workflow is started.  Reduces the time and memory taken
+        by workflows with many jobs downstream of splits that are not yet known.
+
+    prefetch
+        Number of upcoming jobs for which inputs in remote storage are staged in the
+        temporary directory before the jobs are submitted.  Jobs that are ready, or
+        will be ready once running jobs finish, are considered.  Disabled if 0.
+
+    prefetchsize
+        Maximum total size in GB of inputs staged for upcoming jobs.
+
+    cachedir
+        Directory of a cache of job results that may be shared between pipelines.  If
+        set, the outputs of successful jobs are stored in the cache, and jobs with the
+        same function, arguments and input file contents as a cached job have their
+        outputs copied from the cache instead of being run.  Jobs are not cached if the
+        `cache` entry of the job's context is False.
+
+    cachesize
+        Maximum total size in GB of the cache, least recently used results are removed
+        once exceeded.
+
     repopulate
         Recreate all temporary files that may have been cleaned up during a previous
         run in which garbage collection was enabled.  Files may be subsequently 
@@ -83,6 +132,19 @@ by calling :py:func:`pypeliner.app.add_arguments` on an
         of date status of jobs, rerun jobs based on whether they have already been
         run.
 
+    checksums
+        Rerun jobs only if the contents of their inputs changed, rather than if their
+        inputs are newer than their outputs.  Checksums of files are saved in the
+        pipeline directory and recalculated only if a file's size or modification time
+        changed.
+
+    dryrun
+        Print a plan of the jobs that would be run or skipped, with durations estimated
+        from previous runs, instead of running the pipeline.  Valid formats are:
+            - none: run the pipeline
+            - table: print the plan as a tab separated table followed by a summary
+            - json: print the plan and summary as json
+
 """
 
 import logging
@@ -92,14 +154,23 @@ import datetime
 from collections import *
 
 import pypeliner.execqueue
+import pypeliner.graph
 import pypeliner.helpers
 import pypeliner.runskip
+import pypeliner.scheduler
+import pypeliner.storage
 import pypeliner.execqueue.factory
 
 ConfigInfo = namedtuple('ConfigInfo', ['name', 'type', 'default', 'help'])
 
 log_levels = ('CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG')
 
+schedules = ('fifo', 'critical_path')
+
+fair_shares = pypeliner.graph.fair_shares
+
+dry_runs = ('none', 'table', 'json')
+
 default_submit_queue = os.environ.get('DEFAULT_SUBMITQUEUE', None)
 default_submit_config = os.environ.get('DEFAULT_SUBMITCONFIG', None)
 default_nativespec = os.environ.get('DEFAULT_NATIVESPEC', '')
@@ -115,12 +186,23 @@ config_infos.append(ConfigInfo('submit_config', str, default_submit_config, 'job
 config_infos.append(ConfigInfo('nativespec', str, default_nativespec, 'qsub native specification'))
 config_infos.append(ConfigInfo('storage', str, default_storage_type, 'file storage system'))
 config_infos.append(ConfigInfo('storage_config', str, default_storage_config, 'file storage system config file'))
+config_infos.append(ConfigInfo('checksums', bool, False, 'rerun jobs only if the contents of their inputs changed'))
 config_infos.append(ConfigInfo('maxjobs', int, 1, 'maximum number of parallel jobs'))
+config_infos.append(ConfigInfo('maxmem', float, None, 'total memory in GB of parallel jobs'))
+config_infos.append(ConfigInfo('maxcpus', int, None, 'total cpus of parallel jobs'))
+config_infos.append(ConfigInfo('schedule', schedules, schedules[0], 'order in which ready jobs are submitted'))
+config_infos.append(ConfigInfo('fairshare', fair_shares, fair_shares[0], 'policy for sharing jobs between subworkflows'))
+config_infos.append(ConfigInfo('lazyjobs', bool, False, 'create jobs only once their inputs could be ready'))
+config_infos.append(ConfigInfo('prefetch', int, 0, 'number of upcoming jobs for which to stage inputs'))
+config_infos.append(ConfigInfo('prefetchsize', float, None, 'maximum total size in GB of staged inputs'))
+config_infos.append(ConfigInfo('cachedir', str, None, 'directory of job results cached between pipelines'))
+config_infos.append(ConfigInfo('cachesize', float, None, 'maximum size in GB of cached job results'))
 config_infos.append(ConfigInfo('repopulate', bool, False, 'recreate all temporaries'))
 config_infos.append(ConfigInfo('rerun', bool, False, 'rerun the pipeline'))
 config_infos.append(ConfigInfo('nocleanup', bool, False, 'do not automatically clean up temporaries'))
 config_infos.append(ConfigInfo('interactive', bool, False, 'run in interactive mode'))
 config_infos.append(ConfigInfo('sentinal_only', bool, False, 'no timestamp checks, sentinal only'))
+config_infos.append(ConfigInfo('dryrun', dry_runs, dry_runs[0], 'print a plan instead of running'))
 
 config_defaults = dict([(info.name, info.default) for info in config_infos])
 
@@ -214,7 +296,8 @@ class Pypeline(object):
             config_filename=self.config['submit_config'])
 
         self.file_storage = pypeliner.storage.create(
-            self.config['storage'], workflow_dir=self.config['pipelinedir'])
+            self.config['storage'], workflow_dir=self.config['pipelinedir'],
+            digests=self.config['checksums'])
 
         self.sch = pypeliner.scheduler.Scheduler()
 
@@ -222,6 +305,15 @@ class Pypeline(object):
         self.sch.workflow_dir = self.config['pipelinedir']
         self.sch.logs_dir = self.logs_dir
         self.sch.max_jobs = int(self.config['maxjobs'])
+        self.sch.max_mem = self.config['maxmem']
+        self.sch.max_cpus = self.config['maxcpus']
+        self.sch.schedule = self.config['schedule']
+        self.sch.fair_share = self.config['fairshare']
+        self.sch.lazy_jobs = self.config['lazyjobs']
+        self.sch.prefetch_depth = self.config['prefetch']
+        self.sch.prefetch_size = self.config['prefetchsize']
+        self.sch.cache_dir = self.config['cachedir']
+        self.sch.cache_size = self.config['cachesize']
         self.sch.cleanup = not self.config['nocleanup']
 
         if self.config['sentinal_only']:
@@ -236,6 +328,9 @@ class Pypeline(object):
             self.runskip = pypeliner.runskip.InteractiveRunSkip(self.runskip)
 
     def run(self, workflow):
+        if self.config['dryrun'] != 'none':
+            self.plan(workflow)
+            return
         with self.exec_queue, self.file_storage:
             try:
                 self.sch.run(workflow, self.exec_queue, self.file_storage, self.runskip)
@@ -243,3 +338,16 @@ class Pypeline(object):
                 self.runskip.close()
                 print 'log file:', self.pipeline_log_filename
 
+    def plan(self, workflow):
+        """ Print a plan of the workflow in the format given by the dryrun option,
+        without running any jobs.
+        """
+        runskip = self.runskip
+        if isinstance(runskip, pypeliner.runskip.InteractiveRunSkip):
+            runskip = runskip.default
+        with self.file_storage:
+            plan = self.sch.plan(workflow, self.file_storage, runskip)
+        if self.config['dryrun'] == 'json':
+            print plan.to_json()
+        else:
+            print plan.format_table()
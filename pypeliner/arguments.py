@@ -6,6 +6,7 @@ import pypeliner.identifiers
 
 
 class Arg(object):
+    __slots__ = ()
     is_split = False
     def get_inputs(self):
         return []
@@ -30,6 +31,7 @@ class Arg(object):
 
 
 class SplitMergeArg(object):
+    __slots__ = ()
     def get_node_chunks(self, node):
         chunks = tuple([a[1] for a in node[-len(self.axes):]])
         if len(chunks) == 1:
@@ -48,6 +50,7 @@ class TemplateArg(Arg):
     dictionary.
 
     """
+    __slots__ = ('name', 'node', 'filename')
     def __init__(self, db, name, node, template=None, **kwargs):
         self.name = name
         self.node = node
@@ -65,6 +68,7 @@ class TempSpaceArg(Arg):
     Resolves to a filename/directory contained within the temporary files directory.
 
     """
+    __slots__ = ('name', 'node', 'cleanup', 'filename')
     def __init__(self, db, name, node, cleanup='both', **kwargs):
         self.name = name
         self.node = node
@@ -92,6 +96,7 @@ class MergeTemplateArg(Arg):
     for the merge axis.  Each value is the name formatted using the merge node dictionary.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'template', 'merge_inputs', 'formatted')
     def __init__(self, db, name, node, axes, template=None, **kwargs):
         self.name = name
         self.node = node
@@ -117,11 +122,13 @@ class InputFileArg(Arg):
     dictionary.
 
     """
+    __slots__ = ('resource',)
     def __init__(self, db, name, node, fnames=None, template=None, **kwargs):
         filename = db.get_user_filename(name, node, fnames=fnames, template=template)
         self.resource = pypeliner.resources.UserResource(db.file_storage, name, node, filename,
             direct_write=kwargs.get('direct_write'),
-            extensions=kwargs.get('extensions'))
+            extensions=kwargs.get('extensions'),
+            sample_blocks=kwargs.get('sample_blocks'))
     def get_inputs(self):
         yield self.resource
     def resolve(self):
@@ -139,6 +146,7 @@ class MergeFileArg(Arg,SplitMergeArg):
     the merge axis.  Each value is the filename formatted using the merge node dictonary.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'fnames', 'template', 'resources', 'merge_inputs')
     def __init__(self, db, name, node, axes, fnames=None, template=None, **kwargs):
         self.name = name
         self.node = node
@@ -150,7 +158,8 @@ class MergeFileArg(Arg,SplitMergeArg):
             filename = db.get_user_filename(self.name, node, fnames=self.fnames, template=self.template)
             resource = pypeliner.resources.UserResource(db.file_storage, self.name, node, filename,
                 direct_write=kwargs.get('direct_write'),
-                extensions=kwargs.get('extensions'))
+                extensions=kwargs.get('extensions'),
+                sample_blocks=kwargs.get('sample_blocks'))
             self.resources.append(resource)
         self.merge_inputs = []
         for dependency in db.nodemgr.get_merge_inputs(self.axes, self.node):
@@ -179,6 +188,7 @@ class OutputFileArg(Arg):
     dictionary, including the '.tmp' suffix.
 
     """
+    __slots__ = ('resource',)
     def __init__(self, db, name, node, fnames=None, template=None, **kwargs):
         filename = db.get_user_filename(name, node, fnames=fnames, template=template)
         self.resource = pypeliner.resources.UserResource(db.file_storage, name, node, filename,
@@ -202,6 +212,7 @@ class SplitFileArg(Arg,SplitMergeArg):
     involves removing the '.tmp' suffix for each file created by the job.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'axes_origin', 'is_split', 'fnames', 'template', 'resources', 'split_outputs', 'merge_inputs', 'filename_callback')
     def __init__(self, db, name, node, axes, axes_origin=None, fnames=None, template=None, **kwargs):
         self.name = name
         self.node = node
@@ -246,6 +257,7 @@ class TempInputObjArg(Arg):
     parameter.
 
     """
+    __slots__ = ('resource', 'func', 'obj')
     def __init__(self, db, name, node, func=None, **kwargs):
         filename = db.get_temp_filename(name, node)
         self.resource = pypeliner.resources.TempObjManager(db.file_storage, name, node, filename)
@@ -265,6 +277,7 @@ class TempMergeObjArg(Arg,SplitMergeArg):
     Resolves to an dictionary of objects with keys given by the merge axis chunks.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'func', 'resources', 'merge_inputs', 'resolved')
     def __init__(self, db, name, node, axes, func=None, **kwargs):
         self.name = name
         self.node = node
@@ -297,6 +310,7 @@ class TempOutputObjArg(Arg):
     Stores an object created by a job.
 
     """
+    __slots__ = ('resource', 'value')
     def __init__(self, db, name, node, **kwargs):
         filename = db.get_temp_filename(name, node)
         self.resource = pypeliner.resources.TempObjManager(db.file_storage, name, node, filename)
@@ -315,6 +329,7 @@ class TempSplitObjArg(Arg,SplitMergeArg):
     split axis.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'axes_origin', 'is_split', 'resources', 'merge_inputs', 'split_outputs', 'value')
     def __init__(self, db, name, node, axes, axes_origin=None, **kwargs):
         self.name = name
         self.node = node
@@ -355,6 +370,7 @@ class TempInputFileArg(Arg):
     Resolves to a filename for a temporary file.
 
     """
+    __slots__ = ('resource',)
     def __init__(self, db, name, node, **kwargs):
         filename = db.get_temp_filename(name, node)
         self.resource = pypeliner.resources.TempFileResource(db.file_storage, name, node, filename,
@@ -376,6 +392,7 @@ class TempMergeFileArg(Arg,SplitMergeArg):
     Resolves to a dictionary of filenames of temporary files.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'resources', 'merge_inputs')
     def __init__(self, db, name, node, axes, **kwargs):
         self.name = name
         self.node = node
@@ -411,6 +428,7 @@ class TempOutputFileArg(Arg):
     Resolves to an output filename for a temporary file.  Finalizes with resource manager.
 
     """
+    __slots__ = ('resource',)
     def __init__(self, db, name, node, **kwargs):
         filename = db.get_temp_filename(name, node)
         self.resource = pypeliner.resources.TempFileResource(db.file_storage, name, node, filename,
@@ -480,6 +498,7 @@ class TempSplitFileArg(Arg,SplitMergeArg):
     given axis.  Finalizes with resource manager to move from temporary filename to final filename.
 
     """
+    __slots__ = ('name', 'node', 'axes', 'axes_origin', 'is_split', 'resources', 'merge_inputs', 'split_outputs', 'filename_callback')
     def __init__(self, db, name, node, axes, axes_origin=None, **kwargs):
         self.name = name
         self.node = node
@@ -520,6 +539,7 @@ class InputInstanceArg(Arg):
     Resolves to the instance of the given job for a specific axis.
 
     """
+    __slots__ = ('chunk',)
     def __init__(self, db, node, axis, **kwargs):
         self.chunk = dict(node)[axis]
     def resolve(self):
@@ -532,6 +552,7 @@ class InputChunksArg(Arg):
     Resolves to the list of chunks for the given axes.
 
     """
+    __slots__ = ('node', 'axis', 'merge_inputs', 'chunks')
     def __init__(self, db, name, node, axis, **kwargs):
         self.node = node
         self.axis = axis
@@ -551,6 +572,7 @@ class OutputChunksArg(Arg,SplitMergeArg):
     Sets the list of chunks for the given axes.
 
     """
+    __slots__ = ('node', 'axes', 'axes_origin', 'is_split', 'merge_inputs', 'split_outputs', 'value')
     def __init__(self, db, name, node, axes, axes_origin=None, **kwargs):
         self.node = node
         self.axes = axes
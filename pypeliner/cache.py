@@ -0,0 +1,224 @@
+"""
+Content addressed cache of job results
+
+Stores the outputs of successful jobs in a cache directory that may be
+shared between pipeline directories, indexed by a fingerprint of the job's
+function and code, its resolved arguments, and the contents of its input
+files.  A job with the same fingerprint as a cached job has its outputs
+copied from the cache instead of being run.  Cached files are reflinked
+where supported, otherwise copied, so that outputs never share an inode with
+the cache, and restored outputs are given the current modification time so
+that dependent jobs are rerun.
+
+Entries are recorded in an sqlite database in the cache directory, and
+least recently used entries are removed once the total size of the cache
+exceeds a maximum size.
+
+"""
+
+import os
+import errno
+import shutil
+import pickle
+import cPickle
+import hashlib
+import sqlite3
+import subprocess
+import tempfile
+import time
+import types
+
+import pypeliner.arguments
+import pypeliner.deep
+import pypeliner.helpers
+import pypeliner.resources
+import pypeliner.storage
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS entries (
+    fingerprint TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+
+_cached_output_types = (
+    pypeliner.arguments.OutputFileArg,
+    pypeliner.arguments.TempOutputFileArg,
+    pypeliner.arguments.TempOutputObjArg,
+)
+
+
+def _code_token(code):
+    """ Token for the code of a function, including nested functions. """
+    consts = tuple(_code_token(const) if isinstance(const, types.CodeType) else repr(const)
+                   for const in code.co_consts)
+    return (code.co_code, consts, code.co_names)
+
+
+def _func_token(func):
+    """ Token for the identity and code of a function. """
+    code = getattr(func, '__code__', None)
+    if code is None:
+        code = getattr(getattr(func, '__call__', None), '__code__', None)
+    return (getattr(func, '__module__', None), getattr(func, '__name__', repr(type(func))),
+            None if code is None else _code_token(code))
+
+
+def _file_digest(resource):
+    """ Digests of the files of a file resource, saved by the storage if it
+    saves digests.  Raises ValueError for stores without digests.
+    """
+    digests = list()
+    for store in resource.stores:
+        if not hasattr(store, 'get_digest'):
+            raise ValueError('no digest for ' + store.filename)
+        digests.append(store.get_digest())
+    return tuple(digests)
+
+
+def _arg_token(arg):
+    """ Token for an argument, with input filenames replaced by the digests of
+    their contents.  Raises ValueError for outputs that cannot be cached.
+    """
+    if not isinstance(arg, pypeliner.arguments.Arg):
+        return None, False
+    if isinstance(arg, pypeliner.arguments.TempSpaceArg):
+        return (type(arg).__name__,), True
+    if len(list(arg.get_outputs())) > 0 or arg.is_split:
+        if not isinstance(arg, _cached_output_types):
+            raise ValueError('uncacheable output ' + type(arg).__name__)
+        return (type(arg).__name__,), True
+    digests = dict()
+    for resource in arg.get_inputs():
+        if isinstance(resource, (pypeliner.resources.UserResource, pypeliner.resources.TempFileResource)):
+            digests[resource.filename] = _file_digest(resource)
+    def _replace_filename(value):
+        if isinstance(value, basestring) and value in digests:
+            return digests[value], True
+        return None, False
+    return (type(arg).__name__, pypeliner.deep.deeptransform(arg.resolve(), _replace_filename)), True
+
+
+def fingerprint(job):
+    """ Fingerprint of a job instance from its function, its arguments and
+    the contents of its input files, or None if the job cannot be cached.
+    """
+    try:
+        token = (_func_token(job.job_def.func), pypeliner.deep.deeptransform(job.argset, _arg_token))
+    except (ValueError, IOError, OSError):
+        return None
+    try:
+        data = cPickle.dumps(token, cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        data = repr(token)
+    return hashlib.sha1(data).hexdigest()
+
+
+def _cached_outputs(job_callable):
+    """ Output arguments of a job callable, in argument order. """
+    return [arg for arg in job_callable.arglist if isinstance(arg, _cached_output_types)]
+
+
+class JobCache(object):
+    """ Cache of job outputs in `cache_dir`, limited to `max_size` bytes if
+    given.
+    """
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = pypeliner.helpers.abspath(cache_dir)
+        self.max_size = max_size
+        self.reflink = True
+        pypeliner.helpers.makedirs(os.path.join(self.cache_dir, 'entries'))
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, 'cache.db'), timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_schema)
+    def close(self):
+        self.connection.close()
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, 'entries', key[:2], key)
+    def _copy(self, source, destination):
+        """ Reflink or copy a file. """
+        pypeliner.helpers.saferemove(destination)
+        if self.reflink:
+            with open(os.devnull, 'w') as devnull:
+                if subprocess.call(['cp', '--reflink=always', source, destination], stderr=devnull) == 0:
+                    return
+            self.reflink = False
+        shutil.copyfile(source, destination)
+    def restore(self, key, job_callable):
+        """ Restore the outputs of a job callable from the cache, returning
+        False if the job is not cached.
+        """
+        with self.connection:
+            updated = self.connection.execute(
+                'UPDATE entries SET last_used = ? WHERE fingerprint = ?', (time.time(), key)).rowcount
+        entry_dir = self._entry_dir(key)
+        if updated == 0 or not os.path.isdir(entry_dir):
+            return False
+        try:
+            for arg_idx, arg in enumerate(_cached_outputs(job_callable)):
+                if isinstance(arg, pypeliner.arguments.TempOutputObjArg):
+                    with open(os.path.join(entry_dir, '{0}'.format(arg_idx)), 'rb') as value_file:
+                        arg.value = pickle.load(value_file)
+                    continue
+                arg.allocate()
+                for store_idx, store in enumerate(arg.resource.stores):
+                    self._copy(os.path.join(entry_dir, '{0}.{1}'.format(arg_idx, store_idx)), store.write_filename)
+                    os.utime(store.write_filename, None)
+                arg.push()
+        except (IOError, OSError, pypeliner.storage.OutputMissingException):
+            self.remove(key)
+            return False
+        return True
+    def store(self, key, job_callable):
+        """ Store the outputs of a finished job callable in the cache. """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+        pypeliner.helpers.makedirs(os.path.dirname(entry_dir))
+        temp_entry_dir = tempfile.mkdtemp(prefix=key + '.', dir=os.path.dirname(entry_dir))
+        try:
+            for arg_idx, arg in enumerate(_cached_outputs(job_callable)):
+                if isinstance(arg, pypeliner.arguments.TempOutputObjArg):
+                    with open(os.path.join(temp_entry_dir, '{0}'.format(arg_idx)), 'wb') as value_file:
+                        pickle.dump(arg.value, value_file)
+                    continue
+                for store_idx, store in enumerate(arg.resource.stores):
+                    self._copy(store.filename, os.path.join(temp_entry_dir, '{0}.{1}'.format(arg_idx, store_idx)))
+            size = sum(os.path.getsize(os.path.join(temp_entry_dir, filename))
+                       for filename in os.listdir(temp_entry_dir))
+            os.rename(temp_entry_dir, entry_dir)
+        except OSError as e:
+            shutil.rmtree(temp_entry_dir, ignore_errors=True)
+            if e.errno in (errno.EEXIST, errno.ENOTEMPTY):
+                return
+            raise
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries (fingerprint, size, created, last_used) VALUES (?, ?, ?, ?)',
+                (key, size, time.time(), time.time()))
+        self.evict()
+    def remove(self, key):
+        """ Remove an entry from the cache. """
+        with self.connection:
+            self.connection.execute('DELETE FROM entries WHERE fingerprint = ?', (key,))
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+    def evict(self):
+        """ Remove least recently used entries until the cache is within its
+        maximum size.
+        """
+        if self.max_size is None:
+            return
+        total_size = self.connection.execute('SELECT SUM(size) FROM entries').fetchone()[0] or 0
+        if total_size <= self.max_size:
+            return
+        rows = self.connection.execute('SELECT fingerprint, size FROM entries ORDER BY last_used').fetchall()
+        for key, size in rows:
+            if total_size <= self.max_size:
+                break
+            self.remove(key)
+            total_size -= size
@@ -307,7 +307,6 @@ def add_task(batch_service_client, job_id, task_id, input_file,
     #     'bash Miniconda2-latest-Linux-x86_64.sh -b -p $AZ_BATCH_TASK_WORKING_DIR/miniconda2',
     #     'export PATH=$AZ_BATCH_TASK_WORKING_DIR/miniconda2/bin:$PATH',
     #     'pip install --user azure-storage',
-    #     'pip install --user networkx',
     #     'pip install --user --upgrade https://bitbucket.org/dranew/pypeliner/get/azure_dev.zip',
     #     './.local/bin/pypeliner_delegate {} {}'.format(input_file.file_path, output_filename),
     #     'ls *',
@@ -584,7 +583,7 @@ class AzureJobQueue(object):
         job_before_blobname = os.path.join(self.job_blobname_prefix[name], job_before_file_path)
 
         with open(job_before_filename, 'wb') as before:
-            pickle.dump(sent, before)
+            pickle.dump(sent, before, pickle.HIGHEST_PROTOCOL)
 
         job_before_file = create_blob_batch_resource(
             self.blob_client, self.container_name, job_before_filename, job_before_blobname, job_before_file_path)
@@ -35,11 +35,14 @@ class BlobMissing(Exception):
 
 
 class AzureBlob(object):
+    is_remote = True
+    __slots__ = ('storage', 'filename', 'write_filename', 'blob_name', 'staged_filename', 'createtime_cache')
     def __init__(self, storage, filename, blob_name, **kwargs):
         self.storage = storage
         self.filename = filename
         self.write_filename = filename
         self.blob_name = blob_name
+        self.staged_filename = None
         self.createtime_cache = storage.create_createtime_cache(blob_name)
     def allocate(self):
         pypeliner.helpers.makedirs(os.path.dirname(self.filename))
@@ -48,7 +51,14 @@ class AzureBlob(object):
         self.storage.push(self.blob_name, self.filename, createtime)
         self.createtime_cache.set(createtime)
     def pull(self):
+        if self.staged_filename is not None and os.path.exists(self.staged_filename):
+            pypeliner.helpers.linkorcopy(self.staged_filename, self.filename)
+            return
         self.storage.pull(self.blob_name, self.filename)
+    def stage(self, staged_filename):
+        self.storage.pull(self.blob_name, staged_filename)
+    def get_size(self):
+        return self.storage.retrieve_blob_size(self.blob_name)
     def get_exists(self):
         createtime = self.get_createtime()
         return createtime is not None and createtime != 'missing'
@@ -145,6 +155,12 @@ class AzureBlobStorage(object):
         if 'create_time' in blob.metadata:
             return blob.metadata['create_time']
         return blob.properties.last_modified.strftime('%Y/%m/%d-%H:%M:%S')
+    def retrieve_blob_size(self, blob_name):
+        container_name, blob_name = self.unpack_path(blob_name)
+        blob = self.blob_client.get_blob_properties(
+            container_name,
+            blob_name)
+        return blob.properties.content_length
     def update_blob_createtime(self, blob_name, createtime):
         container_name, blob_name = self.unpack_path(blob_name)
         self.blob_client.set_blob_metadata(
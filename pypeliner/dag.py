@@ -0,0 +1,77 @@
+"""
+Compact directed graphs
+
+Directed graphs on integer nodes numbered from 0, with the successors of
+all nodes stored in a single integer array indexed by an array of offsets
+per node.  Storage is two machine integers per node and one per edge,
+compared to several dicts per node and edge for general purpose graph
+libraries, making it suitable for checking graphs of many jobs.
+
+"""
+
+import array
+
+
+class CompactDAG(object):
+    """ Directed graph with successors stored in integer arrays.
+
+    Nodes are added in order, each with the list of its successors, which
+    may include nodes not yet added.
+
+    """
+    def __init__(self):
+        self.offsets = array.array('l', [0])
+        self.successors = array.array('l')
+
+    @property
+    def num_nodes(self):
+        return len(self.offsets) - 1
+
+    def add_node(self, successors):
+        """ Add the next node, returning its index.
+        """
+        self.successors.extend(successors)
+        self.offsets.append(len(self.successors))
+        return len(self.offsets) - 2
+
+    def iter_successors(self, node):
+        for idx in xrange(self.offsets[node], self.offsets[node + 1]):
+            yield self.successors[idx]
+
+    def find_cycle(self):
+        """ Find a cycle using an iterative depth first search.
+
+        :return: list of nodes in the cycle, each a predecessor of the next and
+                 the last a predecessor of the first, or None if the graph is
+                 acyclic
+
+        """
+        num_nodes = self.num_nodes
+        for node in self.successors:
+            if node >= num_nodes:
+                raise ValueError('successor {0} not added'.format(node))
+
+        # State of each node, 0 if unvisited, 1 if on the stack, 2 if visited
+        state = bytearray(num_nodes)
+        next_edge = array.array('l', self.offsets)
+
+        for root in xrange(num_nodes):
+            if state[root] != 0:
+                continue
+            state[root] = 1
+            stack = [root]
+            while len(stack) > 0:
+                node = stack[-1]
+                edge = next_edge[node]
+                if edge == self.offsets[node + 1]:
+                    state[node] = 2
+                    stack.pop()
+                    continue
+                next_edge[node] = edge + 1
+                successor = self.successors[edge]
+                if state[successor] == 0:
+                    state[successor] = 1
+                    stack.append(successor)
+                elif state[successor] == 1:
+                    return stack[stack.index(successor):]
+        return None
@@ -7,6 +7,7 @@ import shutil
 import shelve
 
 import pypeliner.helpers
+import pypeliner.history
 import pypeliner.resources
 import pypeliner.identifiers
 import pypeliner.workflow
@@ -18,6 +19,7 @@ class NodeManager(object):
         self.nodes_dir = nodes_dir
         self.temps_dir = temps_dir
         self.cached_chunks = dict()
+        self.updated_axes = set()
     def retrieve_nodes(self, axes, base_node=None):
         if base_node is None:
             base_node = pypeliner.identifiers.Node()
@@ -74,10 +76,16 @@ class NodeManager(object):
             new_node = node + pypeliner.identifiers.AxisInstance(axis, chunk)
             pypeliner.helpers.makedirs(os.path.join(self.temps_dir, new_node.subdir))
         chunks = sorted(chunks)
+        if self.cached_chunks.get((axis, node)) != chunks:
+            self.updated_axes.add(axis)
         self.cached_chunks[(axis, node)] = chunks
         filename = self.db.get_temp_filename(axis, node)
         resource = pypeliner.resources.TempObjManager(self.db.file_storage, axis, node, filename)
         resource.finalize(chunks)
+    def pop_updated_axes(self):
+        updated_axes = self.updated_axes
+        self.updated_axes = set()
+        return updated_axes
     def get_merge_inputs(self, axes, node, subset=None):
         if subset is None:
             subset = set([])
@@ -158,9 +166,10 @@ class TempFilenameCreator(object):
 
 
 class WorkflowDatabase(object):
-    def __init__(self, temps_dir, workflow_dir, logs_dir, file_storage, job_shelf, path_info, instance_subdir):
+    def __init__(self, temps_dir, workflow_dir, logs_dir, file_storage, job_shelf, run_history, path_info, instance_subdir):
         self.file_storage = file_storage
         self.job_shelf = job_shelf
+        self.run_history = run_history
         self.path_info = path_info
         self.instance_subdir = instance_subdir
         self.nodes_dir = os.path.join(workflow_dir, 'nodes', instance_subdir)
@@ -200,12 +209,13 @@ class WorkflowDatabaseFactory(object):
         pypeliner.helpers.makedirs(self.workflow_dir)
         self.file_storage = file_storage
         self.job_shelf_filename = os.path.join(self.workflow_dir, 'jobs.shelf')
+        self.run_history_filename = os.path.join(self.workflow_dir, 'history.db')
         self.lock_directories = list()
     def create(self, path_info, instance_subdir):
         self._add_lock(instance_subdir)
         db = WorkflowDatabase(
             self.temps_dir, self.workflow_dir, self.logs_dir, self.file_storage,
-            self.job_shelf, path_info, instance_subdir)
+            self.job_shelf, self.run_history, path_info, instance_subdir)
         return db
     def _add_lock(self, instance_subdir):
         lock_directory = os.path.join(self.workflow_dir, 'locks', instance_subdir, '_lock')
@@ -220,9 +230,11 @@ class WorkflowDatabaseFactory(object):
         self.lock_directories.append(lock_directory)
     def __enter__(self):
         self.job_shelf = shelve.open(self.job_shelf_filename)
+        self.run_history = pypeliner.history.RunHistory(self.run_history_filename)
         return self
     def __exit__(self, exc_type, exc_value, traceback):
         self.job_shelf.close()
+        self.run_history.close()
         for lock_directory in self.lock_directories:
             try:
                 os.rmdir(lock_directory)
@@ -1,10 +1,8 @@
-import inspect
 import logging
 import os
-import dill as pickle
+import cPickle
 import sys
 import time
-import tempfile
 import shutil
 import subprocess
 import traceback
@@ -12,6 +10,30 @@ import traceback
 import pypeliner.helpers
 
 
+def _load(f):
+    """ Load a job pickled with dill.  Most jobs can be loaded with cPickle,
+    which imports dill only if the job requires it, avoiding the cost of
+    importing dill in every delegated job.
+    """
+    try:
+        return cPickle.load(f)
+    except Exception:
+        import dill
+        f.seek(0)
+        return dill.load(f)
+
+
+def _dump(obj, f):
+    """ Pickle a job with cPickle, or with dill if cPickle fails.
+    """
+    try:
+        data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        import dill
+        data = dill.dumps(obj)
+    f.write(data)
+
+
 class Delegator(object):
     def __init__(self, job, prefix, modules):
         self.job = job
@@ -32,8 +54,9 @@ class Delegator(object):
             waittime *= 2
     def initialize(self):
         self.cleanup()
+        import dill
         with open(self.before_filename, 'wb') as before:
-            pickle.dump(self.job, before)
+            dill.dump(self.job, before)
         command = ['pypeliner_delegate', self.before_filename, self.after_filename] + self.syspaths
         return command
     def finalize(self):
@@ -42,11 +65,12 @@ class Delegator(object):
             return None
         self.job = None
         with open(self.after_filename, 'rb') as after:
-            self.job = pickle.load(after)
+            self.job = _load(after)
         self.cleanup()
         return self.job
 
 def call_external(obj):
+    import tempfile
     try:
         tmp_dir = tempfile.mkdtemp()
         dgt = Delegator(obj, tmp_dir, [sys.modules[obj.__module__]])
@@ -71,7 +95,7 @@ def main():
         sys.path.extend(sys.argv[3:])
         job = None
         with open(before_filename, 'rb') as before:
-            job = pickle.load(before)
+            job = _load(before)
         if job is None:
             raise ValueError('no job data in ' + before_filename)
         job()
@@ -79,7 +103,7 @@ def main():
         sys.stderr.write(traceback.format_exc())
     finally:
         with open(after_filename, 'wb') as after:
-            pickle.dump(job, after)
+            _dump(job, after)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,3 @@
+import pypeliner
+
+pypeliner._bind_submodules(globals())
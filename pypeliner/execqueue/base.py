@@ -15,6 +15,22 @@ class JobQueue(object):
         """
         raise NotImplementedError()
 
+    def send_array(self, ctx, names, sents, temps_dirs):
+        """ Add jobs with identical context to the queue, as a job array if
+        supported by the queue.  Each job is waited for and received separately,
+        so queues should only submit arrays whose elements can be reported as
+        they finish.
+
+        Args:
+            ctx (dict): context of jobs, mem etc.
+            names (list): unique name for each job
+            sents (list): callable object for each job
+            temps_dirs (list): unique path for storing temps of each job
+
+        """
+        for name, sent, temps_dir in zip(names, sents, temps_dirs):
+            self.send(ctx, name, sent, temps_dir)
+
     def wait(self, immediate=False):
         """ Wait for a job to finish.
 
@@ -215,7 +215,83 @@ class DrmaaJob(object):
             fh.write('\n'.join(resources_text))
 
 
-class DrmaaJobQueue(object):
+class DrmaaJobArrayElement(DrmaaJob):
+    """ Element of a job array submitted using drmaa, with the job id of the
+    element's task
+    """
+    def __init__(self, name, sent, temps_dir, modules, qenv, native_spec, session):
+        self.name = name
+        self.qenv = qenv
+        self.native_spec = native_spec
+        self.session = session
+        self.temps_dir = temps_dir
+        self.logger = logging.getLogger('pypeliner.execqueue')
+        self.delegated = pypeliner.delegator.Delegator(sent, os.path.join(temps_dir, 'job.dgt'), modules)
+        self.command = self.delegated.initialize()
+
+        self.debug_filenames = dict()
+        self.debug_filenames['job stdout'] = os.path.join(self.temps_dir, 'job.out')
+        self.debug_filenames['job stderr'] = os.path.join(self.temps_dir, 'job.err')
+        self.debug_filenames['resources'] = os.path.join(self.temps_dir, 'resources.txt')
+        self.debug_filenames['qacct stdout'] = os.path.join(temps_dir, 'qacct.out')
+        self.debug_filenames['qacct stderr'] = os.path.join(temps_dir, 'qacct.err')
+        for filename in self.debug_filenames.itervalues():
+            pypeliner.helpers.saferemove(filename)
+
+        self.job_id = None
+        self.job_info = None
+        self.qacct = None
+        self.unrecoverable_error = False
+
+    def submitted(self, job_id):
+        """ Set the job id of the element after submitting the array.
+        """
+        self.job_id = job_id
+        array_job_id, _, task_id = job_id.partition('.')
+        self.qacct = pypeliner.execqueue.qcmd.QacctWrapper(
+            self.qenv, array_job_id,
+            self.debug_filenames['qacct stdout'],
+            self.debug_filenames['qacct stderr'],
+            task_id=task_id or None,
+        )
+
+
+class DrmaaJobArray(object):
+    """ Submit a job array using drmaa bulk jobs, with an element for each job
+    """
+    def __init__(self, ctx, names, sents, temps_dirs, modules, qenv, native_spec, session):
+        self.name = names[0]
+        self.elements = [DrmaaJobArrayElement(name, sent, temps_dir, modules, qenv, native_spec, session)
+            for name, sent, temps_dir in zip(names, sents, temps_dirs)]
+
+        self.script_filename = os.path.join(temps_dirs[0], 'array.sh')
+        pypeliner.execqueue.utils.write_array_script(
+            self.script_filename,
+            [element.command for element in self.elements],
+            [element.debug_filenames['job stdout'] for element in self.elements],
+            [element.debug_filenames['job stderr'] for element in self.elements])
+        pypeliner.helpers.set_executable(self.script_filename)
+
+        job_template = session.createJobTemplate()
+        job_template.remoteCommand = self.script_filename
+
+        native_spec, export_local_env = self.elements[0]._parse_native_spec(native_spec)
+        if export_local_env:
+            job_template.jobEnvironment = os.environ
+
+        job_template.nativeSpecification = self.elements[0]._create_native_spec(native_spec, ctx)
+        job_template.outputPath = ':' + os.path.join(temps_dirs[0], 'array.out')
+        job_template.errorPath = ':' + os.path.join(temps_dirs[0], 'array.err')
+        job_template.jobName = pypeliner.execqueue.utils.qsub_format_name(self.name)
+
+        job_ids = session.runBulkJobs(job_template, 1, len(self.elements), 1)
+        session.deleteJobTemplate(job_template)
+
+        for element, job_id in zip(self.elements, job_ids):
+            element.submitted(job_id)
+
+
+class DrmaaJobQueue(pypeliner.execqueue.base.JobQueue):
     """ Maintain a list of running jobs executed synchronously using
     drmaa, with the ability to wait for jobs and return completed jobs
     """
@@ -257,8 +333,18 @@ class DrmaaJobQueue(object):
         
         else:
             self.jobs[name] = self.create(ctx, name, sent, temps_dir)
+
+    def send_array(self, ctx, names, sents, temps_dirs):
+        if ctx.get('local', False) or len(names) == 1:
+            super(DrmaaJobQueue, self).send_array(ctx, names, sents, temps_dirs)
+
+        else:
+            array = DrmaaJobArray(ctx, names, sents, temps_dirs, self.modules, self.qenv, self.native_spec, self.session)
+
+            for element in array.elements:
+                self.jobs[element.name] = element
     
-    def wait(self):
+    def wait(self, immediate=False):
         while True:
             if not self.local_queue.empty:
                 name = self.local_queue.wait(immediate=True)
@@ -268,10 +354,12 @@ class DrmaaJobQueue(object):
                     
                     return name
                 
-            while True:
-                for name, job in self.jobs.iteritems():
-                    if job.finished:
-                        return name
+            for name, job in self.jobs.iteritems():
+                if job.finished:
+                    return name
+
+            if immediate:
+                return None
           
             time.sleep(1)
     
@@ -6,6 +6,8 @@ def create(requested_queue, modules=None, native_spec=None, config_filename=None
         raise Exception('No submit queue specified')
     elif requested_queue == 'local':
         exec_queue_name = 'pypeliner.execqueue.local.LocalJobQueue'
+    elif requested_queue == 'inprocess':
+        exec_queue_name = 'pypeliner.execqueue.inprocess.InProcessJobQueue'
     elif requested_queue == 'qsub':
         exec_queue_name = 'pypeliner.execqueue.qsub.QsubJobQueue'
     elif requested_queue == 'asyncqsub':
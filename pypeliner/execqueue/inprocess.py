@@ -0,0 +1,171 @@
+import logging
+import threading
+import traceback
+import Queue
+
+import pypeliner.execqueue.base
+
+
+class InProcessJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue of jobs called in a pool of threads of the current process.
+    Avoids the cost of a delegator subprocess for small python jobs.  Jobs
+    are called without pickling, and the callable sent is also the object
+    received, so jobs are not isolated from the current process: timeouts
+    are not enforced and the memory used by a job is not known.  Callables
+    with `stage_in` and `stage_out` methods, such as
+    :py:class:`pypeliner.jobs.JobCallable`, are staged in by :py:meth:`send` and
+    staged out by :py:meth:`receive`, so that only the thread using the queue
+    accesses storage.  If given, `notify` is called with no arguments from the
+    worker thread each time a job finishes.
+    """
+    def __init__(self, modules=None, num_threads=4, notify=None, **kwargs):
+        self.num_threads = num_threads
+        self.notify = notify
+        self.logger = logging.getLogger('pypeliner.execqueue')
+        self.jobs = dict()
+        self.errors = dict()
+        self.pending = Queue.Queue()
+        self.finished = Queue.Queue()
+        self.threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for thread in self.threads:
+            self.pending.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _call_pending(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            name, sent = item
+            try:
+                sent()
+            except Exception:
+                self.errors[name] = traceback.format_exc()
+            self.finished.put(name)
+            if self.notify is not None:
+                self.notify()
+
+    def send(self, ctx, name, sent, temps_dir):
+        if len(self.threads) < self.num_threads:
+            thread = threading.Thread(target=self._call_pending)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        if hasattr(sent, 'stage_in'):
+            sent.stage_in()
+        self.jobs[name] = sent
+        self.pending.put((name, sent))
+
+    def wait(self, immediate=False, timeout=None):
+        """ Wait for a job to finish, returning None if no job has finished
+        within `timeout` seconds.
+        """
+        if immediate:
+            timeout = 0
+        elapsed = 0
+        while True:
+            # Wait in short intervals, a blocking get cannot be interrupted
+            interval = 1 if timeout is None else min(1, timeout - elapsed)
+            try:
+                if interval <= 0:
+                    return self.finished.get_nowait()
+                return self.finished.get(timeout=interval)
+            except Queue.Empty:
+                elapsed += interval
+                if timeout is not None and elapsed >= timeout:
+                    return None
+
+    def receive(self, name):
+        sent = self.jobs.pop(name)
+        error = self.errors.pop(name, None)
+        if error is None and hasattr(sent, 'stage_out'):
+            sent.stage_out()
+        if error is not None:
+            self.logger.error(name + ' failed to complete\n' + error)
+            raise pypeliner.execqueue.base.ReceiveError()
+        return sent
+
+    @property
+    def length(self):
+        return len(self.jobs)
+
+    @property
+    def empty(self):
+        return self.length == 0
+
+
+class InProcessDispatchJobQueue(pypeliner.execqueue.base.JobQueue):
+    """ Queue sending jobs with the 'inprocess' context entry set to an
+    :py:class:`InProcessJobQueue`, and other jobs to `exec_queue`.  While jobs
+    are running in both queues, the queues are polled every `poll_interval`
+    seconds.  `notify` is called when an in process job finishes.
+    """
+    def __init__(self, exec_queue, num_threads=4, poll_interval=0.1, notify=None):
+        self.exec_queue = exec_queue
+        self.inprocess_queue = InProcessJobQueue(num_threads=num_threads, notify=notify)
+        self.poll_interval = poll_interval
+        self.inprocess_names = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.inprocess_queue.close()
+
+    def send(self, ctx, name, sent, temps_dir):
+        if ctx.get('inprocess', False):
+            self.inprocess_queue.send(ctx, name, sent, temps_dir)
+            self.inprocess_names.add(name)
+        else:
+            self.exec_queue.send(ctx, name, sent, temps_dir)
+
+    def send_array(self, ctx, names, sents, temps_dirs):
+        if ctx.get('inprocess', False):
+            self.inprocess_queue.send_array(ctx, names, sents, temps_dirs)
+            self.inprocess_names.update(names)
+        elif hasattr(self.exec_queue, 'send_array'):
+            self.exec_queue.send_array(ctx, names, sents, temps_dirs)
+        else:
+            super(InProcessDispatchJobQueue, self).send_array(ctx, names, sents, temps_dirs)
+
+    def wait(self, immediate=False):
+        if self.inprocess_queue.empty:
+            return self.exec_queue.wait(immediate=immediate)
+        if self.exec_queue.empty:
+            return self.inprocess_queue.wait(immediate=immediate)
+        while True:
+            name = self.exec_queue.wait(immediate=True)
+            if name is not None:
+                return name
+            if immediate:
+                return self.inprocess_queue.wait(immediate=True)
+            name = self.inprocess_queue.wait(timeout=self.poll_interval)
+            if name is not None:
+                return name
+
+    def receive(self, name):
+        if name in self.inprocess_names:
+            self.inprocess_names.remove(name)
+            return self.inprocess_queue.receive(name)
+        return self.exec_queue.receive(name)
+
+    @property
+    def length(self):
+        return self.exec_queue.length + self.inprocess_queue.length
+
+    @property
+    def empty(self):
+        return self.length == 0
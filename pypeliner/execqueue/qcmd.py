@@ -3,6 +3,7 @@ import subprocess
 import time
 
 import pypeliner.helpers
+import pypeliner.execqueue.utils
 
 
 class QEnv(object):
@@ -19,7 +20,11 @@ class QstatError(Exception):
 
 
 class QstatJobStatus(object):
-    """ Class representing statuses retrieved using qstat """
+    """ Class representing statuses retrieved using qstat.  Statuses of tasks
+    of job arrays are also listed with job ids of the form 'job_id.task_id'.
+    """
+    qstat_options = ()
+
     def __init__(self, qenv, qstat_period=20, max_qstat_failures=10):
         self.qenv = qenv
         self.qstat_period = qstat_period
@@ -85,7 +90,7 @@ class QstatJobStatus(object):
         """
         job_status = dict()
 
-        for line in subprocess.check_output([self.qenv.qstat_bin]).split('\n'):
+        for line in subprocess.check_output([self.qenv.qstat_bin] + list(self.qstat_options)).split('\n'):
             row = line.split()
             try:
                 qsub_job_id = row[0]
@@ -93,18 +98,35 @@ class QstatJobStatus(object):
                 job_status[qsub_job_id] = status
             except IndexError:
                 continue
+            for task_id in self.parse_task_ids(row):
+                job_status['{0}.{1}'.format(qsub_job_id, task_id)] = status
 
         return job_status
 
+    def parse_task_ids(self, row):
+        """ Task ids of a job array listed in a row of qstat output, given in
+        the last column for sge, after the queue column for running tasks.
+
+        Returns:
+            list: task ids, empty if the row is not for a job array
+        """
+        if len(row) == 10 or (len(row) == 9 and '@' not in row[7]):
+            try:
+                return pypeliner.execqueue.utils.parse_task_ids(row[-1])
+            except ValueError:
+                return []
+        return []
+
 
 class QacctError(Exception):
     pass
 
 
 class QacctWrapper(object):
-    def __init__(self, qenv, job_id, qacct_stdout_filename, qacct_stderr_filename, max_qacct_failures=100):
+    def __init__(self, qenv, job_id, qacct_stdout_filename, qacct_stderr_filename, max_qacct_failures=100, task_id=None):
         self.qenv = qenv
         self.job_id = job_id
+        self.task_id = task_id
         self.qacct_stdout_filename = qacct_stdout_filename
         self.qacct_stderr_filename = qacct_stderr_filename
         self.max_qacct_failures = max_qacct_failures
@@ -117,7 +139,10 @@ class QacctWrapper(object):
         """
         try:
             with open(self.qacct_stdout_filename, 'w') as qacct_stdout, open(self.qacct_stderr_filename, 'w') as qacct_stderr:
-                subprocess.check_call([self.qenv.qacct_bin, '-j', self.job_id], stdout=qacct_stdout, stderr=qacct_stderr)
+                qacct = [self.qenv.qacct_bin, '-j', self.job_id]
+                if self.task_id is not None:
+                    qacct += ['-t', str(self.task_id)]
+                subprocess.check_call(qacct, stdout=qacct_stdout, stderr=qacct_stderr)
         except subprocess.CalledProcessError:
             self.qacct_failures += 1
             if self.qacct_failures > self.max_qacct_failures:
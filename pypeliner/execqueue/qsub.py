@@ -1,4 +1,5 @@
 import os
+import pipes
 import logging
 import subprocess
 import time
@@ -27,7 +28,7 @@ class QsubJob(object):
         self.debug_files = []
         self.script_filename = os.path.join(temps_dir, 'submit.sh')
         with open(self.script_filename, 'w') as script_file:
-            script_file.write(' '.join(self.command) + '\n')
+            script_file.write(' '.join(pipes.quote(arg) for arg in self.command) + '\n')
         pypeliner.helpers.set_executable(self.script_filename)
         self.submit_command = self.create_submit_command(ctx, self.name, self.script_filename, qsub_bin, native_spec, self.debug_filenames['job stdout'], self.debug_filenames['job stderr'])
         try:
@@ -120,7 +121,7 @@ class AsyncQsubJob(object):
 
         self.script_filename = os.path.join(temps_dir, 'submit.sh')
         with open(self.script_filename, 'w') as script_file:
-            script_file.write(' '.join(self.command) + '\n')
+            script_file.write(' '.join(pipes.quote(arg) for arg in self.command) + '\n')
         pypeliner.helpers.set_executable(self.script_filename)
 
         self.submit_command = self.create_submit_command(ctx, name, self.script_filename, self.qenv.qsub_bin, native_spec, self.debug_filenames['job stdout'], self.debug_filenames['job stderr'])
@@ -228,11 +229,113 @@ class AsyncQsubJob(object):
         return '\n'.join(error_text)
 
 
+class AsyncQsubJobArrayElement(AsyncQsubJob):
+    """ Element of a job array created using a queueing system's qsub submit
+    command, and polled using qstat.  The job id of the element identifies
+    the element's task within the array.
+    """
+    def __init__(self, name, sent, temps_dir, modules, qenv, qstat_job_status):
+        self.name = name
+        self.qenv = qenv
+        self.qstat_job_status = qstat_job_status
+        self.qsub_job_id = None
+        self.qacct = None
+        self.submit_command = []
+        self.logger = logging.getLogger('pypeliner.execqueue')
+
+        self.delegated = pypeliner.delegator.Delegator(sent, os.path.join(temps_dir, 'job.dgt'), modules)
+        self.command = self.delegated.initialize()
+
+        self.debug_filenames = dict()
+        self.debug_filenames['job stdout'] = os.path.join(temps_dir, 'job.out')
+        self.debug_filenames['job stderr'] = os.path.join(temps_dir, 'job.err')
+        self.debug_filenames['qacct stdout'] = os.path.join(temps_dir, 'qacct.out')
+        self.debug_filenames['qacct stderr'] = os.path.join(temps_dir, 'qacct.err')
+        for filename in self.debug_filenames.itervalues():
+            pypeliner.helpers.saferemove(filename)
+
+        self.script_filename = os.path.join(temps_dir, 'submit.sh')
+        with open(self.script_filename, 'w') as script_file:
+            script_file.write(' '.join(pipes.quote(arg) for arg in self.command) + '\n')
+        pypeliner.helpers.set_executable(self.script_filename)
+
+    def submitted(self, submit_command, qsub_job_id, task_id, qsub_time):
+        """ Set the job id of the element after submitting the array.
+        """
+        self.submit_command = submit_command
+        self.qsub_job_id = qsub_job_id
+        self.qsub_time = qsub_time
+        self.qacct = pypeliner.execqueue.qcmd.QacctWrapper(
+            self.qenv, qsub_job_id.split('.')[0],
+            self.debug_filenames['qacct stdout'],
+            self.debug_filenames['qacct stderr'],
+            task_id=task_id,
+        )
+
+
+class AsyncQsubJobArray(object):
+    """ Submit a job array using a queueing system's qsub submit command, with
+    an element for each job, polled separately using qstat.
+    """
+    def __init__(self, ctx, names, sents, temps_dirs, modules, qenv, native_spec, qstat_job_status, parse_job_id, element_job_id, array_option):
+        self.name = names[0]
+        self.array_option = array_option
+        self.elements = [AsyncQsubJobArrayElement(name, sent, temps_dir, modules, qenv, qstat_job_status)
+            for name, sent, temps_dir in zip(names, sents, temps_dirs)]
+
+        self.debug_filenames = dict()
+        self.debug_filenames['array stdout'] = os.path.join(temps_dirs[0], 'array.out')
+        self.debug_filenames['array stderr'] = os.path.join(temps_dirs[0], 'array.err')
+        self.debug_filenames['submit stdout'] = os.path.join(temps_dirs[0], 'submit.out')
+        self.debug_filenames['submit stderr'] = os.path.join(temps_dirs[0], 'submit.err')
+        for filename in self.debug_filenames.itervalues():
+            pypeliner.helpers.saferemove(filename)
+
+        self.script_filename = os.path.join(temps_dirs[0], 'array.sh')
+        pypeliner.execqueue.utils.write_array_script(
+            self.script_filename,
+            [[element.script_filename] for element in self.elements],
+            [element.debug_filenames['job stdout'] for element in self.elements],
+            [element.debug_filenames['job stderr'] for element in self.elements])
+        pypeliner.helpers.set_executable(self.script_filename)
+
+        self.submit_command = self.create_submit_command(ctx, self.name, self.script_filename, qenv.qsub_bin, native_spec, self.debug_filenames['array stdout'], self.debug_filenames['array stderr'])
+
+        try:
+            with open(self.debug_filenames['submit stdout'], 'w') as submit_stdout, open(self.debug_filenames['submit stderr'], 'w') as submit_stderr:
+                subprocess.check_call(self.submit_command, stdout=submit_stdout, stderr=submit_stderr)
+        except Exception as e:
+            error_text = 'array submit error ' + str(e) + ' for job: ' + self.name + '\n'
+            error_text += 'submit command: ' + ' '.join(self.submit_command) + '\n'
+            error_text += pypeliner.execqueue.utils.log_text(self.debug_filenames)
+            raise pypeliner.execqueue.base.SubmitError(error_text)
+
+        with open(self.debug_filenames['submit stdout'], 'r') as submit_stdout:
+            qsub_job_id = parse_job_id(submit_stdout.readline())
+
+        qsub_time = time.time()
+
+        for task_id, element in enumerate(self.elements, 1):
+            element.submitted(self.submit_command, element_job_id(qsub_job_id, task_id), task_id, qsub_time)
+
+    def create_submit_command(self, ctx, name, script_filename, qsub_bin, native_spec, stdout_filename, stderr_filename):
+        qsub = [qsub_bin]
+        qsub += [self.array_option, '1-{0}'.format(len(self.elements))]
+        qsub += native_spec.format(**ctx).split()
+        qsub += ['-N', pypeliner.execqueue.utils.qsub_format_name(name)]
+        qsub += ['-o', stdout_filename]
+        qsub += ['-e', stderr_filename]
+        qsub += [script_filename]
+        return qsub
+
+
 class AsyncQsubJobQueue(pypeliner.execqueue.base.JobQueue):
     """ Class for a queue of jobs run using subprocesses.  Maintains
     a list of running jobs, with the ability to wait for jobs and return
     completed jobs.  Requires override of the create method.
     """
+    array_option = '-t'
+
     def __init__(self, modules=None, **kwargs):
         self.modules = modules
         self.qenv = pypeliner.execqueue.qcmd.QEnv()
@@ -260,7 +363,27 @@ class AsyncQsubJobQueue(pypeliner.execqueue.base.JobQueue):
         else:
             self.jobs[name] = self.create(ctx, name, sent, temps_dir)
 
-    def wait(self):
+    def parse_array_job_id(self, submit_output):
+        """ Job id of an array from the output of qsub, such as
+        'Your job-array 123.1-10:1 ("name") has been submitted'.
+        """
+        return submit_output.rstrip().replace('Your job-array ', '').split(' ')[0].split('.')[0]
+
+    def array_element_job_id(self, qsub_job_id, task_id):
+        """ Job id of an element of an array, as listed by qstat.
+        """
+        return '{0}.{1}'.format(qsub_job_id, task_id)
+
+    def send_array(self, ctx, names, sents, temps_dirs):
+        if ctx.get('local', False) or len(names) == 1:
+            super(AsyncQsubJobQueue, self).send_array(ctx, names, sents, temps_dirs)
+            return
+        array = AsyncQsubJobArray(ctx, names, sents, temps_dirs, self.modules, self.qenv, self.native_spec,
+                                  self.qstat, self.parse_array_job_id, self.array_element_job_id, self.array_option)
+        for element in array.elements:
+            self.jobs[element.name] = element
+
+    def wait(self, immediate=False):
         while True:
             if not self.local_queue.empty:
                 name = self.local_queue.wait(immediate=True)
@@ -270,6 +393,8 @@ class AsyncQsubJobQueue(pypeliner.execqueue.base.JobQueue):
             for name, job in self.jobs.iteritems():
                 if job.finished:
                     return name
+            if immediate:
+                return None
             self.qstat.update()
 
     def receive(self, name):
@@ -289,16 +414,44 @@ class AsyncQsubJobQueue(pypeliner.execqueue.base.JobQueue):
 
 
 class PbsQstatJobStatus(pypeliner.execqueue.qcmd.QstatJobStatus):
-    """ Statuses of jobs on a pbs cluster """
-    def finished(self, job_id):
-        return 'c' in self.cached_job_status.get(job_id, 'c')
+    """ Statuses of jobs on a pbs pro cluster, including array elements """
+    qstat_options = ('-t',)
+
+    def finished(self, job_id, qsub_time):
+        """ Query whether job is finished, either no longer listed, or listed
+        as complete or, for array elements, expired.  Takes the same arguments
+        as :py:meth:`QstatJobStatus.finished`, as called by `AsyncQsubJob`.
+        """
+        if self.cached_job_status is None:
+            return False
+
+        if qsub_time >= self.qstat_time:
+            return False
+
+        status = self.cached_job_status.get(job_id, 'c')
+        return 'c' in status or 'x' in status
 
     def errors(self, job_id):
         return False
 
+    def parse_task_ids(self, row):
+        return []
+
 
 class PbsJobQueue(AsyncQsubJobQueue):
-    """ Queue of jobs running on a pbs cluster """
+    """ Queue of jobs running on a pbs pro cluster, submitting job arrays
+    using qsub -J
+    """
+    array_option = '-J'
+
     def __init__(self, modules=None, **kwargs):
         super(PbsJobQueue, self).__init__(modules, **kwargs)
         self.qstat = PbsQstatJobStatus(self.qenv)
+
+    def parse_array_job_id(self, submit_output):
+        """ Job id of an array from the output of qsub, such as '123[].server'.
+        """
+        return submit_output.strip().split(' ')[0]
+
+    def array_element_job_id(self, qsub_job_id, task_id):
+        return qsub_job_id.replace('[]', '[{0}]'.format(task_id))
@@ -1,5 +1,6 @@
 import os
 import errno
+import time
 
 import pypeliner.execqueue.base
 
@@ -7,8 +8,13 @@ import pypeliner.execqueue.base
 class SubProcessJobQueue(pypeliner.execqueue.base.JobQueue):
     """ Abstract class for a queue of jobs run using subprocesses.  Maintains
     a list of running jobs, with the ability to wait for jobs and return
-    completed jobs.  Requires override of the create method.
+    completed jobs.  Requires override of the create method.  Subprocesses
+    are polled at increasing intervals between `min_poll_interval` and
+    `max_poll_interval` seconds.
     """
+    min_poll_interval = 0.001
+    max_poll_interval = 0.1
+
     def __init__(self, modules=None, **kwargs):
         self.modules = modules
         self.jobs = dict()
@@ -29,26 +35,38 @@ class SubProcessJobQueue(pypeliner.execqueue.base.JobQueue):
         self.jobs[name] = submitted
         self.pid_names[submitted.process.pid] = name
 
+    def _poll(self):
+        """ Reap a finished subprocess of the queue, returning its process id
+        and exit status, or None if none have finished.  Only subprocesses of
+        the queue are waited for, so that subprocesses started by other
+        threads, such as those evaluating subworkflow functions, are not reaped
+        before their own wait.
+        """
+        for process_id in self.pid_names.keys():
+            try:
+                finished_id, returncode = os.waitpid(process_id, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if finished_id != 0:
+                return process_id, returncode
+        return None
+
     def wait(self, immediate=False):
+        sleep_time = self.min_poll_interval
         while True:
-            if immediate:
-                process_id, returncode = os.waitpid(-1, os.WNOHANG)
-                if process_id is None:
-                    return None
-            else:
-                try:
-                    process_id, returncode = os.wait()
-                except OSError as e:
-                    if e.errno == errno.EINTR:
-                        continue
-                    else:
-                        raise
-            try:
-                name = self.pid_names.pop(process_id)
-            except KeyError:
-                continue
-            self.pid_returncodes[name] = returncode
-            return name
+            finished = self._poll()
+            if finished is not None:
+                break
+            if immediate or len(self.pid_names) == 0:
+                return None
+            time.sleep(sleep_time)
+            sleep_time = min(sleep_time * 2, self.max_poll_interval)
+        process_id, returncode = finished
+        name = self.pid_names.pop(process_id)
+        self.pid_returncodes[name] = returncode
+        return name
 
     def receive(self, name):
         job = self.jobs.pop(name)
@@ -1,4 +1,5 @@
 import os
+import pipes
 
 
 def log_text(debug_filenames):
@@ -17,3 +18,34 @@ def log_text(debug_filenames):
 
 def qsub_format_name(name):
     return name.strip('/').rstrip('/').replace('/', '.').replace(':', '_')
+
+
+def write_array_script(script_filename, commands, stdout_filenames, stderr_filenames):
+    """ Write a script running the command of one element of a job array, chosen
+    by the 1-based task id set by sge, torque or pbs pro.
+    """
+    with open(script_filename, 'w') as script_file:
+        script_file.write('#!/bin/bash\n')
+        script_file.write('case ${SGE_TASK_ID:-${PBS_ARRAYID:-$PBS_ARRAY_INDEX}} in\n')
+        for task_id, (command, stdout_filename, stderr_filename) in enumerate(zip(commands, stdout_filenames, stderr_filenames), 1):
+            script_file.write('{0}) exec {1} > {2} 2> {3} ;;\n'.format(
+                task_id, ' '.join(pipes.quote(arg) for arg in command),
+                pipes.quote(stdout_filename), pipes.quote(stderr_filename)))
+        script_file.write('*) echo "unknown task id" >&2; exit 1 ;;\n')
+        script_file.write('esac\n')
+
+
+def parse_task_ids(task_ids):
+    """ Parse a list of task ids of a job array, such as '1-10:2,12'.
+    """
+    parsed = list()
+    for task_range in task_ids.split(','):
+        step = 1
+        if ':' in task_range:
+            task_range, step = task_range.split(':')
+        if '-' in task_range:
+            start, end = task_range.split('-')
+        else:
+            start = end = task_range
+        parsed.extend(xrange(int(start), int(end) + 1, int(step)))
+    return parsed
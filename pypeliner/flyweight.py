@@ -8,7 +8,8 @@ unpickled in the original process updating the state to the value set
 remotely.
 """
 
-import uuid
+import os
+import binascii
 
 
 class UnavailableError(Exception):
@@ -22,7 +23,7 @@ class FlyweightState(object):
     def __init__(self, state_container=None):
         if state_container is None:
             state_container = dict()
-        self.state_id = str(uuid.uuid4())
+        self.state_id = binascii.hexlify(os.urandom(16))
         self.instances[self.state_id] = state_container
     def __enter__(self):
         return self
@@ -48,6 +49,7 @@ class FlyweightState(object):
 class ReattachableFlyweight(object):
     """ Reattachable state object.
     """
+    __slots__ = ('state', 'key', 'saved')
     def __init__(self, state, key):
         self.state = state
         self.key = key
@@ -1,12 +1,16 @@
 import os
-import networkx
 import itertools
 import logging
 import collections
+import heapq
+import threading
+import multiprocessing.pool
 
 import pypeliner.helpers
+import pypeliner.dag
 import pypeliner.identifiers
 import pypeliner.workflow
+import pypeliner.instrument
 
 class IncompleteJobException(Exception):
     pass
@@ -41,17 +45,23 @@ class DependencyGraph:
     """ Graph of dependencies between jobs.
     """
 
-    def __init__(self):
+    def __init__(self, job_weight=None):
+        self.job_weight = job_weight
         self.completed = set()
         self.created = set()
         self.running = set()
         self.obsolete = set()
+        self.jobs = dict()
+        self.job_out_of_date = dict()
+        self.output_createtimes = dict()
 
+    @pypeliner.instrument.timed('graph.regenerate')
     def regenerate(self, jobs):
         """ Create the dependency graph from a set of jobs, and pipeline inputs
         and outputs, maintaining current state.
 
         """
+        previous_jobs = self.jobs
         self.jobs = jobs
         all_inputs = set((input.id for job in self.jobs.itervalues() for input in job.inputs))
         all_outputs = set((output.id for job in self.jobs.itervalues() for output in job.outputs))
@@ -60,7 +70,12 @@ class DependencyGraph:
 
         self.dependant_jobs = collections.defaultdict(set)
         self.creating_job = dict()
+        self.job_input_ids = dict()
+        self.job_output_ids = dict()
         for job in jobs.itervalues():
+            # Unique ids stored as tuples, which are smaller than sets
+            self.job_input_ids[job.id] = tuple(set((input.id for input in job.inputs)))
+            self.job_output_ids[job.id] = tuple(set((output.id for output in job.outputs)))
             for resource in job.inputs:
                 self.dependant_jobs[resource.id].add(job.id)
             for resource in job.outputs:
@@ -72,33 +87,8 @@ class DependencyGraph:
                 if resource.id not in self.creating_job and resource.is_temp:
                     raise AmbiguousInputException(resource.id)
 
-        # Create the graph
-        G = networkx.DiGraph()
-        for job in self.jobs.itervalues():
-            #only track job names, ignore the axes value.
-            #this will keep DAG smaller and speed up cycle testing
-            job_node = ('job', job.id[1])
-            if G.has_node(job_node):
-                continue
-            G.add_node(job_node, job=job)
-            for input in job.inputs:
-                resource_node = ('resource', input.id)
-                if resource_node not in G:
-                    G.add_node(resource_node, resource=input)
-                G.add_edge(resource_node, job_node)
-            for output in job.outputs:
-                resource_node = ('resource', output.id)
-                if resource_node not in G:
-                    G.add_node(resource_node, resource=output)
-                G.add_edge(job_node, resource_node)
-
-        # Check for cycles
-        try:
-            cycles = networkx.find_cycle(G)
-        except networkx.NetworkXNoCycle:
-            cycles = []
-        if len(cycles) > 0:
-            raise DependencyCycleException(cycles[0])
+        # Check for cycles between jobs
+        self._check_cycles()
 
         # Pre-compute traversals of the DAG
         self.jobs_forward = list(self.traverse_jobs_forward())
@@ -107,116 +97,301 @@ class DependencyGraph:
         # Assume pipeline inputs exist
         self.created.update(self.inputs)
 
+        self.job_order = dict()
+        for idx, job in enumerate(self.jobs_forward):
+            self.job_order[job.id] = idx
+
+        self._init_priorities()
+        self._init_ready_queue()
+        self._init_out_of_date(previous_jobs)
+
+        # Resources are no longer obsolete if required by new jobs
+        self.obsolete = set([resource for resource in self.obsolete
+            if self.pending_dependants.get(resource.id, 0) == 0])
+
+    def _check_cycles(self):
+        """ Check for cycles in a compact graph of jobs, with an edge from each
+        job to the jobs dependent on its outputs.
+        """
+        job_ids = list(self.jobs)
+        job_index = dict([(job_id, idx) for idx, job_id in enumerate(job_ids)])
+        dag = pypeliner.dag.CompactDAG()
+        for job_id in job_ids:
+            dependent_jobs = set()
+            for output_id in self.job_output_ids[job_id]:
+                for dependent_job_id in self.dependant_jobs.get(output_id, ()):
+                    dependent_jobs.add(job_index[dependent_job_id])
+            dag.add_node(dependent_jobs)
+        cycle = dag.find_cycle()
+        if cycle is not None:
+            raise DependencyCycleException(' -> '.join([self.jobs[job_ids[idx]].displayname for idx in cycle]))
+
+    def _init_priorities(self):
+        """ Calculate the longest weighted path downstream of each job, used to
+        prioritize ready jobs if a job weight function was provided.
+        """
+        self.job_priority = dict()
+        if self.job_weight is None:
+            return
+        for job in self.jobs_reverse:
+            downstream = 0
+            for output_id in self.job_output_ids[job.id]:
+                for dependent_job_id in self.dependant_jobs[output_id]:
+                    downstream = max(downstream, self.job_priority[dependent_job_id])
+            self.job_priority[job.id] = self.job_weight(job) + downstream
+
+    def _init_ready_queue(self):
+        """ Initialize unmet input counters and the queue of ready jobs.
+        """
+        self.unmet_inputs = dict()
+        self.pending_dependants = collections.defaultdict(int)
+        if self.job_weight is None:
+            self.ready = collections.deque()
+        else:
+            self.ready = list()
+        self.ready_no_inputs = collections.deque()
+        self.num_running_no_inputs = 0
+
+        for job in self.jobs_forward:
+            input_ids = self.job_input_ids[job.id]
+            self.unmet_inputs[job.id] = sum(1 for input_id in input_ids if input_id not in self.created)
+            if job.id in self.completed:
+                continue
+            for input_id in input_ids:
+                self.pending_dependants[input_id] += 1
+            if job.id in self.running:
+                if len(job.inputs) == 0:
+                    self.num_running_no_inputs += 1
+                continue
+            if len(job.inputs) == 0:
+                self.ready_no_inputs.append(job.id)
+            elif self.unmet_inputs[job.id] == 0:
+                self._push_ready(job.id)
+
     def traverse_jobs_forward(self):
         """ Traverse jobs in order of execution.
-        """
-        created_resources = set(self.inputs)
 
-        adjacent_jobs = set()
+        Jobs are yielded once all their inputs have been created by
+        previously yielded jobs or are pipeline inputs.
+        """
+        unmet_inputs = dict()
+        adjacent_jobs = collections.deque()
 
-        for job in self.jobs.itervalues():
-            if len(list(job.inputs)) == 0:
-                adjacent_jobs.add(job.id)
+        for job_id, input_ids in self.job_input_ids.iteritems():
+            unmet_inputs[job_id] = sum(1 for input_id in input_ids if input_id not in self.inputs)
+            if unmet_inputs[job_id] == 0:
+                adjacent_jobs.append(job_id)
 
-        for resource_id in created_resources:
-            for job_id in self.dependant_jobs[resource_id]:
-                adjacent_jobs.add(job_id)
-    
         while len(adjacent_jobs) > 0:
-            for job_id in list(adjacent_jobs):
-                job = self.jobs[job_id]
-                if all([i.id in created_resources for i in job.inputs]):
-                    yield job
-                    adjacent_jobs.remove(job_id)
-                    for o in job.outputs:
-                        created_resources.add(o.id)
-                        for dependent_job_id in self.dependant_jobs[o.id]:
-                            adjacent_jobs.add(dependent_job_id)
-                    break
+            job_id = adjacent_jobs.popleft()
+            yield self.jobs[job_id]
+            for output_id in self.job_output_ids[job_id]:
+                for dependent_job_id in self.dependant_jobs[output_id]:
+                    unmet_inputs[dependent_job_id] -= 1
+                    if unmet_inputs[dependent_job_id] == 0:
+                        adjacent_jobs.append(dependent_job_id)
 
     def traverse_jobs_reverse(self):
-        """ Traverse jobs in order of execution.
+        """ Traverse jobs in reverse order of execution.
+
+        Jobs are yielded once all jobs dependant on their outputs have
+        been yielded.
         """
-        visited_resources = set(self.outputs)
-        visited_jobs = set()
-
-        adjacent_resources = set()
-        adjacent_jobs = set()
-
-        for job in self.jobs.itervalues():
-            if len(list(job.outputs)) == 0:
-                adjacent_jobs.add(job.id)
-
-        for resource_id in visited_resources:
-            if resource_id in self.creating_job:
-                adjacent_jobs.add(self.creating_job[resource_id])
-
-        while len(adjacent_jobs) > 0 or len(adjacent_resources) > 0:
-            for job_id in list(adjacent_jobs):
-                job = self.jobs[job_id]
-                if all([o.id in visited_resources for o in job.outputs]):
-                    yield job
-                    adjacent_jobs.remove(job_id)
-                    visited_jobs.add(job_id)
-                    for i in job.inputs:
-                        adjacent_resources.add(i.id)
-                    break
-
-            for resource_id in list(adjacent_resources):
-                if all([job_id in visited_jobs for job_id in self.dependant_jobs[resource_id]]):
-                    adjacent_resources.remove(resource_id)
-                    visited_resources.add(resource_id)
-                    if resource_id in self.creating_job:
-                        adjacent_jobs.add(self.creating_job[resource_id])
+        unvisited_outputs = dict()
+        unvisited_dependants = dict()
+        adjacent_jobs = collections.deque()
+
+        for job_id, output_ids in self.job_output_ids.iteritems():
+            unvisited_outputs[job_id] = sum(1 for output_id in output_ids if output_id not in self.outputs)
+            if unvisited_outputs[job_id] == 0:
+                adjacent_jobs.append(job_id)
 
+        while len(adjacent_jobs) > 0:
+            job_id = adjacent_jobs.popleft()
+            yield self.jobs[job_id]
+            for input_id in self.job_input_ids[job_id]:
+                if input_id not in unvisited_dependants:
+                    unvisited_dependants[input_id] = len(self.dependant_jobs[input_id])
+                unvisited_dependants[input_id] -= 1
+                if unvisited_dependants[input_id] == 0 and input_id in self.creating_job:
+                    creating_job_id = self.creating_job[input_id]
+                    unvisited_outputs[creating_job_id] -= 1
+                    if unvisited_outputs[creating_job_id] == 0:
+                        adjacent_jobs.append(creating_job_id)
+
+    def _init_out_of_date(self, previous_jobs):
+        """ Initialize cached out of date and required status of incomplete jobs.
+
+        A job is stale if it is out of date or has an input created by a stale
+        job.  A job is required if it has a missing output that is either
+        created by a stale job, including itself, or required by a stale or
+        required job.
+        Cached out of date status is kept for job instances retained from the
+        previous graph.
+        """
+        self.job_out_of_date = dict([(job_id, out_of_date)
+            for job_id, out_of_date in self.job_out_of_date.iteritems()
+            if self.jobs.get(job_id) is previous_jobs.get(job_id)])
+        self.stale = set()
+        self.stale_inputs = collections.defaultdict(int)
+        self.required = set()
+        self.needed = set()
+        self.demand = collections.defaultdict(int)
+
+        incomplete = [job_id for job_id in self.jobs if job_id not in self.completed]
+        self._update_out_of_date(incomplete, incomplete)
+
+    def _is_out_of_date(self, job_id):
+        if job_id not in self.job_out_of_date:
+            self.job_out_of_date[job_id] = self.jobs[job_id].out_of_date()
+        return self.job_out_of_date[job_id]
+
+    def _is_stale(self, job_id):
+        return self.stale_inputs[job_id] > 0 or self._is_out_of_date(job_id)
+
+    def _is_required(self, job_id):
+        is_stale = job_id in self.stale
+        for output in self.jobs[job_id].outputs:
+            if (is_stale or self.demand[output.id] > 0) and not output.exists:
+                return True
+        return False
+
+    def _update_out_of_date(self, forward_job_ids, reverse_job_ids):
+        """ Update stale status downstream of forward_job_ids, then required
+        status upstream of reverse_job_ids and any jobs that changed staleness.
+        """
+        reverse_job_ids = set(reverse_job_ids)
+
+        forward = [(self.job_order[job_id], job_id) for job_id in set(forward_job_ids)
+            if job_id not in self.completed]
+        heapq.heapify(forward)
+        visited = set()
+        while len(forward) > 0:
+            _, job_id = heapq.heappop(forward)
+            if job_id in visited:
+                continue
+            visited.add(job_id)
+            is_stale = self._is_stale(job_id)
+            if is_stale == (job_id in self.stale):
+                continue
+            if is_stale:
+                self.stale.add(job_id)
+            else:
+                self.stale.remove(job_id)
+            reverse_job_ids.add(job_id)
+            for output_id in self.job_output_ids[job_id]:
+                for dependent_job_id in self.dependant_jobs[output_id]:
+                    if dependent_job_id in self.completed:
+                        continue
+                    self.stale_inputs[dependent_job_id] += (-1, 1)[is_stale]
+                    heapq.heappush(forward, (self.job_order[dependent_job_id], dependent_job_id))
+
+        reverse = [(-self.job_order[job_id], job_id) for job_id in reverse_job_ids
+            if job_id not in self.completed]
+        heapq.heapify(reverse)
+        visited = set()
+        while len(reverse) > 0:
+            _, job_id = heapq.heappop(reverse)
+            if job_id in visited:
+                continue
+            visited.add(job_id)
+            if self._is_required(job_id):
+                self.required.add(job_id)
+            else:
+                self.required.discard(job_id)
+            is_needed = job_id in self.stale or job_id in self.required
+            if is_needed == (job_id in self.needed):
+                continue
+            if is_needed:
+                self.needed.add(job_id)
+            else:
+                self.needed.remove(job_id)
+            for input_id in self.job_input_ids[job_id]:
+                self.demand[input_id] += (-1, 1)[is_needed]
+                creating_job_id = self.creating_job.get(input_id)
+                if creating_job_id is not None and creating_job_id not in self.completed:
+                    heapq.heappush(reverse, (-self.job_order[creating_job_id], creating_job_id))
+
+    def _get_output_createtimes(self, job):
+        return [output.createtime for output in job.output_resources]
+
+    def _push_ready(self, job_id):
+        if self.job_weight is None:
+            self.ready.append(job_id)
+        else:
+            heapq.heappush(self.ready, (-self.job_priority[job_id], self.job_order[job_id], job_id))
+
+    def _pop_ready(self):
+        while len(self.ready) > 0:
+            if self.job_weight is None:
+                job_id = self.ready.popleft()
+            else:
+                job_id = heapq.heappop(self.ready)[-1]
+            if job_id not in self.running and job_id not in self.completed:
+                return job_id
+        return None
+
+    def _pop_ready_no_inputs(self):
+        while len(self.ready_no_inputs) > 0:
+            job_id = self.ready_no_inputs.popleft()
+            if job_id not in self.running and job_id not in self.completed:
+                return job_id
+        return None
+
+    @pypeliner.instrument.timed('graph.pop_next_job')
     def pop_next_job(self):
         """ Return the id of the next job that is ready for execution.
         """
-        for job in self.jobs.itervalues():
-            if len(job.inputs) == 0 and job.id not in self.running and job.id not in self.completed:
-                self.running.add(job.id)
-                return job
-
-        for job_id in self.running:
-            if len(self.jobs[job_id].inputs) == 0:
-                raise NoJobs()
+        job_id = self._pop_ready_no_inputs()
+        if job_id is not None:
+            self.running.add(job_id)
+            self.num_running_no_inputs += 1
+            self.output_createtimes[job_id] = self._get_output_createtimes(self.jobs[job_id])
+            return self.jobs[job_id]
 
-        resource_out_of_date = set()
+        if self.num_running_no_inputs > 0:
+            raise NoJobs()
 
-        resource_required = set()
-        job_required = set()
+        job_id = self._pop_ready()
+        if job_id is None:
+            raise NoJobs()
 
-        for job in self.jobs_forward:
-            if job.id in self.completed:
+        job = self.jobs[job_id]
+        if job.id in self.required:
+            job.is_required_downstream = True
+        self.output_createtimes[job.id] = self._get_output_createtimes(job)
+        self.running.add(job.id)
+        return job
+
+    def get_upcoming_jobs(self, max_jobs):
+        """ Return up to max_jobs jobs that are ready, followed by jobs that
+        will be ready once the running jobs complete.
+        """
+        upcoming = list()
+        for entry in self.ready:
+            if len(upcoming) >= max_jobs:
+                return upcoming
+            job_id = (entry, entry[-1])[self.job_weight is not None]
+            if job_id not in self.running and job_id not in self.completed:
+                upcoming.append(self.jobs[job_id])
+
+        unmet_running = collections.defaultdict(int)
+        for job_id in self.running:
+            for output_id in self.job_output_ids[job_id]:
+                if output_id in self.created:
+                    continue
+                for dependent_job_id in self.dependant_jobs[output_id]:
+                    unmet_running[dependent_job_id] += 1
+
+        for job_id, num_unmet in unmet_running.iteritems():
+            if len(upcoming) >= max_jobs:
+                break
+            if job_id in self.running or job_id in self.completed:
                 continue
-            inputs_out_of_date = any([i.id in resource_out_of_date for i in job.inputs])
-            if job.out_of_date() or inputs_out_of_date:
-                for o in job.outputs:
-                    resource_out_of_date.add(o.id)
-                for i in job.inputs:
-                    resource_required.add(i.id)
+            if num_unmet == self.unmet_inputs[job_id]:
+                upcoming.append(self.jobs[job_id])
 
-        for job in self.jobs_reverse:
-            if job.id in self.completed:
-                continue
-            for o in job.outputs:
-                if o.id in resource_out_of_date and not o.exists:
-                    job_required.add(job.id)
-                if o.id in resource_required and not o.exists:
-                    job_required.add(job.id)
-            if job.id in job_required:
-                for i in job.inputs:
-                    resource_required.add(i.id)
-
-        for job in self.jobs_forward:
-            inputs_created = all([i.id in self.created for i in job.inputs])
-            if inputs_created and job.id not in self.running and job.id not in self.completed:
-                if job.id in job_required:
-                    job.is_required_downstream = True
-                self.running.add(job.id)
-                return self.jobs[job.id]
-
-        raise NoJobs()
+        return upcoming
 
     def notify_completed(self, job_id):
         """ A job was completed, advance current state.
@@ -224,13 +399,58 @@ class DependencyGraph:
         job = self.jobs[job_id]
         self.running.remove(job.id)
         self.completed.add(job.id)
+        if len(job.inputs) == 0:
+            self.num_running_no_inputs -= 1
+        for input_id in set((input.id for input in job.inputs)):
+            self.pending_dependants[input_id] -= 1
         for input in job.inputs:
-            if all([otherjob_id in self.completed for otherjob_id in self.dependant_jobs[input.id]]):
+            if self.pending_dependants[input.id] == 0:
                 self.obsolete.add(input)
         for output in job.outputs:
             if len(self.dependant_jobs[output.id]) == 0:
                 self.obsolete.add(output)
-        self.created.update([output.id for output in job.outputs])
+        for output in job.outputs:
+            if output.id in self.created:
+                continue
+            self.created.add(output.id)
+            for dependent_job_id in self.dependant_jobs[output.id]:
+                self.unmet_inputs[dependent_job_id] -= 1
+                if self.unmet_inputs[dependent_job_id] == 0:
+                    self._push_ready(dependent_job_id)
+        self._update_completed_out_of_date(job)
+
+    def _update_completed_out_of_date(self, job):
+        """ Update cached out of date status for the subgraph affected by
+        completion of a job.
+        """
+        forward_job_ids = set()
+        reverse_job_ids = set()
+
+        if job.id in self.stale:
+            self.stale.remove(job.id)
+            for output_id in self.job_output_ids[job.id]:
+                for dependent_job_id in self.dependant_jobs[output_id]:
+                    if dependent_job_id in self.completed:
+                        continue
+                    self.stale_inputs[dependent_job_id] -= 1
+                    forward_job_ids.add(dependent_job_id)
+
+        if job.id in self.needed:
+            self.needed.remove(job.id)
+            for input_id in self.job_input_ids[job.id]:
+                self.demand[input_id] -= 1
+                if input_id in self.creating_job:
+                    reverse_job_ids.add(self.creating_job[input_id])
+        self.required.discard(job.id)
+
+        # Dependant jobs are only affected if outputs were recreated or touched
+        if self._get_output_createtimes(job) != self.output_createtimes.pop(job.id, None):
+            for output_id in self.job_output_ids[job.id]:
+                for dependent_job_id in self.dependant_jobs[output_id]:
+                    self.job_out_of_date.pop(dependent_job_id, None)
+                    forward_job_ids.add(dependent_job_id)
+
+        self._update_out_of_date(forward_job_ids, reverse_job_ids)
 
     @property
     def finished(self):
@@ -242,119 +462,495 @@ class DependencyGraph:
         self.obsolete = set()
 
 
+class EvaluatedCallable(object):
+    """ Job callable evaluated in the background by a :py:class:`CallableEvaluator`.
+    """
+    def __init__(self, workflow, job, send):
+        self.workflow = workflow
+        self.job = job
+        self.send = send
+        self.result = None
+
+    def get(self):
+        """ Return the evaluated callable, raising any exception it raised.
+        """
+        if self.result is not None:
+            self.result.get()
+        return self.send
+
+
+class CallableEvaluator(object):
+    """ Evaluate subworkflow and setobj job callables in a pool of background
+    threads, so that slow user functions do not block scheduling of other jobs.
+    """
+    def __init__(self, num_threads=4):
+        self._pool = multiprocessing.pool.ThreadPool(num_threads)
+        self._finished = collections.deque()
+        self._finished_event = threading.Event()
+
+    def _evaluate(self, evaluated):
+        try:
+            evaluated.send()
+        finally:
+            self._finished.append(evaluated)
+            self._finished_event.set()
+
+    def submit(self, workflow, job, send):
+        evaluated = EvaluatedCallable(workflow, job, send)
+        evaluated.result = self._pool.apply_async(self._evaluate, (evaluated,))
+        return evaluated
+
+    def pop_finished(self):
+        """ Pop callables that finished evaluating.
+        """
+        while len(self._finished) > 0:
+            yield self._finished.popleft()
+
+    def notify(self):
+        """ Wake a thread waiting for callables, for instance when a job run in
+        another thread finishes.
+        """
+        self._finished_event.set()
+
+    def wait(self, timeout=None):
+        """ Wait for any callable submitted since the last wait to finish, or
+        for a notification, returning False if timed out.
+        """
+        notified = self._finished_event.wait(timeout)
+        self._finished_event.clear()
+        return notified
+
+    def close(self):
+        self._pool.close()
+
+
+fair_shares = ('none', 'round_robin', 'least_running')
+
+
 class WorkflowInstance(object):
-    def __init__(self, workflow_def, db_factory, runskip, node=pypeliner.identifiers.Node(), cleanup=False):
+    """ Instance of a workflow and its subworkflows.
+
+    Jobs are popped from subworkflows before jobs of this workflow, choosing
+    between subworkflows with ready jobs according to `fair_share`.  For 'none',
+    the first attached subworkflow with ready jobs is chosen.  For 'round_robin',
+    subworkflows take turns in proportion to the 'share' entry of the context of
+    their subworkflow job.  For 'least_running', the subworkflow with the fewest
+    running jobs relative to its share is chosen.
+
+    If `lazy` is set, instances of a job definition are only created once its
+    inputs could be ready.  Until then the job definition is deferred, and only
+    the names of its inputs and outputs are kept.  A job definition is deferred
+    while all instances of the job definitions creating its inputs or splitting
+    its axes are incomplete and will be run because they are out of date or
+    depend on out of date jobs, such that its own instances would also be run
+    and cannot require outputs of jobs that would otherwise be skipped.
+    """
+    def __init__(self, workflow_def, db_factory, runskip, node=pypeliner.identifiers.Node(), cleanup=False, job_weight=None,
+                 evaluator=None, fair_share='none', parent=None, lazy=False):
         self._logger = logging.getLogger('pypeliner.workflowgraph')
+        if fair_share not in fair_shares:
+            raise ValueError('unknown fair share ' + fair_share)
         self.workflow_def = workflow_def
         self.db_factory = db_factory
         self.runskip = runskip
         self.db = db_factory.create(workflow_def.path_info, node.subdir)
         self.node = node
-        self.graph = DependencyGraph()
-        self.subworkflows = list()
+        self.job_weight = job_weight
+        self.graph = DependencyGraph(job_weight=job_weight)
+        self.evaluator = evaluator
+        self.fair_share = fair_share
+        self.parent = parent
+        self.attach_idx = 0
+        self.share = 1
+        self.share_pass = 0.
+        self.num_running = 0
+        self.num_evaluating = 0
+        self.subworkflows = dict()
+        self.finished_subworkflows = list()
+        self.ready_subworkflows = dict()
+        self.ready_queue = list()
+        self.share_time = 0.
+        self.num_attached = 0
         self.cleanup = cleanup
-        self.regenerate()
+        self.lazy = lazy
+        self.deferred = set()
+        self.upstream = dict()
+        if lazy:
+            self._init_deferred()
+        self._regenerate_jobs()
+
+    def _init_deferred(self):
+        """ Find the job definitions upstream of each job definition, and defer
+        all job definitions with upstream job definitions.
+        """
 
-    def regenerate(self):
-        """ Regenerate dependency graph based on job instances.
+        dependencies = dict()
+        creating_jobs = collections.defaultdict(set)
+        splitting_jobs = collections.defaultdict(set)
+        for name, job_def in self.workflow_def.job_definitions.iteritems():
+            input_names, output_names, dependent_axes, split_axes = job_def.get_dependencies()
+            dependencies[name] = (input_names, dependent_axes)
+            for output_name in output_names:
+                creating_jobs[output_name].add(name)
+            for axis in split_axes:
+                splitting_jobs[axis].add(name)
+
+        for name, (input_names, dependent_axes) in dependencies.iteritems():
+            upstream = set()
+            for input_name in input_names:
+                upstream.update(creating_jobs.get(input_name, ()))
+            for axis in dependent_axes:
+                upstream.update(splitting_jobs.get(axis, ()))
+            upstream.discard(name)
+            self.upstream[name] = upstream
+            if len(upstream) > 0:
+                self.deferred.add(name)
+
+        # Job definitions in or downstream of a cycle are not deferred, so that
+        # the cycle is detected
+        resolved = set(self.upstream).difference(self.deferred)
+        while True:
+            newly_resolved = [name for name in self.deferred.difference(resolved)
+                if self.upstream[name].issubset(resolved)]
+            if len(newly_resolved) == 0:
+                break
+            resolved.update(newly_resolved)
+        self.deferred.intersection_update(resolved)
+
+    def _is_deferred_upstream(self, job):
+        """ Job is an instance of a job definition upstream of a deferred job
+        definition.
+        """
+
+        for name in self.deferred:
+            if job.job_def.name in self.upstream[name]:
+                return True
+        return False
+
+    def _materialize_jobs(self, job=None):
+        """ Create instances of deferred job definitions whose inputs could be
+        ready, either because of the given job, which is not stale, or because
+        of any job in the graph, and regenerate the dependency graph.  Deferred
+        job definitions upstream of those job definitions are also created.
+        """
+
+        if job is not None:
+            not_stale = set([job.job_def.name])
+            no_jobs = set()
+        else:
+            not_stale = set()
+            no_jobs = set(self.workflow_def.job_definitions.iterkeys()).difference(self.deferred)
+            for job_inst in self.graph.jobs.itervalues():
+                no_jobs.discard(job_inst.job_def.name)
+                if job_inst.id not in self.graph.stale:
+                    not_stale.add(job_inst.job_def.name)
+
+        materialized = set()
+        pending = [name for name in self.deferred
+            if len(self.upstream[name].intersection(not_stale)) > 0
+            or len(self.upstream[name].intersection(no_jobs)) > 0]
+        while len(pending) > 0:
+            name = pending.pop()
+            if name in materialized:
+                continue
+            materialized.add(name)
+            pending.extend(self.upstream[name].intersection(self.deferred))
+
+        if len(materialized) == 0:
+            return
+
+        self.deferred.difference_update(materialized)
+        jobs = dict(self.graph.jobs)
+        for name in materialized:
+            job_def = self.workflow_def.job_definitions[name]
+            for job_inst in job_def.create_job_instances(self, self.db):
+                jobs[job_inst.id] = job_inst
+        self.graph.regenerate(jobs)
+
+        # Job definitions downstream may now also be ready
+        if len(self.deferred) > 0:
+            self._materialize_jobs()
+
+    def _regenerate_jobs(self, axes=None):
+        """ Recreate job instances and regenerate the dependency graph.
+
+        If axes is given, only instances of job definitions that depend on those
+        axes are recreated, all other job instances are kept.
         """
 
         jobs = dict()
-        for job_inst in self.workflow_def._create_job_instances(self, self.db):
+        if axes is not None:
+            for job_inst in self.graph.jobs.itervalues():
+                if not job_inst.job_def.depends_on_axes(axes):
+                    jobs[job_inst.id] = job_inst
+
+        for job_inst in self.workflow_def._create_job_instances(self, self.db, axes=axes, skip=self.deferred):
             if job_inst.id in jobs:
                 raise ValueError('Duplicate job ' + job_inst.displayname)
             jobs[job_inst.id] = job_inst
 
         self.graph.regenerate(jobs)
 
-    def finalize_workflows(self):
-        """ Finalize any workflows that are finished.
+        if len(self.deferred) > 0:
+            self._materialize_jobs()
+
+    def regenerate(self):
+        """ Regenerate dependency graph based on job instances, recreating
+        only the instances that depend on axes with updated chunks.
         """
 
-        while len(self.subworkflows) > 0:
+        updated_axes = self.db.nodemgr.pop_updated_axes()
+        if len(updated_axes) > 0:
+            self._regenerate_jobs(axes=updated_axes)
 
-            # Pop the next finished workflow if it exists
+    def _update_counts(self, running=0, evaluating=0):
+        """ Update counts of running jobs and evaluating callables for this
+        workflow and its parents.
+        """
+
+        workflow = self
+        while workflow is not None:
+            workflow.num_running += running
+            workflow.num_evaluating += evaluating
+            workflow = workflow.parent
+
+    def _share_key(self, workflow):
+        if self.fair_share == 'round_robin':
+            return (workflow.share_pass, workflow.attach_idx)
+        elif self.fair_share == 'least_running':
+            return (float(workflow.num_running) / workflow.share, workflow.attach_idx)
+        return (workflow.attach_idx,)
+
+    def _update_ready(self, workflow):
+        """ Index a subworkflow that may have ready jobs or may be finished.
+        """
+
+        if workflow not in self.ready_subworkflows and self.fair_share == 'round_robin':
+            workflow.share_pass = max(workflow.share_pass, self.share_time)
+        key = self._share_key(workflow)
+        if self.ready_subworkflows.get(workflow) != key:
+            self.ready_subworkflows[workflow] = key
+            heapq.heappush(self.ready_queue, (key, workflow))
+
+    def _propagate_ready(self):
+        """ Update the ready index of each parent after a change to this workflow.
+        """
+
+        workflow = self
+        while workflow.parent is not None:
+            workflow.parent._update_ready(workflow)
+            workflow = workflow.parent
+
+    def _pop_subworkflow_job(self):
+        """ Pop the next job from the subworkflow chosen by the fair share
+        policy, or return None if no subworkflow has ready jobs.  Subworkflows
+        without ready jobs are removed from the index, and queued for finalizing
+        if they are finished.
+        """
+
+        while len(self.ready_queue) > 0:
+            key, workflow = heapq.heappop(self.ready_queue)
+            if self.ready_subworkflows.get(workflow) != key:
+                continue
             try:
-                job, received, workflow = pypeliner.helpers.pop_if(self.subworkflows, lambda (j, r, w): w.finished)
-            except IndexError:
-                return
+                job = workflow.pop_next_job()
+            except NoJobs:
+                self.ready_subworkflows.pop(workflow, None)
+                if workflow.num_running == 0 and workflow.num_evaluating == 0 and workflow.finished:
+                    self.finished_subworkflows.append(workflow)
+                continue
+            if self.fair_share == 'round_robin':
+                self.share_time = workflow.share_pass
+                workflow.share_pass += 1. / workflow.share
+            key = self._share_key(workflow)
+            self.ready_subworkflows[workflow] = key
+            heapq.heappush(self.ready_queue, (key, workflow))
+            return job
+        return None
+
+    def finalize_workflows(self):
+        """ Finalize any workflows that are finished.
+        """
 
-            # Finalize the workflow
+        while len(self.finished_subworkflows) > 0:
+            workflow = self.finished_subworkflows.pop(0)
+            job, received = self.subworkflows.pop(workflow)
             job.finalize(received)
             job.complete()
 
+    def _evaluate(self, job, send):
+        """ Evaluate a subworkflow or setobj callable, in the background if an
+        evaluator was given.
+        """
+
+        if self.evaluator is None:
+            send()
+            self._finalize_callable(job, send)
+        else:
+            self.evaluator.submit(self, job, send)
+            self._update_counts(evaluating=1)
+
+    def _finalize_evaluated(self):
+        """ Attach subworkflows and finalize setobj jobs for callables that
+        finished evaluating in the background.
+        """
+
+        for evaluated in self.evaluator.pop_finished():
+            evaluated.workflow._update_counts(evaluating=-1)
+            evaluated.workflow._finalize_callable(evaluated.job, evaluated.get())
+            evaluated.workflow._propagate_ready()
+
+    def _finalize_callable(self, job, received):
+        if isinstance(job, pypeliner.jobs.SubWorkflowInstance):
+            self._attach_subworkflow(job, received)
+        else:
+            self._finalize_setobj(job, received)
+
+    def _start_subworkflow(self, job):
+        is_run_required, explaination = self.runskip(job)
+        self._logger.info('subworkflow ' + job.displayname + ' run: ' + str(is_run_required) + ' explanation: ' + explaination,
+                          extra={"id": job.displayname, "type":"subworkflow", "explanation":explaination, 'task_name': job.id[1]})
+        if is_run_required:
+            send = job.create_callable()
+            self._logger.info('creating subworkflow ' + job.displayname,
+                              extra={"id": job.displayname, "type":"subworkflow", 'task_name': job.id[1]})
+            self._logger.info('subworkflow ' + job.displayname + ' -> ' + send.displaycommand,
+                              extra={"id": job.displayname, "type":"subworkflow", "cmd":send.displaycommand, 'task_name': job.id[1]})
+            self._evaluate(job, send)
+        else:
+            self._logger.info('subworkflow ' + job.displayname + ' skipped',
+                              extra={"id": job.displayname, "type":"subworkflow", "status":"skipped", 'task_name': job.id[1]})
+            job.complete()
+
+    def _attach_subworkflow(self, job, received):
+        if not received.finished:
+            self._logger.error('subworkflow ' + job.displayname + ' failed to complete\n' + received.log_text(),
+                               extra={"id": job.displayname, "type":"subworkflow", "status": "fail", 'task_name': job.id[1]})
+            raise IncompleteWorkflowException()
+        workflow_def = received.ret_value
+        if not isinstance(workflow_def, pypeliner.workflow.Workflow):
+            self._logger.error('subworkflow ' + job.displayname + ' did not return a workflow\n' + received.log_text(),
+                               extra={"id": job.displayname, "type":"subworkflow", "status": "error", 'task_name': job.id[1]})
+            raise IncompleteWorkflowException()
+        if workflow_def.empty:
+            self._logger.warning('subworkflow ' + job.displayname + ' returned an empty workflow\n' + received.log_text(),
+                                 extra={"id": job.displayname, "type":"subworkflow", "status":"empty", 'task_name': job.id[1]})
+        node = self.node + job.node + pypeliner.identifiers.Namespace(job.job_def.name)
+        workflow = self.__class__(workflow_def, self.db_factory, self.runskip, node=node, cleanup=self.cleanup,
+                                  job_weight=self.job_weight, evaluator=self.evaluator, fair_share=self.fair_share,
+                                  parent=self, lazy=self.lazy)
+        workflow.attach_idx = self.num_attached
+        workflow.share = job.ctx.get('share', 1)
+        self.num_attached += 1
+        self.subworkflows[workflow] = (job, received)
+        self._update_ready(workflow)
+
+    def _start_setobj(self, job):
+        self._logger.info('setting object ' + job.obj_displayname,
+                          extra={"id": job.obj_displayname, "type":"object", 'task_name': job.id[1]})
+        self._evaluate(job, job.create_callable())
+
+    def _finalize_setobj(self, job, received):
+        if not received.finished:
+            self._logger.error('setting object ' + job.obj_displayname + ' failed to complete\n' + received.log_text(),
+                          extra={"id": job.obj_displayname, "type":"object", "status":"fail", 'task_name': job.id[1]})
+            raise IncompleteJobException()
+        job.finalize(received)
+        job.complete()
+
+    def get_upcoming_jobs(self, max_jobs):
+        """ Return up to max_jobs jobs of this workflow and its subworkflows
+        that are ready or will be ready once the running jobs complete.
+        """
+
+        upcoming = list()
+        for job in self.graph.get_upcoming_jobs(max_jobs):
+            if not isinstance(job, (pypeliner.jobs.SubWorkflowInstance, pypeliner.jobs.SetObjInstance)):
+                upcoming.append(job)
+        for workflow in self.subworkflows:
+            if len(upcoming) >= max_jobs:
+                break
+            if workflow.num_running == 0 and workflow not in self.ready_subworkflows:
+                continue
+            upcoming.extend(workflow.get_upcoming_jobs(max_jobs - len(upcoming)))
+        return upcoming
+
+    @property
+    def is_evaluating(self):
+        """ Callables of this or a subworkflow are being evaluated.
+        """
+        return self.num_evaluating > 0
+
+    def _pop_graph_job(self):
+        """ Pop the next job from the graph of this workflow, starting any
+        subworkflow and setobj jobs, or return None if no jobs are ready.
+        """
+
+        while True:
+            try:
+                job = self.graph.pop_next_job()
+            except NoJobs:
+                return None
+
+            # Whether the job is required may depend on deferred jobs
+            if job.id not in self.graph.stale and self._is_deferred_upstream(job):
+                self._materialize_jobs(job)
+                if job.id in self.graph.required:
+                    job.is_required_downstream = True
+
+            if isinstance(job, pypeliner.jobs.SubWorkflowInstance):
+                self._start_subworkflow(job)
+            elif isinstance(job, pypeliner.jobs.SetObjInstance):
+                self._start_setobj(job)
+            else:
+                self.num_running += 1
+                return job
+
     def pop_next_job(self):
         """ Pop the next job from the top of this or a subgraph.
         """
         
         while True:
+            # Attach any subworkflows and objects that finished evaluating
+            if self.parent is None and self.evaluator is not None:
+                self._finalize_evaluated()
+
+            # Start subworkflows before popping from siblings if sharing
+            if self.fair_share != 'none':
+                job = self._pop_graph_job()
+                if job is not None:
+                    return job
+
             # Return any ready jobs from sub workflows
-            for job, received, workflow in self.subworkflows:
-                try:
-                    return workflow.pop_next_job()
-                except NoJobs:
-                    pass
+            job = self._pop_subworkflow_job()
+            if job is not None:
+                self.num_running += 1
+                return job
 
             # Finalize finished workflows
             self.finalize_workflows()
 
             # Remove from self graph if no subgraph jobs
-            job = self.graph.pop_next_job()
-
-            if isinstance(job, pypeliner.jobs.SubWorkflowInstance):
-                is_run_required, explaination = self.runskip(job)
-                self._logger.info('subworkflow ' + job.displayname + ' run: ' + str(is_run_required) + ' explanation: ' + explaination,
-                                  extra={"id": job.displayname, "type":"subworkflow", "explanation":explaination, 'task_name': job.id[1]})
-                if is_run_required:
-                    send = job.create_callable()
-                    self._logger.info('creating subworkflow ' + job.displayname,
-                                      extra={"id": job.displayname, "type":"subworkflow", 'task_name': job.id[1]})
-                    self._logger.info('subworkflow ' + job.displayname + ' -> ' + send.displaycommand,
-                                      extra={"id": job.displayname, "type":"subworkflow", "cmd":send.displaycommand, 'task_name': job.id[1]})
-                    send()
-                    received = send
-                    if not received.finished:
-                        self._logger.error('subworkflow ' + job.displayname + ' failed to complete\n' + received.log_text(),
-                                           extra={"id": job.displayname, "type":"subworkflow", "status": "fail", 'task_name': job.id[1]})
-                        raise IncompleteWorkflowException()
-                    workflow_def = received.ret_value
-                    if not isinstance(workflow_def, pypeliner.workflow.Workflow):
-                        self._logger.error('subworkflow ' + job.displayname + ' did not return a workflow\n' + received.log_text(),
-                                           extra={"id": job.displayname, "type":"subworkflow", "status": "error", 'task_name': job.id[1]})
-                        raise IncompleteWorkflowException()
-                    if workflow_def.empty:
-                        self._logger.warning('subworkflow ' + job.displayname + ' returned an empty workflow\n' + received.log_text(),
-                                             extra={"id": job.displayname, "type":"subworkflow", "status":"empty", 'task_name': job.id[1]})
-                    node = self.node + job.node + pypeliner.identifiers.Namespace(job.job_def.name)
-                    workflow = WorkflowInstance(workflow_def, self.db_factory, self.runskip, node=node, cleanup=self.cleanup)
-                    self.subworkflows.append((job, received, workflow))
-                else:
-                    self._logger.info('subworkflow ' + job.displayname + ' skipped',
-                                      extra={"id": job.displayname, "type":"subworkflow", "status":"skipped", 'task_name': job.id[1]})
-                    job.complete()
-                continue
-            elif isinstance(job, pypeliner.jobs.SetObjInstance):
-                self._logger.info('setting object ' + job.obj_displayname,
-                                  extra={"id": job.obj_displayname, "type":"object", 'task_name': job.id[1]})
-                send = job.create_callable()
-                send()
-                received = send
-                if not received.finished:
-                    self._logger.error('setting object ' + job.obj_displayname + ' failed to complete\n' + received.log_text(),
-                                  extra={"id": job.obj_displayname, "type":"object", "status":"fail", 'task_name': job.id[1]})
-                    raise IncompleteJobException()
-                job.finalize(received)
-                job.complete()
-            else:
+            job = self._pop_graph_job()
+            if job is not None:
                 return job
 
+            # Retry if subworkflows were attached
+            if len(self.ready_queue) == 0:
+                raise NoJobs()
+
     def notify_completed(self, job_id):
+        job = self.graph.jobs[job_id]
         self.graph.notify_completed(job_id)
+        if self._is_deferred_upstream(job):
+            self._materialize_jobs(job)
         if self.cleanup:
             self.graph.cleanup_obsolete()
+        if not isinstance(job, (pypeliner.jobs.SubWorkflowInstance, pypeliner.jobs.SetObjInstance)):
+            self._update_counts(running=-1)
+        self._propagate_ready()
 
     @property
     def finished(self):
-        return self.graph.finished
-
+        return len(self.deferred) == 0 and self.graph.finished
 
@@ -48,6 +48,25 @@ def md5_file(filename, block_size=8192):
              md5.update(chunk)
     return md5.digest()
 
+def md5_file_sampled(filename, num_blocks=16, block_size=1024*1024):
+    """ Digest of the size, the first and last blocks, and `num_blocks`
+    evenly spaced blocks of a file, or of the whole file if it is small.
+    """
+    size = os.path.getsize(filename)
+    md5 = hashlib.md5(str(size))
+    with open(filename, 'rb') as f:
+        if size <= (num_blocks + 2) * block_size:
+            for chunk in iter(lambda: f.read(block_size), b''):
+                md5.update(chunk)
+            return md5.digest()
+        offsets = [0]
+        offsets += [(size - block_size) * (idx + 1) // (num_blocks + 1) for idx in xrange(num_blocks)]
+        offsets += [size - block_size]
+        for offset in offsets:
+            f.seek(offset)
+            md5.update(f.read(block_size))
+    return md5.digest()
+
 def overwrite_if_different(new_filename, existing_filename):
     do_copy = True
     try:
@@ -81,6 +100,13 @@ def symlink(source, link_name):
             raise
     os.symlink(source, link_name)
 
+def linkorcopy(source, destination):
+    saferemove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
 def touch(filename, times=None):
     with open(filename, 'a'):
         os.utime(filename, times)
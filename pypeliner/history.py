@@ -0,0 +1,93 @@
+"""
+Persistent history of job runs
+
+Records measurements of every job attempt in an sqlite database in the
+pipeline directory, indexed by task name and axis node, so that they can
+inform scheduling and retry decisions in subsequent runs and be queried
+for reporting.
+
+"""
+
+import sqlite3
+import time
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    task_name TEXT NOT NULL,
+    node TEXT NOT NULL,
+    job_name TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    duration REAL,
+    memory REAL,
+    queue_wait REAL,
+    hostname TEXT,
+    submit_time REAL,
+    finish_time REAL
+);
+CREATE INDEX IF NOT EXISTS job_runs_task_name ON job_runs (task_name, status);
+CREATE INDEX IF NOT EXISTS job_runs_node ON job_runs (task_name, node);
+"""
+
+
+class RunHistory(object):
+    """ Metrics of job attempts recorded per task name and axis node. """
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(_schema)
+    def close(self):
+        self.connection.close()
+    def record(self, task_name, node, job_name, attempt, status, duration=None,
+               memory=None, queue_wait=None, hostname=None, submit_time=None):
+        """ Record the metrics of a single job attempt.
+
+        :param task_name: name of the job definition
+        :param node: display name of the axis node of the job, including the
+                     namespace of any sub workflow
+        :param job_name: display name of the job
+        :param attempt: index of the attempt, 0 for the first
+        :param status: one of 'success', 'fail', or 'error' if the job could
+                       not be received from the exec queue
+        :param duration: run time of the job in seconds
+        :param memory: peak memory of the job in GB
+        :param queue_wait: seconds between submission and start of the job
+        :param hostname: host on which the job ran
+        :param submit_time: time the job was submitted
+
+        """
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO job_runs (task_name, node, job_name, attempt, status, duration, memory, '
+                'queue_wait, hostname, submit_time, finish_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (task_name, node, job_name, attempt, status, duration, memory,
+                 queue_wait, hostname, submit_time, time.time()))
+    def query(self, task_name=None, node=None, status=None):
+        """ Recorded attempts as rows accessible by column name, optionally
+        restricted to a task name, axis node or status.
+        """
+        conditions = []
+        values = []
+        for column, value in (('task_name', task_name), ('node', node), ('status', status)):
+            if value is not None:
+                conditions.append(column + ' = ?')
+                values.append(value)
+        statement = 'SELECT * FROM job_runs'
+        if len(conditions) > 0:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        return self.connection.execute(statement, values).fetchall()
+    def get_duration(self, task_name):
+        """ Mean duration of successful runs of a task, None if never recorded. """
+        row = self.connection.execute(
+            'SELECT AVG(duration) FROM job_runs WHERE task_name = ? AND status = ?',
+            (task_name, 'success')).fetchone()
+        return row[0]
+    def get_max_memory(self, task_name):
+        """ Peak memory of successful runs of a task, None if never recorded. """
+        row = self.connection.execute(
+            'SELECT MAX(memory) FROM job_runs WHERE task_name = ? AND status = ?',
+            (task_name, 'success')).fetchone()
+        return row[0]
@@ -4,6 +4,7 @@ import os
 AxisInstanceBase = collections.namedtuple('AxisInstanceBase', ['axis', 'chunk'])
 
 class AxisInstance(AxisInstanceBase):
+    __slots__ = ()
     def __new__ (cls, axis, chunk):
         assert isinstance(axis, str)
         return super(AxisInstance, cls).__new__(cls, axis, chunk)
@@ -18,6 +19,7 @@ class AxisInstance(AxisInstanceBase):
         return self.chunk is None
 
 class Namespace(str):
+    __slots__ = ()
     @property
     def subdir(self):
         return self
@@ -29,6 +31,7 @@ class Namespace(str):
         return False
 
 class Node(tuple):
+    __slots__ = ()
     def __add__(self, a):
         if isinstance(a, (AxisInstance, Namespace)):
             return Node(self + Node([a]))
@@ -0,0 +1,96 @@
+"""
+Instrumentation of the scheduler process
+
+Cumulative timers and counters for the hot paths of the scheduler process,
+kept in the module level :py:data:`stats` and dumped to a json file in the
+logs directory by the scheduler.  Timers record the number of calls, total
+and maximum time of each timed function or block, and are cheap enough to
+be left enabled.  Timers and counters are updated under a lock, as jobs may
+be timed and counted from evaluator and in process worker threads as well as
+the scheduler thread.  Timed functions may be nested, in which case the time of
+the inner function is included in the time of the outer function.
+
+"""
+
+import os
+import json
+import time
+import functools
+import threading
+import collections
+
+
+class Timer(object):
+    """ Context manager adding the time spent in a block to a timer. """
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+    def __enter__(self):
+        self.start = time.time()
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.name, time.time() - self.start)
+
+
+class Stats(object):
+    """ Cumulative timers and counters, by name. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    def reset(self):
+        with self.lock:
+            self.start_time = time.time()
+            self.calls = collections.defaultdict(int)
+            self.totals = collections.defaultdict(float)
+            self.maxima = collections.defaultdict(float)
+            self.counters = collections.defaultdict(int)
+    def add_time(self, name, duration):
+        with self.lock:
+            self.calls[name] += 1
+            self.totals[name] += duration
+            if duration > self.maxima[name]:
+                self.maxima[name] = duration
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+    def timer(self, name):
+        return Timer(self, name)
+    def as_dict(self):
+        with self.lock:
+            timers = dict()
+            for name in self.calls:
+                timers[name] = {
+                    'calls': self.calls[name],
+                    'total': self.totals[name],
+                    'max': self.maxima[name],
+                }
+            return {
+                'start_time': self.start_time,
+                'elapsed': time.time() - self.start_time,
+                'timers': timers,
+                'counters': dict(self.counters),
+            }
+    def dump(self, filename):
+        """ Write timers and counters to a json file, replacing it atomically.
+        """
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+        os.rename(filename + '.tmp', filename)
+
+
+stats = Stats()
+
+
+def timed(name):
+    """ Decorator adding the time spent in a function to the named timer of
+    :py:data:`stats`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add_time(name, time.time() - start)
+        return wrapper
+    return decorator
@@ -1,4 +1,5 @@
 import copy
+import math
 import os
 import sys
 import itertools
@@ -7,6 +8,8 @@ import traceback
 import socket
 import datetime
 import signal
+import threading
+import contextlib
 
 
 import pypeliner.helpers
@@ -22,6 +25,7 @@ import resource
 
 class CallSet(object):
     """ Set of positional and keyword arguments, and a return value """
+    __slots__ = ('ret', 'args', 'kwargs')
     def __init__(self, ret=None, args=None, kwargs=None):
         if ret is not None and not isinstance(ret, pypeliner.managed.Managed):
             raise ValueError('ret must be a managed object')
@@ -50,6 +54,38 @@ class JobDefinition(object):
     def create_job_instances(self, workflow, db):
         for node in db.nodemgr.retrieve_nodes(self.axes):
             yield JobInstance(self, workflow, db, node)
+    def depends_on_axes(self, axes):
+        """ Instances of this job depend on the chunks of any of the given axes """
+        dependent_axes = set(self.axes)
+        def _add_axes(mg):
+            if not isinstance(mg, pypeliner.managed.Managed):
+                return None, False
+            dependent_axes.update(getattr(mg, 'axes', ()))
+            return None, True
+        pypeliner.deep.deeptransform(self.argset, _add_axes)
+        return len(dependent_axes.intersection(axes)) > 0
+    def get_dependencies(self):
+        """ Names of managed inputs and outputs of this job, axes on which
+        instances of this job depend, and axes split by this job.
+        """
+        input_names = set()
+        output_names = set()
+        dependent_axes = set(self.axes)
+        split_axes = set()
+        def _add_managed(mg):
+            if not isinstance(mg, pypeliner.managed.Managed):
+                return None, False
+            axes = getattr(mg, 'axes', ())
+            if mg.is_output:
+                output_names.add(mg.name)
+                split_axes.update(set(axes).difference(self.axes))
+            else:
+                input_names.add(getattr(mg, 'name', None))
+                dependent_axes.update(axes)
+            return None, True
+        pypeliner.deep.deeptransform(self.argset, _add_managed)
+        input_names.discard(None)
+        return input_names, output_names, dependent_axes, split_axes
 
 def _pretty_date(ts):
     if ts is None:
@@ -57,25 +93,34 @@ def _pretty_date(ts):
     return datetime.datetime.fromtimestamp(ts).strftime('%Y/%m/%d-%H:%M:%S')
 
 class JobInstance(object):
-    """ Represents a job including function and arguments """
+    """ Represents a job including function and arguments
+
+    Job instances are created for every chunk of a job, and use slots and
+    tuples, share the context of the job definition until a retry modifies
+    it, and only store the list of arguments, to limit memory use for
+    workflows with many chunks.
+    """
+    __slots__ = ('job_def', 'workflow', 'db', 'node', 'id', 'arglist', 'retry_idx',
+                 'is_required_downstream', 'inputs', 'outputs', '_ctx')
     direct_write = False
     def __init__(self, job_def, workflow, db, node):
         self.job_def = job_def
         self.workflow = workflow
         self.db = db
         self.node = node
+        self.id = (node, job_def.name)
         self.arglist = list()
         try:
-            self.argset = pypeliner.deep.deeptransform(
+            pypeliner.deep.deeptransform(
                 self.job_def.argset,
                 self._create_arg)
         except pypeliner.managed.JobArgMismatchException as e:
             e.job_name = self.displayname
             raise
-        self.logs_dir = os.path.join(db.logs_dir, self.node.subdir, self.job_def.name)
+        self.arglist = tuple(self.arglist)
         pypeliner.helpers.makedirs(self.logs_dir)
         self.retry_idx = 0
-        self.ctx = job_def.ctx.copy()
+        self._ctx = None
         self.is_required_downstream = False
         self.init_inputs_outputs()
 
@@ -85,15 +130,40 @@ class JobInstance(object):
         arg = mg.create_arg(self)
         self.arglist.append(arg)
         return arg, True
+    @property
+    def argset(self):
+        """ Arguments of the job definition with managed objects replaced by
+        the arguments created for this job, in the order they were created.
+        """
+        arglist = iter(self.arglist)
+        def _next_arg(mg):
+            if not isinstance(mg, pypeliner.managed.Managed):
+                return None, False
+            return next(arglist), True
+        return pypeliner.deep.deeptransform(self.job_def.argset, _next_arg)
+    @property
+    def ctx(self):
+        if self._ctx is None:
+            return self.job_def.ctx
+        return self._ctx
+    def _modify_ctx(self):
+        """ Copy the context of the job definition before modifying it.
+        """
+        if self._ctx is None:
+            self._ctx = self.job_def.ctx.copy()
+        return self._ctx
+    @property
+    def logs_dir(self):
+        return os.path.join(self.db.logs_dir, self.node.subdir, self.job_def.name)
     def init_inputs_outputs(self):
-        self.inputs = list()
-        self.outputs = list()
+        inputs = list()
+        outputs = list()
         merge_inputs = list()
         split_outputs = list()
         for arg in self.arglist:
             if isinstance(arg, pypeliner.arguments.Arg):
-                self.inputs.extend(arg.get_inputs())
-                self.outputs.extend(arg.get_outputs())
+                inputs.extend(arg.get_inputs())
+                outputs.extend(arg.get_outputs())
                 merge_inputs.extend(arg.get_merge_inputs())
                 split_outputs.extend(arg.get_split_outputs())
         # A dependency that is both a merge input and split output
@@ -101,13 +171,12 @@ class JobInstance(object):
         split_output_ids = set([a.id for a in split_outputs])
         for input_ in merge_inputs:
             if input_.id not in split_output_ids:
-                self.inputs.append(input_)
-        self.outputs.extend(split_outputs)
+                inputs.append(input_)
+        outputs.extend(split_outputs)
         for node_input in self.db.nodemgr.get_node_inputs(self.node):
-            self.inputs.append(node_input)
-    @property
-    def id(self):
-        return (self.node, self.job_def.name)
+            inputs.append(node_input)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
     @property
     def displayname(self):
         name = '/' + self.job_def.name
@@ -211,14 +280,41 @@ class JobInstance(object):
             return False
         self.retry_idx += 1
         updated = False
-        for key, value in self.ctx.iteritems():
+        ctx = self._modify_ctx()
+        for key, value in ctx.iteritems():
             if key.endswith('_retry_factor'):
-                self.ctx[key[:-len('_retry_factor')]] *= value
+                ctx[key[:-len('_retry_factor')]] *= value
                 updated = True
             elif key.endswith('_retry_increment'):
-                self.ctx[key[:-len('_retry_increment')]] += value
+                ctx[key[:-len('_retry_increment')]] += value
                 updated = True
+        predicted_mem = self.predict_mem()
+        if predicted_mem is not None and predicted_mem > ctx.get('mem', 0):
+            ctx['mem'] = predicted_mem
+            updated = True
         return updated
+    def predict_mem(self):
+        """ Predict the memory request from the peak memory recorded for
+        successful runs of the same task multiplied by the mem_history_factor
+        context entry, and no less than the mem_history_min context entry if
+        set.  None if the mem_history_factor is not set or no peak memory was
+        recorded.
+        """
+        factor = self.ctx.get('mem_history_factor')
+        if factor is None:
+            return None
+        peak_mem = self.db.run_history.get_max_memory(self.job_def.name)
+        if peak_mem is None:
+            return None
+        return max(int(math.ceil(peak_mem * factor)), self.ctx.get('mem_history_min', 0))
+    def update_mem(self):
+        """ Set the memory request from the predicted memory, if available.
+        The prediction replaces the memory request of the context, and may be
+        lower than it.
+        """
+        predicted_mem = self.predict_mem()
+        if predicted_mem is not None:
+            self._modify_ctx()['mem'] = predicted_mem
 
 class JobTimer(object):
     """ Timer using a context manager """
@@ -230,6 +326,9 @@ class JobTimer(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self._finish = time.time()
     @property
+    def start(self):
+        return self._start
+    @property
     def duration(self):
         if self._finish is None or self._start is None:
             return None
@@ -275,7 +374,7 @@ class JobTimeOut(object):
         raise TimeOutError("Execution time exceeded the specified timeout of {}.".format(self._timeout_string))
 
     def __enter__(self):
-        if self._timeout:
+        if self._timeout and _is_main_thread():
             signal.signal(signal.SIGALRM, self.handler)
             signal.alarm(self._timeout)
 
@@ -302,6 +401,62 @@ class JobMemoryTracker(object):
         return self._finish
 
 
+def _is_main_thread():
+    return isinstance(threading.current_thread(), threading._MainThread)
+
+
+class ThreadOutput(object):
+    """ Output stream writing to a stream set for the current thread, or to
+    the wrapped stream for threads without one.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    def __getattr__(self, attr):
+        return getattr(getattr(self.local, 'stream', None) or self.stream, attr)
+
+
+_thread_output_lock = threading.Lock()
+_thread_outputs = None
+_thread_output_count = 0
+
+
+@contextlib.contextmanager
+def redirect_output(stdout_file, stderr_file):
+    """ Redirect stdout and stderr to the given files.  Outside the main thread
+    only output from the calling thread is redirected, and the original streams
+    are restored once no thread is redirecting output.
+    """
+    global _thread_outputs, _thread_output_count
+    if _is_main_thread():
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout_file, stderr_file
+        try:
+            yield
+        finally:
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+        return
+    with _thread_output_lock:
+        if _thread_output_count == 0:
+            _thread_outputs = (ThreadOutput(sys.stdout), ThreadOutput(sys.stderr))
+            sys.stdout, sys.stderr = _thread_outputs
+        _thread_output_count += 1
+        stdout, stderr = _thread_outputs
+    stdout.local.stream, stderr.local.stream = stdout_file, stderr_file
+    try:
+        yield
+    finally:
+        stdout.local.stream, stderr.local.stream = None, None
+        with _thread_output_lock:
+            _thread_output_count -= 1
+            if _thread_output_count == 0:
+                if sys.stdout is stdout:
+                    sys.stdout = stdout.stream
+                if sys.stderr is stderr:
+                    sys.stderr = stderr.stream
+                _thread_outputs = None
+
+
 def resolve_arg(arg):
     if not isinstance(arg, pypeliner.arguments.Arg):
         return None, False
@@ -325,8 +480,14 @@ class JobCallable(object):
         self.job_mem_tracker = JobMemoryTracker()
         self.job_time_out = JobTimeOut(timeout)
         self.hostname = None
+        self.staged = False
+        self.stage_error = None
+        self.batched = False
         self.callset = pypeliner.deep.deeptransform(self.argset, resolve_arg)
     @property
+    def start_time(self):
+        return self.job_timer.start
+    @property
     def duration(self):
         return self.job_timer.duration
     @property
@@ -355,28 +516,58 @@ class JobCallable(object):
     def push(self):
         for arg in self.arglist:
             arg.push()
-    def __call__(self):
+    def stage_in(self):
+        """ Allocate and pull arguments and logs, for a callable called in
+        another thread of this process.  Storage is not thread safe, so the
+        callable then only calls the function, and arguments and logs are
+        pushed by :py:meth:`stage_out` from the thread calling `stage_in`.
+        """
         self.stdout_storage.allocate()
         self.stderr_storage.allocate()
-        with open(self.stdout_storage.filename, 'w', 0) as stdout_file, open(self.stderr_storage.filename, 'w', 0) as stderr_file:
-            old_stdout, old_stderr = sys.stdout, sys.stderr
-            sys.stdout, sys.stderr = stdout_file, stderr_file
+        try:
+            self.allocate()
+            self.pull()
+        except:
+            self.stage_error = traceback.format_exc()
+        self.staged = True
+    def stage_out(self):
+        """ Push arguments and logs of a callable staged by :py:meth:`stage_in`.
+        """
+        if self.finished:
             try:
-                self.hostname = socket.gethostname()
-                with self.job_timer, self.job_mem_tracker, self.job_time_out:
-                    self.allocate()
-                    self.pull()
-                    self.ret_value = self.func(*self.callset.args, **self.callset.kwargs)
-                    if self.callset.ret is not None:
-                        self.callset.ret.value = self.ret_value
-                    self.push()
-                self.finished = True
+                self.push()
             except:
-                sys.stderr.write(traceback.format_exc())
-            finally:
-                sys.stdout, sys.stderr = old_stdout, old_stderr
+                self.finished = False
+                with open(self.stderr_storage.filename, 'a', 0) as stderr_file:
+                    stderr_file.write(traceback.format_exc())
         self.stdout_storage.push()
         self.stderr_storage.push()
+    def __call__(self):
+        if not self.staged:
+            self.stdout_storage.allocate()
+            self.stderr_storage.allocate()
+        with open(self.stdout_storage.filename, 'w', 0) as stdout_file, open(self.stderr_storage.filename, 'w', 0) as stderr_file:
+            with redirect_output(stdout_file, stderr_file):
+                try:
+                    if self.stage_error is not None:
+                        sys.stderr.write(self.stage_error)
+                        return
+                    self.hostname = socket.gethostname()
+                    with self.job_timer, self.job_mem_tracker, self.job_time_out:
+                        if not self.staged:
+                            self.allocate()
+                            self.pull()
+                        self.ret_value = self.func(*self.callset.args, **self.callset.kwargs)
+                        if self.callset.ret is not None:
+                            self.callset.ret.value = self.ret_value
+                        if not self.staged:
+                            self.push()
+                    self.finished = True
+                except:
+                    sys.stderr.write(traceback.format_exc())
+        if not self.staged:
+            self.stdout_storage.push()
+            self.stderr_storage.push()
     def collect_logs(self):
         self.stdout_storage.allocate()
         self.stderr_storage.allocate()
@@ -386,6 +577,43 @@ class JobCallable(object):
         for arg in self.arglist:
             arg.updatedb(db)
 
+class JobBatch(object):
+    """ Callables of several jobs given to the exec queue as a single job, and
+    called one after another, or in a pool of `threads` threads.  Timeouts are
+    only enforced for callables called in the main thread, and the memory
+    used by each callable is not known.
+    """
+    def __init__(self, callables, threads=1):
+        self.callables = callables
+        self.threads = threads
+        for job_callable in self.callables:
+            job_callable.batched = True
+    def stage_in(self):
+        for job_callable in self.callables:
+            job_callable.stage_in()
+    def stage_out(self):
+        for job_callable in self.callables:
+            job_callable.stage_out()
+    def __call__(self):
+        if self.threads <= 1:
+            for job_callable in self.callables:
+                job_callable()
+            return
+        remaining = iter(self.callables)
+        remaining_lock = threading.Lock()
+        def _call_remaining():
+            while True:
+                with remaining_lock:
+                    job_callable = next(remaining, None)
+                if job_callable is None:
+                    return
+                job_callable()
+        threads = [threading.Thread(target=_call_remaining) for _ in xrange(min(self.threads, len(self.callables)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
 def _setobj_helper(value):
     return value
 
@@ -400,6 +628,7 @@ class SetObjDefinition(JobDefinition):
 
 class SetObjInstance(JobInstance):
     """ Represents a sub workflow. """
+    __slots__ = ('obj_displayname',)
     def __init__(self, job_def, workflow, db, node):
         super(SetObjInstance, self).__init__(job_def, workflow, db, node)
         obj_node = pypeliner.identifiers.create_undefined_node(job_def.argset.ret.axes)
@@ -407,10 +636,12 @@ class SetObjInstance(JobInstance):
         self.obj_displayname = obj_res.build_displayname(workflow.node)
 
 class SubWorkflowDefinition(JobDefinition):
-    def __init__(self, name, axes, func, argset):
+    def __init__(self, name, axes, ctx, func, argset):
         self.name = name
         self.axes = axes
         self.ctx = {}
+        if ctx is not None:
+            self.ctx.update(ctx)
         self.func = func
         self.argset = argset
     def create_job_instances(self, workflow, db):
@@ -419,6 +650,7 @@ class SubWorkflowDefinition(JobDefinition):
 
 class SubWorkflowInstance(JobInstance):
     """ Represents a sub workflow. """
+    __slots__ = ()
     direct_write = True
     def __init__(self, job_def, workflow, db, node):
         super(SubWorkflowInstance, self).__init__(job_def, workflow, db, node)
@@ -41,6 +41,7 @@ class JobArgMismatchException(Exception):
 
 class Managed(object):
     """ Interface class used to represent a managed data """
+    is_output = False
     def __init__(self, name, *axes, **kwargs):
         if name is not None and type(name) != str:
             raise ValueError('name of argument must be string')
@@ -118,6 +119,11 @@ class InputFile(Managed):
     :param name: The name of the input file.  Each axis should appear at least
                  once as a named field in the filename.
     :param axes: The axes for the input file.
+    :param sample_blocks: If given, digests of the file's contents, used by the
+                          checksums mode of the storage and the job cache, are
+                          calculated from the file's size and that many evenly
+                          spaced blocks in addition to the first and last blocks,
+                          instead of the entire file.
 
     For a merge input, `InputFile` will resolve to a dictionary of filenames
     as specified above, with chunks of the merge axis as keys.
@@ -149,6 +155,7 @@ class OutputFile(Managed):
     """
     normal = pypeliner.arguments.OutputFileArg
     splitmerge = pypeliner.arguments.SplitFileArg
+    is_output = True
 
 class File(Managed):
     """ Interface class used to represent a user specified managed file
@@ -228,6 +235,7 @@ class TempOutputObj(Managed):
     """
     normal = pypeliner.arguments.TempOutputObjArg
     splitmerge = pypeliner.arguments.TempSplitObjArg
+    is_output = True
 
 class TempInputObjExtract(Managed):
     """ Interface class used to represent a property of a managed
@@ -283,6 +291,7 @@ class TempOutputFile(Managed):
     """
     normal = pypeliner.arguments.TempOutputFileArg
     splitmerge = pypeliner.arguments.TempSplitFileArg
+    is_output = True
 
 class TempFile(Managed):
     """ Interface class used to represent a managed temporary file
@@ -343,6 +352,7 @@ class OutputChunks(Managed):
     """
     normal = None
     splitmerge = pypeliner.arguments.OutputChunksArg
+    is_output = True
     def __init__(self, *axes, **kwargs):
         Managed.__init__(self, 'chunks', *axes, **kwargs)
 
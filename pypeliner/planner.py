@@ -0,0 +1,260 @@
+"""
+Dry run planning of workflows
+
+Plans a workflow without running any jobs, reporting which jobs would be run
+or skipped and why, with durations estimated from the run history of
+previous runs.
+
+The plan is made in a single pass over the workflow, popping jobs from a
+:py:class:`pypeliner.graph.WorkflowInstance` as they would be popped during a
+run, asking the runskip whether each job would be run, and completing each
+job without running it.  Jobs that would be run are assumed to recreate
+their outputs, so jobs using those outputs are planned to be run if the
+runskip checks timestamps.
+
+Setobj values are evaluated and compared to the objects and chunks set by a
+previous run, without setting them, so that planning does not modify the
+pipeline directory.  Subworkflows that would be run are expanded by calling
+their function, and may not be expandable if their inputs have yet to be
+created.  Jobs that define chunks of an axis are planned, but jobs on that
+axis are planned only for the chunks defined in a previous run.
+
+"""
+
+import datetime
+import json
+
+import pypeliner.arguments
+import pypeliner.graph
+import pypeliner.resources
+import pypeliner.workflow
+
+
+def _resource_key(resource):
+    """ Key identifying a resource as both input and output, across workflows.
+    """
+    if isinstance(resource, pypeliner.resources.TempObjResource):
+        # Input and output objects differ only by suffix
+        return resource.filename[:-len('._i')]
+    return resource.filename
+
+
+def _obj_changed(resource, value):
+    return not resource.input.exists or not pypeliner.resources.obj_equal(value, resource.get_obj())
+
+
+def _setobj_changed(job):
+    """ Whether setting the object of a setobj job would change the object or
+    chunks set by a previous run.
+    """
+    send = job.create_callable()
+    value = send.callset.args[0]
+    obj = send.callset.ret
+    if isinstance(obj, pypeliner.arguments.TempOutputObjArg):
+        return _obj_changed(obj.resource, value)
+    if isinstance(obj, pypeliner.arguments.TempSplitObjArg):
+        if len(value) != len(obj.resources):
+            return True
+        for resource in obj.resources:
+            chunks = obj.get_node_chunks(resource.node)
+            if chunks not in value or _obj_changed(resource, value[chunks]):
+                return True
+        return False
+    if isinstance(obj, pypeliner.arguments.OutputChunksArg):
+        chunks = set(obj.get_node_chunks(node) for node in job.db.nodemgr.retrieve_nodes(obj.axes, obj.node))
+        return chunks != set(value)
+    return True
+
+
+def _format_duration(duration):
+    if duration is None:
+        return '?'
+    return str(datetime.timedelta(seconds=int(round(duration))))
+
+
+class Planner(object):
+    """ Plan jobs using a runskip, and estimate when each planned job would
+    finish, assuming unlimited parallelism.
+
+    :param runskip: callable object returning whether a job would be run
+    :param job_duration: callable object returning the estimated duration
+                         of a job in seconds, or None if unknown
+
+    """
+    def __init__(self, runskip, job_duration):
+        self.runskip = runskip
+        self.job_duration = job_duration
+        self.checks_timestamps = getattr(runskip, 'checks_timestamps', True)
+        self.recreated = dict()
+        self.entries = list()
+
+    def _add_entry(self, job, job_type, run, explanation, duration=None, finish=0.):
+        entry = {
+            'name': job.displayname,
+            'task': job.id[1],
+            'type': job_type,
+            'run': run,
+            'reason': explanation.split('\n')[0],
+            'duration': duration,
+            'finish': finish,
+            'splits': job.check_require_regenerate(),
+        }
+        self.entries.append(entry)
+        return entry
+
+    def plan_job(self, job, job_type='job'):
+        """ Plan a job or subworkflow, returning its entry in the plan.
+        """
+        start = 0.
+        recreated = False
+        for input in job.input_resources:
+            key = _resource_key(input)
+            if key in self.recreated:
+                recreated = True
+                start = max(start, self.recreated[key])
+
+        is_run_required, explanation = self.runskip(job)
+        if not is_run_required and recreated and self.checks_timestamps:
+            is_run_required = True
+            explanation = 'inputs recreated by planned jobs\n' + explanation
+
+        duration = None
+        finish = start
+        if is_run_required and job_type == 'job':
+            duration = self.job_duration(job)
+            if duration is not None:
+                finish = start + duration
+            for output in job.output_resources:
+                self.recreated[_resource_key(output)] = finish
+
+        return self._add_entry(job, job_type, is_run_required, explanation, duration=duration, finish=finish)
+
+    def plan_setobj(self, job, changed):
+        """ Plan a setobj job that was evaluated, for which the object is
+        recreated only if its value changed.
+        """
+        if changed:
+            for output in job.output_resources:
+                self.recreated[_resource_key(output)] = 0.
+            return self._add_entry(job, 'object', True, 'object changed')
+        return self._add_entry(job, 'object', False, 'object unchanged')
+
+
+class PlanWorkflowInstance(pypeliner.graph.WorkflowInstance):
+    """ Instance of a workflow for planning, for which the runskip is a
+    :py:class:`Planner`.  Subworkflows are planned before being expanded, and
+    setobj jobs are planned after being evaluated, without setting objects.
+    """
+    def _start_subworkflow(self, job):
+        entry = self.runskip.plan_job(job, job_type='subworkflow')
+        if not entry['run']:
+            self.notify_completed(job.id)
+            return
+        # Call the function directly, as calling the callable writes job logs
+        send = job.create_callable()
+        try:
+            send.ret_value = send.func(*send.callset.args, **send.callset.kwargs)
+            send.finished = True
+        except Exception:
+            pass
+        if not send.finished or not isinstance(send.ret_value, pypeliner.workflow.Workflow):
+            entry['reason'] = 'not expanded, failed to create workflow'
+            self.notify_completed(job.id)
+            return
+        self._attach_subworkflow(job, send)
+
+    def _start_setobj(self, job):
+        self.runskip.plan_setobj(job, _setobj_changed(job))
+        self.notify_completed(job.id)
+
+    def finalize_workflows(self):
+        while len(self.finished_subworkflows) > 0:
+            workflow = self.finished_subworkflows.pop(0)
+            job, received = self.subworkflows.pop(workflow)
+            self.notify_completed(job.id)
+
+
+class Plan(object):
+    """ Jobs planned for a workflow, in the order they would be popped.
+
+    :param entries: list of dictionaries with the name, task, type, whether
+                    the job would be run, the first line of the reason given by
+                    the runskip, estimated duration and finish time, and whether
+                    the job defines axis chunks
+    :param max_jobs: number of jobs run in parallel, used to estimate the
+                     total run time
+
+    """
+    def __init__(self, entries, max_jobs=1):
+        self.entries = entries
+        self.max_jobs = max_jobs
+
+    @property
+    def summary(self):
+        jobs = [entry for entry in self.entries if entry['type'] == 'job']
+        runs = [entry for entry in jobs if entry['run']]
+        durations = [entry['duration'] for entry in runs if entry['duration'] is not None]
+        total_duration = sum(durations)
+        critical_path = max([entry['finish'] for entry in runs] + [0.])
+        return {
+            'num_run': len(runs),
+            'num_skip': len(jobs) - len(runs),
+            'num_subworkflows': len([entry for entry in self.entries if entry['type'] == 'subworkflow' and entry['run']]),
+            'num_unknown_duration': len(runs) - len(durations),
+            'num_splits': len([entry for entry in runs if entry['splits']]),
+            'total_duration': total_duration,
+            'critical_path': critical_path,
+            'estimated_time': max(critical_path, float(total_duration) / max(self.max_jobs, 1)),
+        }
+
+    def to_json(self):
+        return json.dumps({'summary': self.summary, 'jobs': self.entries}, indent=2, sort_keys=True)
+
+    def format_table(self):
+        lines = list()
+        lines.append('\t'.join(['action', 'duration', 'type', 'name', 'reason']))
+        for entry in self.entries:
+            lines.append('\t'.join([
+                ('skip', 'run')[entry['run']],
+                _format_duration(entry['duration']),
+                entry['type'],
+                entry['name'],
+                entry['reason'],
+            ]))
+        summary = self.summary
+        lines.append('')
+        lines.append('jobs run: {0}, skipped: {1}, subworkflows expanded: {2}'.format(
+            summary['num_run'], summary['num_skip'], summary['num_subworkflows']))
+        lines.append('total job time: {0}, critical path: {1}, estimated time: {2}'.format(
+            _format_duration(summary['total_duration']),
+            _format_duration(summary['critical_path']),
+            _format_duration(summary['estimated_time'])))
+        if summary['num_unknown_duration'] > 0:
+            lines.append('jobs without recorded duration: {0}'.format(summary['num_unknown_duration']))
+        if summary['num_splits'] > 0:
+            lines.append('jobs defining axis chunks: {0}, jobs on new chunks are not planned'.format(summary['num_splits']))
+        return '\n'.join(lines)
+
+
+def create_plan(workflow_def, db_factory, runskip, job_duration, max_jobs=1):
+    """ Plan a workflow without running any jobs.
+
+    :param workflow_def: workflow of jobs to be planned
+    :param db_factory: workflow database factory
+    :param runskip: callable object returning whether a job would be run
+    :param job_duration: callable object returning the estimated duration of a job
+    :param max_jobs: number of jobs run in parallel
+
+    :return: :py:class:`Plan` of the workflow
+
+    """
+    planner = Planner(runskip, job_duration)
+    workflow = PlanWorkflowInstance(workflow_def, db_factory, planner)
+    while True:
+        try:
+            job = workflow.pop_next_job()
+        except pypeliner.graph.NoJobs:
+            break
+        planner.plan_job(job)
+        job.workflow.notify_completed(job.id)
+    return Plan(planner.entries, max_jobs=max_jobs)
@@ -15,13 +15,19 @@ class Dependency(object):
     timestamps, in particular for an axis chunk input to a job
     parallelized on that axis.
     """
+    __slots__ = ('name', 'node', '_id')
     is_temp = False
     def __init__(self, name, node):
         self.name = name
         self.node = node
     @property
     def id(self):
-        return (self.name, self.node)
+        # Cached so that the graph shares a single id tuple per dependency
+        try:
+            return self._id
+        except AttributeError:
+            self._id = (self.name, self.node)
+            return self._id
     @property
     def exists(self):
         return True
@@ -39,6 +45,7 @@ class Dependency(object):
 class Resource(Dependency):
     """ Abstract input/output in the dependency graph
     associated with a file tracked using creation time """
+    __slots__ = ('filename', 'store', 'extra_stores')
     def build_displayname_filename(self, base_node=pypeliner.identifiers.Node()):
         displayname = self.build_displayname(base_node)
         if displayname != self.filename:
@@ -53,6 +60,11 @@ class Resource(Dependency):
         raise NotImplementedError
     def touch(self):
         raise NotImplementedError
+    @property
+    def stores(self):
+        if self.store is None:
+            return list(self.extra_stores)
+        return [self.store] + list(self.extra_stores)
     def allocate(self):
         self.store.allocate()
         for store in self.extra_stores:
@@ -69,7 +81,8 @@ class Resource(Dependency):
 
 class UserResource(Resource):
     """ A file resource with filename and creation time if created """
-    def __init__(self, storage, name, node, filename, direct_write=False, extensions=None):
+    __slots__ = ()
+    def __init__(self, storage, name, node, filename, direct_write=False, extensions=None, sample_blocks=None):
         self.name = name
         self.node = node
         self.filename = filename
@@ -80,11 +93,14 @@ class UserResource(Resource):
         if filename is None:
             self.store = None
         else:
-            self.store = storage.create_store(self.filename, is_temp=False, direct_write=direct_write)
-        self.extra_stores = []
+            self.store = storage.create_store(self.filename, is_temp=False, direct_write=direct_write,
+                                              sample_blocks=sample_blocks)
+        self.extra_stores = ()
         if extensions is not None:
-            for ext in extensions:
-                self.extra_stores.append(storage.create_store(self.filename, extension=ext, is_temp=False, direct_write=direct_write))
+            self.extra_stores = tuple(
+                storage.create_store(self.filename, extension=ext, is_temp=False, direct_write=direct_write,
+                                     sample_blocks=sample_blocks)
+                for ext in extensions)
     def build_displayname(self, base_node=pypeliner.identifiers.Node()):
         return self.filename
     @property
@@ -108,16 +124,18 @@ class UserResource(Resource):
 
 class TempFileResource(Resource):
     """ A file resource with filename and creation time if created """
+    __slots__ = ()
+    is_temp = True
     def __init__(self, storage, name, node, filename, direct_write=False, extensions=None):
         self.name = name
         self.node = node
         self.filename = filename
-        self.is_temp = True
         self.store = storage.create_store(self.filename, is_temp=True, direct_write=direct_write)
-        self.extra_stores = []
+        self.extra_stores = ()
         if extensions is not None:
-            for ext in extensions:
-                self.extra_stores.append(storage.create_store(self.filename, extension=ext, is_temp=False, direct_write=direct_write))
+            self.extra_stores = tuple(
+                storage.create_store(self.filename, extension=ext, is_temp=False, direct_write=direct_write)
+                for ext in extensions)
     @property
     def exists(self):
         return self.store.get_exists()
@@ -137,13 +155,18 @@ class TempFileResource(Resource):
 
 class TempObjResource(Resource):
     """ A file resource with filename and creation time if created """
+    __slots__ = ('is_input',)
+    is_temp = True
     def __init__(self, storage, name, node, filename, is_input=True):
         self.name = name
         self.node = node
         self.filename = filename + ('._i', '._o')[is_input]
         self.is_input = is_input
-        self.is_temp = True
         self.store = storage.create_store(self.filename, is_temp=True)
+        self.extra_stores = ()
+    @property
+    def stores(self):
+        return [self.store]
     @property
     def exists(self):
         return self.store.get_exists()
@@ -184,6 +207,7 @@ def obj_equal(obj1, obj2):
 
 class TempObjManager(object):
     """ A file resource with filename and creation time if created """
+    __slots__ = ('name', 'node', 'input', 'output')
     def __init__(self, storage, name, node, filename):
         self.name = name
         self.node = node
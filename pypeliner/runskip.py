@@ -2,12 +2,16 @@ import cmd
 import fnmatch
 import logging
 
+import pypeliner.instrument
+
 
 class BasicRunSkip(object):
+    checks_timestamps = True
     def __init__(self, repopulate=False, rerun=False):
         self.repopulate = repopulate
         self.rerun = rerun
 
+    @pypeliner.instrument.timed('runskip.basic')
     def __call__(self, job):
         if self.rerun:
             return True, 'rerun requested\n' + job.explain_out_of_date()
@@ -24,9 +28,11 @@ class BasicRunSkip(object):
 
 
 class SentinalRunSkip(object):
+    checks_timestamps = False
     def __init__(self, rerun=False):
         self.rerun = rerun
 
+    @pypeliner.instrument.timed('runskip.sentinal')
     def __call__(self, job):
         if self.rerun:
             return True, 'rerun requested\n' + job.explain_out_of_date()
@@ -108,6 +114,11 @@ class InteractiveRunSkip(object):
         self.default = default
         self._logger = logging.getLogger('pypeliner.scheduler.runskip')
 
+    @property
+    def checks_timestamps(self):
+        return self.default.checks_timestamps
+
+    @pypeliner.instrument.timed('runskip.interactive')
     def __call__(self, job):
         default_is_run_required, default_explaination = self.default(job)
 
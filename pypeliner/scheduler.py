@@ -3,19 +3,48 @@ Job scheduling class
 
 """
 
+import os
 import logging
+import time
 import traceback
+import collections
 
 import pypeliner.helpers
+import pypeliner.cache
 import pypeliner.graph
+import pypeliner.jobs
 import pypeliner.execqueue.base
+import pypeliner.execqueue.inprocess
 import pypeliner.database
+import pypeliner.staging
+import pypeliner.planner
+import pypeliner.instrument
+import pypeliner.trace
 
 
 class PipelineException(Exception):
     pass
 
 
+class CriticalPathWeight(object):
+    """ Weight jobs by the mean recorded duration of their task, falling back
+    to an estimate given as the 'duration' entry of the job's context.
+    """
+    def __init__(self, run_history, default_duration=1):
+        self.run_history = run_history
+        self.default_duration = default_duration
+        self.task_durations = dict()
+
+    def __call__(self, job):
+        task_name = job.id[1]
+        if task_name not in self.task_durations:
+            self.task_durations[task_name] = self.run_history.get_duration(task_name)
+        duration = self.task_durations[task_name]
+        if duration is None:
+            duration = job.ctx.get('duration', self.default_duration)
+        return duration
+
+
 class Scheduler(object):
     """ Job scheduling class for queueing a set of jobs and running
     those jobs according to their dependencies.
@@ -28,6 +57,22 @@ class Scheduler(object):
         self.temps_dir = './tmp'
         self.workflow_dir = './'
         self.logs_dir = './log'
+        self.schedule = 'fifo'
+        self.fair_share = 'none'
+        self.lazy_jobs = False
+        self.max_mem = None
+        self.max_cpus = None
+        self.max_bypass = 10
+        self.prefetch_depth = 0
+        self.prefetch_size = None
+        self.cache_dir = None
+        self.cache_size = None
+        self.evaluate_threads = 4
+        self.inprocess_threads = 4
+        self.min_poll_interval = 0.001
+        self.poll_interval = 0.1
+        self.stats_interval = 60
+        self.trace = True
         self.freeze = True
 
     def __setattr__(self, attr, value):
@@ -57,6 +102,55 @@ class Scheduler(object):
                            in :py:mod:`pypeliner.execqueue` should suffice for most purposes
         :param runskip: callable object returning boolean, used to determine whether to run jobs
 
+        Ready jobs are submitted in the order they became ready if `schedule` is 'fifo'.  If
+        `schedule` is 'critical_path', ready jobs with the longest downstream path, weighted
+        by durations recorded for each task in previous runs, are submitted first.
+
+        If `max_mem` or `max_cpus` are set, jobs are only submitted if their memory and cpu
+        requests, given by the 'mem' and 'ncpus' entries of the job's context, fit within the
+        remaining budget.  Smaller jobs may be submitted ahead of a job that does not fit, but
+        only `max_bypass` times, after which no further jobs are submitted until it fits.
+
+        Jobs are chosen between sibling subworkflows according to `fair_share`, one of
+        :py:data:`pypeliner.graph.fair_shares`, see :py:class:`pypeliner.graph.WorkflowInstance`.
+
+        If `lazy_jobs` is set, instances of a job are only created once its inputs could be
+        ready, see :py:class:`pypeliner.graph.WorkflowInstance`.
+
+        Jobs that are ready at the same time and are instances of the same job with identical
+        context are sent to the `exec_queue` together, and are submitted as a single job array
+        by the qsub, pbs and drmaa queues.  Each job of an array is still received separately.
+        Up to the 'batch' entry of the job's context of these jobs are run in a single job of
+        the `exec_queue`, or if the 'batch_duration' entry is set, as many as are expected
+        to take that many seconds.  Jobs of a batch are run one after another, or in
+        'batch_threads' threads, and are completed or retried individually.
+
+        Jobs with the 'inprocess' entry of the job's context set are called in a pool of
+        `inprocess_threads` threads of the current process instead of being sent to the
+        `exec_queue`, see :py:class:`pypeliner.execqueue.inprocess.InProcessJobQueue`.
+
+        Subworkflow and setobj functions are evaluated in a pool of `evaluate_threads`
+        background threads, and their workflows and objects are added once evaluated.
+        While functions are being evaluated, the scheduler is woken when a function is
+        evaluated or an in process job finishes, and the queue is polled at intervals
+        increasing from `min_poll_interval` to `poll_interval` seconds.
+
+        If `prefetch_depth` is set, inputs in remote storage of up to `prefetch_depth` jobs
+        that are ready or will be ready once running jobs finish are staged in a staging
+        directory in `temps_dir`, limited to a total of `prefetch_size` GB if set.  Jobs
+        link to staged inputs instead of downloading them when started.
+
+        If `cache_dir` is set, the outputs of successful jobs are stored in a cache in
+        `cache_dir`, limited to `cache_size` GB if set, that may be shared between pipelines.
+        Jobs with the same function, arguments and input file contents as a cached job have
+        their outputs restored from the cache instead of being run, unless the 'cache' entry
+        of the job's context is False, see :py:mod:`pypeliner.cache`.
+
+        Timers and counters of the scheduler, see :py:mod:`pypeliner.instrument`, are written
+        to 'scheduler_stats.json' in `logs_dir` every `stats_interval` seconds and on exit.
+        If `trace` is set, job attempts are written to 'pipeline_trace.json' in `logs_dir` in
+        the Chrome trace event format, see :py:mod:`pypeliner.trace`.
+
         Call this function after adding jobs to a workflow using
         :py:func:`pypeliner.scheduler.Scheduler.transform` etc.  Jobs will be run locally or
         remotely using the `exec_queue` provided until completion.  On failure, the function
@@ -67,79 +161,429 @@ class Scheduler(object):
         """
 
         self._active_jobs = dict()
+        self._job_batches = dict()
+        self._job_fingerprints = dict()
+        self._task_durations = dict()
         self._job_exc_dirs = set()
+        self._pending_jobs = list()
+        self._job_requests = dict()
+        self._job_bypasses = dict()
+        self._job_submit_times = dict()
+        self._job_sent_times = dict()
+        self._used_mem = 0
+        self._used_cpus = 0
+        pypeliner.instrument.stats.reset()
+        self._stats_dump_time = time.time()
+        with pypeliner.database.WorkflowDatabaseFactory(self.temps_dir, self.workflow_dir, self.logs_dir, file_storage) as db_factory:
+            self._run_history = db_factory.run_history
+            if self.schedule == 'fifo':
+                job_weight = None
+            elif self.schedule == 'critical_path':
+                job_weight = CriticalPathWeight(db_factory.run_history)
+            else:
+                raise ValueError('unknown schedule ' + self.schedule)
+            evaluator = pypeliner.graph.CallableEvaluator(self.evaluate_threads)
+            self._stager = None
+            if self.prefetch_depth > 0:
+                max_bytes = None
+                if self.prefetch_size is not None:
+                    max_bytes = int(self.prefetch_size * 1024 ** 3)
+                self._stager = pypeliner.staging.InputStager(os.path.join(self.temps_dir, 'staging'), max_bytes=max_bytes)
+            self._job_cache = None
+            if self.cache_dir is not None:
+                max_size = None
+                if self.cache_size is not None:
+                    max_size = int(self.cache_size * 1024 ** 3)
+                self._job_cache = pypeliner.cache.JobCache(self.cache_dir, max_size=max_size)
+            self._tracer = None
+            if self.trace:
+                self._tracer = pypeliner.trace.TraceWriter(os.path.join(self.logs_dir, 'pipeline_trace.json'))
+            exec_queue = pypeliner.execqueue.inprocess.InProcessDispatchJobQueue(exec_queue, num_threads=self.inprocess_threads,
+                                                                                 notify=evaluator.notify)
+            try:
+                self._run_workflow(workflow_def, exec_queue, db_factory, runskip, job_weight, evaluator)
+            finally:
+                evaluator.close()
+                exec_queue.close()
+                if self._stager is not None:
+                    self._stager.close()
+                if self._job_cache is not None:
+                    self._job_cache.close()
+                if self._tracer is not None:
+                    self._tracer.close()
+                self._dump_stats(force=True)
+
+    def _dump_stats(self, force=False):
+        if not force and time.time() - self._stats_dump_time < self.stats_interval:
+            return
+        self._stats_dump_time = time.time()
+        try:
+            pypeliner.helpers.makedirs(self.logs_dir)
+            pypeliner.instrument.stats.dump(os.path.join(self.logs_dir, 'scheduler_stats.json'))
+        except Exception:
+            self._logger.warning('unable to write scheduler stats\n' + traceback.format_exc())
+
+    def plan(self, workflow_def, file_storage, runskip):
+        """ Plan the pipeline without running any jobs
+
+        :param workflow_def: workflow of jobs to be planned.
+        :param runskip: callable object returning boolean, used to determine whether jobs
+                        would be run
+
+        :return: :py:class:`pypeliner.planner.Plan` of jobs that would be run or skipped,
+                 with durations estimated from the run history, or from the 'duration'
+                 entry of the job's context, and a total time estimated for `max_jobs`
+                 parallel jobs.  See :py:mod:`pypeliner.planner`.
+
+        """
+
         with pypeliner.database.WorkflowDatabaseFactory(self.temps_dir, self.workflow_dir, self.logs_dir, file_storage) as db_factory:
-            workflow = pypeliner.graph.WorkflowInstance(workflow_def, db_factory, runskip, cleanup=self.cleanup)
-            failing = False
+            job_duration = CriticalPathWeight(db_factory.run_history, default_duration=None)
+            return pypeliner.planner.create_plan(workflow_def, db_factory, runskip, job_duration, max_jobs=self.max_jobs)
+
+    def _run_workflow(self, workflow_def, exec_queue, db_factory, runskip, job_weight, evaluator):
+        workflow = pypeliner.graph.WorkflowInstance(workflow_def, db_factory, runskip, cleanup=self.cleanup,
+                                                    job_weight=job_weight, evaluator=evaluator, fair_share=self.fair_share,
+                                                    lazy=self.lazy_jobs)
+        failing = False
+        try:
             try:
+                while True:
+                    self._dump_stats()
+                    self._add_jobs(exec_queue, workflow, runskip)
+                    self._stage_inputs(workflow)
+                    if workflow.is_evaluating:
+                        name = self._wait_evaluating(exec_queue, evaluator)
+                        if name is not None:
+                            self._wait_next_job(exec_queue, workflow, name=name)
+                        continue
+                    if exec_queue.empty:
+                        break
+                    self._wait_next_job(exec_queue, workflow)
+            except KeyboardInterrupt as e:
+                raise
+            except Exception:
+                failing = True
+                self._logger.error('exception\n' + traceback.format_exc())
+            while not exec_queue.empty:
                 try:
-                    while True:
-                        self._add_jobs(exec_queue, workflow, runskip)
-                        if exec_queue.empty:
-                            break
-                        self._wait_next_job(exec_queue, workflow)
+                    self._wait_next_job(exec_queue, workflow)
                 except KeyboardInterrupt as e:
                     raise
                 except Exception:
-                    failing = True
                     self._logger.error('exception\n' + traceback.format_exc())
-                while not exec_queue.empty:
-                    try:
-                        self._wait_next_job(exec_queue, workflow)
-                    except KeyboardInterrupt as e:
-                        raise
-                    except Exception:
-                        self._logger.error('exception\n' + traceback.format_exc())
-            except KeyboardInterrupt as e:
-                self._logger.error('interrupted')
-                raise
-            if failing:
-                self._logger.error('pipeline failed')
-                raise PipelineException('pipeline failed')
+        except KeyboardInterrupt as e:
+            self._logger.error('interrupted')
+            raise
+        if failing:
+            self._logger.error('pipeline failed')
+            raise PipelineException('pipeline failed')
+
+    def _stage_inputs(self, workflow):
+        """ Stage inputs of jobs waiting for submission and of jobs that will be
+        ready once running jobs finish.
+        """
+        if self._stager is None:
+            return
+        upcoming = self._pending_jobs[:self.prefetch_depth]
+        upcoming.extend(workflow.get_upcoming_jobs(self.prefetch_depth - len(upcoming)))
+        self._stager.stage_jobs(upcoming)
 
     def _add_job(self, exec_queue, job):
-        sent = job.create_callable()
-        exc_dir = job.create_exc_dir()
+        self._add_job_group(exec_queue, [job])
+
+    def _array_key(self, job):
+        """ Key of jobs that can be sent as a job array, instances of the same
+        job definition with identical context.  Jobs with unhashable context
+        values are sent individually.
+        """
+        key = (job.job_def, tuple(sorted(job.ctx.iteritems())))
+        try:
+            hash(key)
+        except TypeError:
+            return job.id
+        return key
+
+    def _add_job_group(self, exec_queue, jobs):
+        """ Send jobs to the exec queue, sending instances of the same job
+        definition with identical context as a job array.
+        """
+        arrays = collections.OrderedDict()
+        for job in jobs:
+            arrays.setdefault(self._array_key(job), []).append(job)
+        for array_jobs in arrays.itervalues():
+            self._add_job_array(exec_queue, array_jobs)
+
+    def _add_job_array(self, exec_queue, jobs):
+        sents = list()
+        exc_dirs = list()
+        for job in jobs:
+            if self._stager is not None:
+                self._stager.prepare(job)
+
+            sent = job.create_callable()
+            exc_dir = job.create_exc_dir()
+
+            self._active_jobs[job.displayname] = job
 
-        self._active_jobs[job.displayname] = job
+            if exc_dir in self._job_exc_dirs:
+                raise ValueError('duplicate temps directory ' + exc_dir)
+            self._job_exc_dirs.add(exc_dir)
 
-        if exc_dir in self._job_exc_dirs:
-            raise ValueError('duplicate temps directory ' + exc_dir)
-        self._job_exc_dirs.add(exc_dir)
-        
-        self._logger.info('job ' + job.displayname + ' executing',
-                          extra={"id": job.displayname, "type":"job", "requested_mem(GB)":job.ctx["mem"], "status":"executing", 'task_name': job.id[1]})
-        self._logger.info('job ' + job.displayname + ' -> ' + sent.displaycommand,
-                          extra={"id": job.displayname, "type":"job", "cmd": sent.displaycommand, 'task_name': job.id[1]})
+            self._logger.info('job ' + job.displayname + ' executing',
+                              extra={"id": job.displayname, "type":"job", "requested_mem(GB)":job.ctx["mem"], "status":"executing", 'task_name': job.id[1]})
+            self._logger.info('job ' + job.displayname + ' -> ' + sent.displaycommand,
+                              extra={"id": job.displayname, "type":"job", "cmd": sent.displaycommand, 'task_name': job.id[1]})
 
-        exec_queue.send(job.ctx, job.displayname, sent, exc_dir)
+            self._job_submit_times[job.displayname] = time.time()
+            sents.append(sent)
+            exc_dirs.append(exc_dir)
+
+        names = [job.displayname for job in jobs]
+        batch_size = self._batch_size(jobs[0])
+        if batch_size > 1:
+            names, sents, exc_dirs = self._create_job_batches(jobs, names, sents, exc_dirs, batch_size)
+        with pypeliner.instrument.stats.timer('exec_queue.send'):
+            if len(names) == 1:
+                exec_queue.send(jobs[0].ctx, names[0], sents[0], exc_dirs[0])
+            elif hasattr(exec_queue, 'send_array'):
+                exec_queue.send_array(jobs[0].ctx, names, sents, exc_dirs)
+                pypeliner.instrument.stats.count('jobs.arrays')
+            else:
+                for name, sent, exc_dir in zip(names, sents, exc_dirs):
+                    exec_queue.send(jobs[0].ctx, name, sent, exc_dir)
+        for job in jobs:
+            self._job_sent_times[job.displayname] = time.time()
+            pypeliner.instrument.stats.count('jobs.submitted')
+
+    def _batch_size(self, job):
+        """ Number of instances of a job to run in a single exec queue job, at
+        most the 'batch' entry of the job's context, and if the 'batch_duration'
+        entry is set, as many as are expected to run in that many seconds.
+        """
+        batch_size = job.ctx.get('batch')
+        batch_duration = job.ctx.get('batch_duration')
+        if batch_duration is not None:
+            task_name = job.id[1]
+            if task_name not in self._task_durations:
+                self._task_durations[task_name] = self._run_history.get_duration(task_name)
+            duration = self._task_durations[task_name]
+            if duration is None:
+                duration = job.ctx.get('duration')
+            if duration:
+                duration_size = max(1, int(batch_duration / duration))
+                batch_size = min(batch_size or duration_size, duration_size)
+        return max(1, batch_size or 1)
+
+    def _create_job_batches(self, jobs, names, sents, exc_dirs, batch_size):
+        """ Combine callables of jobs into batches of at most `batch_size`
+        callables, returning the names, callables and temps directories of
+        the batches.  Batches are run in a pool of threads if the 'batch_threads'
+        entry of the job's context is set.
+        """
+        threads = jobs[0].ctx.get('batch_threads', 1)
+        batch_names, batch_sents, batch_exc_dirs = list(), list(), list()
+        for start in xrange(0, len(jobs), batch_size):
+            end = min(start + batch_size, len(jobs))
+            if end - start == 1:
+                batch_names.append(names[start])
+                batch_sents.append(sents[start])
+                batch_exc_dirs.append(exc_dirs[start])
+                continue
+            batch_name = '{0}+{1}'.format(names[start], end - start - 1)
+            batch_exc_dir = os.path.join(exc_dirs[start], 'batch')
+            pypeliner.helpers.makedirs(batch_exc_dir)
+            self._job_batches[batch_name] = names[start:end]
+            self._logger.info('job ' + names[start] + ' batched with ' + ', '.join(names[start+1:end]),
+                              extra={"id": names[start], "type":"job", "batch": names[start:end], 'task_name': jobs[start].id[1]})
+            batch_names.append(batch_name)
+            batch_sents.append(pypeliner.jobs.JobBatch(sents[start:end], threads=threads))
+            batch_exc_dirs.append(batch_exc_dir)
+            pypeliner.instrument.stats.count('jobs.batches')
+        return batch_names, batch_sents, batch_exc_dirs
 
     def _retry_job(self, exec_queue, job):
         if not job.retry():
             return False
         self._logger.info('job ' + job.displayname + ' retry ' + str(job.retry_idx),
                           extra={"id": job.displayname, "type":"job", "retry_count": job.retry_idx, 'task_name': job.id[1]})
-        self._add_job(exec_queue, job)
+        pypeliner.instrument.stats.count('jobs.retried')
+        if self._is_budgeted:
+            self._pending_jobs.insert(0, job)
+            self._admit_pending_jobs(exec_queue)
+        else:
+            self._add_job(exec_queue, job)
         return True
 
-    def _add_jobs(self, exec_queue, workflow, runskip):
-        while exec_queue.length < self.max_jobs:
-            try:
-                job = workflow.pop_next_job()
-            except pypeliner.graph.NoJobs:
-                return
+    def _pop_next_job(self, workflow, runskip):
+        """ Pop the next job that requires a run, completing any skipped jobs.
+        """
+        while True:
+            job = workflow.pop_next_job()
             is_run_required, explaination = runskip(job)
             self._logger.info('job ' + job.displayname + ' run: ' + str(is_run_required) + ' explanation: ' + explaination,
                               extra={"id": job.displayname, "type":"job", "explanation":explaination, 'task_name': job.id[1]})
+            if is_run_required and self._restore_cached(job):
+                continue
             if is_run_required:
-                self._add_job(exec_queue, job)
-            else:
-                job.complete()
-                self._logger.info('job ' + job.displayname + ' skipped',
-                                  extra={"id": job.displayname, "type":"job", "status": "skipped", 'task_name': job.id[1]})
+                job.update_mem()
+                return job
+            pypeliner.instrument.stats.count('jobs.skipped')
+            job.complete()
+            self._logger.info('job ' + job.displayname + ' skipped',
+                              extra={"id": job.displayname, "type":"job", "status": "skipped", 'task_name': job.id[1]})
+
+    @pypeliner.instrument.timed('scheduler.restore_cached')
+    def _restore_cached(self, job):
+        """ Complete a job with outputs restored from the job cache, returning
+        False if the job is not cached.
+        """
+        if self._job_cache is None or not job.ctx.get('cache', True):
+            return False
+        key = pypeliner.cache.fingerprint(job)
+        if key is None:
+            return False
+        job_callable = job.create_callable()
+        if not self._job_cache.restore(key, job_callable):
+            self._job_fingerprints[job.displayname] = key
+            return False
+        pypeliner.instrument.stats.count('jobs.cached')
+        job.finalize(job_callable)
+        job.complete()
+        self._logger.info('job ' + job.displayname + ' restored from cache',
+                          extra={"id": job.displayname, "type":"job", "status": "cached", 'task_name': job.id[1]})
+        return True
+
+    def _store_cached(self, job, received):
+        key = self._job_fingerprints.pop(job.displayname, None)
+        if key is None:
+            return
+        try:
+            self._job_cache.store(key, received)
+        except (IOError, OSError):
+            self._logger.warning('job ' + job.displayname + ' cache error\n' + traceback.format_exc(),
+                                 extra={"id": job.displayname, "type":"job", 'task_name': job.id[1]})
+
+    @pypeliner.instrument.timed('scheduler.add_jobs')
+    def _add_jobs(self, exec_queue, workflow, runskip):
+        if self._is_budgeted:
+            while len(self._pending_jobs) < self.max_jobs:
+                try:
+                    self._pending_jobs.append(self._pop_next_job(workflow, runskip))
+                except pypeliner.graph.NoJobs:
+                    break
+            self._admit_pending_jobs(exec_queue)
+            return
+        # Count the exec queue jobs required for batches of jobs, and continue
+        # filling an incomplete batch once max_jobs is reached, holding back
+        # jobs that would require an additional exec queue job
+        jobs = list()
+        batch_counts = dict()
+        num_sends = 0
+        is_batch_open = False
+        try:
+            while exec_queue.length + num_sends < self.max_jobs or is_batch_open:
+                if len(self._pending_jobs) > 0:
+                    job = self._pending_jobs.pop(0)
+                else:
+                    try:
+                        job = self._pop_next_job(workflow, runskip)
+                    except pypeliner.graph.NoJobs:
+                        break
+                key = self._array_key(job)
+                batch_size = self._batch_size(job)
+                batch_count = batch_counts.get(key, 0)
+                if batch_count % batch_size == 0:
+                    if exec_queue.length + num_sends >= self.max_jobs:
+                        self._pending_jobs.insert(0, job)
+                        break
+                    num_sends += 1
+                batch_counts[key] = batch_count + 1
+                is_batch_open = (batch_count + 1) % batch_size != 0
+                jobs.append(job)
+        finally:
+            self._add_job_group(exec_queue, jobs)
+
+    @property
+    def _is_budgeted(self):
+        return self.max_mem is not None or self.max_cpus is not None
+
+    def _get_job_request(self, job):
+        """ Memory and cpus requested by a job, limited to the total budget so
+        that large jobs can run once all other jobs have finished.
+        """
+        mem = job.ctx.get('mem', 0)
+        cpus = job.ctx.get('ncpus', 1)
+        if self.max_mem is not None:
+            mem = min(mem, self.max_mem)
+        if self.max_cpus is not None:
+            cpus = min(cpus, self.max_cpus)
+        return mem, cpus
+
+    def _fits_budget(self, mem, cpus):
+        if self.max_mem is not None and self._used_mem + mem > self.max_mem:
+            return False
+        if self.max_cpus is not None and self._used_cpus + cpus > self.max_cpus:
+            return False
+        return True
+
+    def _admit_pending_jobs(self, exec_queue):
+        """ Submit pending jobs that fit within the memory and cpu budgets, in
+        order, allowing jobs to bypass a job that does not fit at most
+        max_bypass times.
+        """
+        waiting = list()
+        admitted = list()
+        for job in list(self._pending_jobs):
+            if exec_queue.length + len(admitted) >= self.max_jobs:
+                break
+            mem, cpus = self._get_job_request(job)
+            if not self._fits_budget(mem, cpus):
+                if self._job_bypasses.get(job.displayname, 0) >= self.max_bypass:
+                    break
+                waiting.append(job)
+                continue
+            for waiting_job in waiting:
+                self._job_bypasses[waiting_job.displayname] = self._job_bypasses.get(waiting_job.displayname, 0) + 1
+            self._pending_jobs.remove(job)
+            self._job_bypasses.pop(job.displayname, None)
+            self._job_requests[job.displayname] = (mem, cpus)
+            self._used_mem += mem
+            self._used_cpus += cpus
+            admitted.append(job)
+        self._add_job_group(exec_queue, admitted)
+
+    def _release_job_request(self, job):
+        mem, cpus = self._job_requests.pop(job.displayname, (0, 0))
+        self._used_mem -= mem
+        self._used_cpus -= cpus
 
-    def _wait_next_job(self, exec_queue, workflow):
-        name = exec_queue.wait()
+    def _wait_evaluating(self, exec_queue, evaluator):
+        """ Wait for a job to finish or for a callable to finish evaluating,
+        returning the name of the finished job, if any.  The evaluator is
+        notified when in process jobs finish, other jobs are polled for.
+        """
+        poll_interval = self.min_poll_interval
+        while True:
+            if not exec_queue.empty:
+                with pypeliner.instrument.stats.timer('exec_queue.poll'):
+                    name = exec_queue.wait(immediate=True)
+                if name is not None:
+                    return name
+            if evaluator.wait(poll_interval):
+                return None
+            poll_interval = min(poll_interval * 2, self.poll_interval)
+
+    @pypeliner.instrument.timed('scheduler.wait_next_job')
+    def _wait_next_job(self, exec_queue, workflow, name=None):
+        if name is None:
+            with pypeliner.instrument.stats.timer('exec_queue.wait'):
+                name = exec_queue.wait()
+        receive_time = time.time()
+
+        if name in self._job_batches:
+            self._receive_job_batch(exec_queue, name, receive_time)
+            return
 
         job = self._active_jobs[name]
         del self._active_jobs[name]
@@ -147,12 +591,43 @@ class Scheduler(object):
         assert job is not None
 
         try:
-            received = exec_queue.receive(name)
+            with pypeliner.instrument.stats.timer('exec_queue.receive'):
+                received = exec_queue.receive(name)
         except pypeliner.execqueue.base.ReceiveError as e:
             self._logger.error('job ' + job.displayname + ' submit error\n' + traceback.format_exc(),
                                extra={"id": job.displayname, "type":"job", "submit_error": traceback.format_exc(), 'task_name': job.id[1]})
             received = None
 
+        self._finish_job(exec_queue, job, received, receive_time)
+
+    def _receive_job_batch(self, exec_queue, name, receive_time):
+        """ Receive a batch of jobs, and finish each job of the batch, raising
+        once all jobs are finished if any job is incomplete.
+        """
+        jobs = [self._active_jobs.pop(job_name) for job_name in self._job_batches.pop(name)]
+
+        try:
+            with pypeliner.instrument.stats.timer('exec_queue.receive'):
+                received_batch = exec_queue.receive(name)
+            receiveds = received_batch.callables
+        except pypeliner.execqueue.base.ReceiveError as e:
+            for job in jobs:
+                self._logger.error('job ' + job.displayname + ' submit error\n' + traceback.format_exc(),
+                                   extra={"id": job.displayname, "type":"job", "submit_error": traceback.format_exc(), 'task_name': job.id[1]})
+            receiveds = [None] * len(jobs)
+
+        is_incomplete = False
+        for job, received in zip(jobs, receiveds):
+            try:
+                self._finish_job(exec_queue, job, received, receive_time)
+            except pypeliner.graph.IncompleteJobException:
+                is_incomplete = True
+        if is_incomplete:
+            raise pypeliner.graph.IncompleteJobException()
+
+    def _finish_job(self, exec_queue, job, received, receive_time):
+        self._release_job_request(job)
+
         if received is not None and job.id != received.id:
             raise Exception('job id {} doenst match received id {}'.format(job.id, received.id))
 
@@ -170,18 +645,68 @@ class Scheduler(object):
                                    extra={"id": job.displayname, "type":"job", "status": "fail", 'task_name': job.id[1]})
             self._logger.info('job ' + job.displayname + ' time ' + str(received.duration) + 's',
                               extra={"id": job.displayname, "type":"job", "time": received.duration, 'task_name': job.id[1]})
-            self._logger.info('job ' + job.displayname + ' memory ' + str(received.memoryused) + 'G',
-                              extra={"id": job.displayname, "type":"job", "memory": received.memoryused, 'task_name': job.id[1]})
+            memory = self._job_memory(job, received)
+            self._logger.info('job ' + job.displayname + ' memory ' + str(memory) + 'G',
+                              extra={"id": job.displayname, "type":"job", "memory": memory, 'task_name': job.id[1]})
             self._logger.info('job ' + job.displayname + ' host name ' + str(received.hostname) + 's',
                               extra={"id": job.displayname, "type":"job", "hostname": received.hostname, 'task_name': job.id[1]})
 
+        submit_time = self._job_submit_times.get(job.displayname)
+        sent_time = self._job_sent_times.pop(job.displayname, None)
+        self._record_run(job, received)
+
         if received is None or not received.finished:
+            pypeliner.instrument.stats.count('jobs.failed')
+            self._trace_attempt(job, received, submit_time, sent_time, receive_time)
             if self._retry_job(exec_queue, job):
                 return
-            else:
-                raise pypeliner.graph.IncompleteJobException()
+            self._release_staged(job)
+            self._job_fingerprints.pop(job.displayname, None)
+            raise pypeliner.graph.IncompleteJobException()
+
+        self._release_staged(job)
 
+        pypeliner.instrument.stats.count('jobs.completed')
         job.finalize(received)
+        self._store_cached(job, received)
         job.complete()
+        self._trace_attempt(job, received, submit_time, sent_time, receive_time)
 
+    def _trace_attempt(self, job, received, submit_time, sent_time, receive_time):
+        if self._tracer is None or submit_time is None or sent_time is None:
+            return
+        if received is None:
+            status, hostname, start_time, duration = 'error', None, None, None
+        else:
+            status = ('fail', 'success')[received.finished]
+            hostname, start_time, duration = received.hostname, received.start_time, received.duration
+        self._tracer.add_attempt(job.displayname, job.workflow.node.displayname, job.retry_idx, status, hostname,
+                                 submit_time, sent_time, start_time, duration, receive_time, time.time())
+
+    def _release_staged(self, job):
+        if self._stager is not None:
+            self._stager.release(job)
+
+    def _job_memory(self, job, received):
+        """ Peak memory of a received job, None for jobs called in process or in
+        a batch, for which only the peak memory of the whole process is known.
+        """
+        if job.ctx.get('inprocess', False) or received.batched:
+            return None
+        return received.memoryused
 
+    def _record_run(self, job, received):
+        submit_time = self._job_submit_times.pop(job.displayname, None)
+        node = (job.workflow.node + job.node).displayname
+        if received is None:
+            self._run_history.record(job.id[1], node, job.displayname, job.retry_idx, 'error',
+                                     submit_time=submit_time)
+            return
+        queue_wait = None
+        if submit_time is not None and received.start_time is not None:
+            queue_wait = received.start_time - submit_time
+        self._run_history.record(job.id[1], node, job.displayname, job.retry_idx,
+                                 ('fail', 'success')[received.finished],
+                                 duration=received.duration, memory=self._job_memory(job, received),
+                                 queue_wait=queue_wait, hostname=received.hostname,
+                                 submit_time=submit_time)
@@ -0,0 +1,130 @@
+"""
+Pre-staging of job inputs
+
+Downloads inputs of jobs that are about to be submitted from remote storage
+into a staging directory ahead of time, so that jobs pulling those inputs
+can link to the staged copy instead of downloading them once started.
+
+Only stores of remote storage systems, for which `is_remote` is set, are
+staged.  Such stores implement `get_size` and `stage`, and pull from their
+`staged_filename` if it exists.
+
+"""
+
+import os
+import logging
+import shutil
+import threading
+import multiprocessing.pool
+
+import pypeliner.helpers
+
+
+class StagedInput(object):
+    """ Input staged for one or more jobs. """
+    def __init__(self, filename, staged_filename, size):
+        self.filename = filename
+        self.staged_filename = staged_filename
+        self.size = size
+        self.job_names = set()
+        self.done = threading.Event()
+        self.failed = False
+
+
+class InputStager(object):
+    """ Stage inputs of upcoming jobs in a pool of background threads, limited
+    to a total size of staged inputs.
+
+    :param staging_dir: directory in which to stage inputs
+    :param max_bytes: maximum total size of staged inputs, or None for no limit
+    :param num_threads: number of concurrent downloads
+
+    """
+    def __init__(self, staging_dir, max_bytes=None, num_threads=2):
+        self._logger = logging.getLogger('pypeliner.staging')
+        self.staging_dir = staging_dir
+        self.max_bytes = max_bytes
+        self.staged = dict()
+        self.staged_bytes = 0
+        self.job_inputs = dict()
+        self.staged_jobs = set()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self._pool = multiprocessing.pool.ThreadPool(num_threads)
+
+    def _iter_remote_stores(self, job):
+        for resource in job.input_resources:
+            for store in resource.stores:
+                if store.is_remote:
+                    yield store
+
+    def _stage(self, store, staged):
+        try:
+            pypeliner.helpers.makedirs(os.path.dirname(staged.staged_filename))
+            store.stage(staged.staged_filename + '.tmp')
+            os.rename(staged.staged_filename + '.tmp', staged.staged_filename)
+        except Exception:
+            staged.failed = True
+            self._logger.exception('staging ' + staged.filename + ' failed')
+        finally:
+            staged.done.set()
+
+    def _purge(self):
+        for filename, staged in self.staged.items():
+            if len(staged.job_names) == 0 and staged.done.is_set():
+                del self.staged[filename]
+                self.staged_bytes -= staged.size
+                pypeliner.helpers.saferemove(staged.staged_filename)
+
+    def stage_jobs(self, jobs):
+        """ Start staging existing remote inputs of jobs, in the order given,
+        until the size limit is reached.
+        """
+        self._purge()
+        for job in jobs:
+            if job.displayname in self.staged_jobs:
+                continue
+            filenames = self.job_inputs.setdefault(job.displayname, set())
+            for store in self._iter_remote_stores(job):
+                if store.filename in self.staged:
+                    self.staged[store.filename].job_names.add(job.displayname)
+                    filenames.add(store.filename)
+                    continue
+                if not store.get_exists():
+                    continue
+                size = store.get_size()
+                if self.max_bytes is not None and self.staged_bytes + size > self.max_bytes:
+                    return
+                staged_filename = os.path.join(self.staging_dir, store.filename.lstrip('/'))
+                staged = StagedInput(store.filename, staged_filename, size)
+                staged.job_names.add(job.displayname)
+                self.staged[store.filename] = staged
+                self.staged_bytes += size
+                filenames.add(store.filename)
+                self._logger.debug('staging ' + store.filename + ' for job ' + job.displayname)
+                self._pool.apply_async(self._stage, (store, staged))
+            self.staged_jobs.add(job.displayname)
+
+    def prepare(self, job):
+        """ Point remote stores of a job at inputs that have finished staging.
+        """
+        for store in self._iter_remote_stores(job):
+            staged = self.staged.get(store.filename)
+            if staged is not None and staged.done.is_set() and not staged.failed:
+                store.staged_filename = staged.staged_filename
+
+    def release(self, job):
+        """ Remove inputs staged for a finished job that are not required by
+        other jobs.
+        """
+        self.staged_jobs.discard(job.displayname)
+        for filename in self.job_inputs.pop(job.displayname, []):
+            self.staged[filename].job_names.discard(job.displayname)
+        self._purge()
+
+    def close(self):
+        """ Wait for inputs being staged, and remove all staged inputs. """
+        self._pool.close()
+        self._pool.join()
+        self.staged.clear()
+        self.staged_bytes = 0
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
@@ -3,6 +3,7 @@ import datetime
 import time
 import shutil
 import shelve
+import weakref
 import importlib
 
 import pypeliner.helpers
@@ -24,15 +25,68 @@ class OutputMissingException(Exception):
 
 
 class RegularFile(object):
-    def __init__(self, filename, exists_cache, createtime_cache, createtime_save, extension=None, direct_write=True):
+    """ A file tracked by modification time.  If `digest_save` is given, the
+    digest of the file's contents is saved with its inode, size and
+    modification time, and a file modified without changing its contents,
+    for instance by a touch or copy, keeps its saved create time.  If
+    `sample_blocks` is given, the digest is calculated from the size and a
+    sample of that many blocks of the file, see
+    :py:func:`pypeliner.helpers.md5_file_sampled`.
+    """
+    is_remote = False
+    __slots__ = ('filename', 'write_filename', 'exists_cache', 'createtime_cache', 'createtime_save', 'digest_save', 'sample_blocks', '__weakref__')
+    def __init__(self, filename, exists_cache, createtime_cache, createtime_save, extension=None, direct_write=True, digest_save=None, sample_blocks=None):
         self.filename = filename
         self.exists_cache = exists_cache
         self.createtime_cache = createtime_cache
         self.createtime_save = createtime_save
+        self.digest_save = digest_save
+        self.sample_blocks = sample_blocks
         self.write_filename = filename + ('.tmp', '')[direct_write]
         if extension is not None:
             self.filename = filename + extension
             self.write_filename = self.write_filename + extension
+    def _stat_key(self):
+        stat = os.stat(self.filename)
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+    def _calculate_digest(self):
+        if self.sample_blocks is not None:
+            return pypeliner.helpers.md5_file_sampled(self.filename, num_blocks=self.sample_blocks).encode('hex')
+        return pypeliner.helpers.md5_file(self.filename).encode('hex')
+    def get_digest(self):
+        """ Hex digest of the contents of the file, only recalculated if the
+        inode, size or modification time changed since it was saved.
+        """
+        if self.digest_save is None:
+            return self._calculate_digest()
+        key = self._stat_key()
+        saved = self.digest_save.get()
+        if saved is not None and saved[0] == key:
+            return saved[1]
+        digest = self._calculate_digest()
+        self.digest_save.set((key, digest))
+        return digest
+    def _read_createtime(self):
+        """ Modification time of the file, or the saved create time if the
+        contents match the saved digest.
+        """
+        if self.digest_save is None:
+            return os.path.getmtime(self.filename)
+        saved = self.digest_save.get()
+        saved_createtime = self.createtime_save.get()
+        digest = self.get_digest()
+        if saved is not None and saved_createtime is not None and saved[1] == digest:
+            return saved_createtime
+        return self.digest_save.get()[0][2]
+    def _update_createtime(self):
+        """ Set the create time to the modification time of the file, saving
+        its digest.
+        """
+        if self.digest_save is not None:
+            self.get_digest()
+        createtime = os.path.getmtime(self.filename)
+        self.createtime_cache.set(createtime)
+        self.createtime_save.set(createtime)
     def allocate(self):
         pypeliner.helpers.makedirs(os.path.dirname(self.filename))
     def push(self):
@@ -41,9 +95,7 @@ class RegularFile(object):
         except OSError:
             raise OutputMissingException(self.write_filename)
         self.exists_cache.set(True)
-        createtime = os.path.getmtime(self.filename)
-        self.createtime_cache.set(createtime)
-        self.createtime_save.set(createtime)
+        self._update_createtime()
     def pull(self):
         if not self.get_exists():
             raise InputMissingException(self.filename)
@@ -58,21 +110,20 @@ class RegularFile(object):
             return None
         createtime = self.createtime_cache.get()
         if createtime is None:
-            createtime = os.path.getmtime(self.filename)
+            createtime = self._read_createtime()
             self.createtime_cache.set(createtime)
             self.createtime_save.set(createtime)
         return createtime
     def touch(self):
         pypeliner.helpers.touch(self.filename)
         self.exists_cache.set(True)
-        createtime = os.path.getmtime(self.filename)
-        self.createtime_cache.set(createtime)
-        self.createtime_save.set(createtime)
+        self._update_createtime()
     def delete(self):
         raise Exception('cannot delete non-temporary files')
 
 
 class RegularTempFile(RegularFile):
+    __slots__ = ()
     def get_createtime(self):
         if super(RegularTempFile, self).get_exists():
             return super(RegularTempFile, self).get_createtime()
@@ -82,27 +133,54 @@ class RegularTempFile(RegularFile):
 
 
 class FileStorage(object):
-    def __init__(self, metadata_prefix=None, **kwargs):
+    """ Storage of regular files, compared by modification time, or if
+    `digests` is set, by the digests of their contents, see
+    :py:class:`RegularFile`.
+    """
+    def __init__(self, metadata_prefix=None, digests=False, **kwargs):
         createtime_shelf_filename = metadata_prefix + 'createtimes.shelf'
         pypeliner.helpers.makedirs(os.path.dirname(createtime_shelf_filename))
         self.cached_exists = pypeliner.flyweight.FlyweightState()
         self.cached_createtimes = pypeliner.flyweight.FlyweightState()
         self.saved_createtimes = pypeliner.flyweight.FlyweightState(
             state_container=shelve.open(createtime_shelf_filename))
+        self.saved_digests = None
+        if digests:
+            self.saved_digests = pypeliner.flyweight.FlyweightState(
+                state_container=shelve.open(metadata_prefix + 'digests.shelf'))
+        self.stores = weakref.WeakValueDictionary()
+    def __getstate__(self):
+        return (self.cached_exists, self.cached_createtimes, self.saved_createtimes, self.saved_digests)
+    def __setstate__(self, state):
+        self.cached_exists, self.cached_createtimes, self.saved_createtimes, self.saved_digests = state
+        self.stores = weakref.WeakValueDictionary()
     def __enter__(self):
         self.cached_exists.__enter__()
         self.cached_createtimes.__enter__()
         self.saved_createtimes.__enter__()
+        if self.saved_digests is not None:
+            self.saved_digests.__enter__()
         return self
     def __exit__(self, exc_type, exc_value, traceback):
         self.cached_exists.__exit__(exc_type, exc_value, traceback)
         self.cached_createtimes.__exit__(exc_type, exc_value, traceback)
         self.saved_createtimes.__exit__(exc_type, exc_value, traceback)
+        if self.saved_digests is not None:
+            self.saved_digests.__exit__(exc_type, exc_value, traceback)
     def _create_store(self, filename, factory, **kwargs):
+        # Stores are immutable, and shared by all resources for the same file
+        key = (filename, factory, kwargs.get('extension'), kwargs.get('direct_write'), kwargs.get('sample_blocks'))
+        store = self.stores.get(key)
+        if store is not None:
+            return store
         exists_cache = self.cached_exists.create_flyweight(filename)
         createtime_cache = self.cached_createtimes.create_flyweight(filename)
         createtime_save = self.saved_createtimes.create_flyweight(filename)
-        return factory(filename, exists_cache, createtime_cache, createtime_save, **kwargs)
+        if self.saved_digests is not None:
+            kwargs['digest_save'] = self.saved_digests.create_flyweight(filename + (kwargs.get('extension') or ''))
+        store = factory(filename, exists_cache, createtime_cache, createtime_save, **kwargs)
+        self.stores[key] = store
+        return store
     def create_store(self, filename, is_temp=False, **kwargs):
         if is_temp:
             return self._create_store(filename, RegularTempFile, **kwargs)
@@ -110,7 +188,7 @@ class FileStorage(object):
             return self._create_store(filename, RegularFile, **kwargs)
 
 
-def create(requested_storage, workflow_dir=None):
+def create(requested_storage, workflow_dir=None, digests=False):
     if requested_storage is None:
         raise Exception('No storage specified')
     elif requested_storage == 'local':
@@ -125,7 +203,7 @@ def create(requested_storage, workflow_dir=None):
     storage_class = vars(storage_module)[storage_class_name]
 
     file_storage_prefix = os.path.join(workflow_dir, 'files_')
-    storage = storage_class(metadata_prefix=file_storage_prefix)
+    storage = storage_class(metadata_prefix=file_storage_prefix, digests=digests)
 
     return storage
 
@@ -3,6 +3,7 @@ import os
 import time
 
 import pypeliner
+import pypeliner.history
 import pypeliner.workflow
 import pypeliner.managed as mgd
 
@@ -188,7 +189,34 @@ def create_workflow_1(input_filename, output_filename):
     return workflow
 
 
-def touch(f):
+def create_workflow_independent_jobs(num_jobs, *args):
+    workflow = pypeliner.workflow.Workflow(default_ctx={'mem':1})
+
+    for idx in xrange(num_jobs):
+        workflow.transform(
+            name='do_nothing_{}'.format(idx),
+            func=do_nothing)
+
+    return workflow
+
+
+def create_workflow_after_file(filename, *args):
+    start = time.time()
+    while not os.path.exists(filename):
+        if time.time() - start > 60:
+            raise Exception('timed out waiting for ' + filename)
+        time.sleep(0.1)
+
+    workflow = pypeliner.workflow.Workflow(default_ctx={'mem':1})
+
+    workflow.transform(
+        name='do_nothing',
+        func=do_nothing)
+
+    return workflow
+
+
+def touch(f, *args):
     with open(f, 'w'):
         pass
         
@@ -197,6 +225,22 @@ def checkexists(f):
     assert os.path.exists(f)
 
 
+def write_pid(f, *args):
+    with open(f, 'w') as pid_file:
+        pid_file.write(str(os.getpid()))
+
+
+def record_peak_fail_once(history_filename, task_name, memory, f):
+    # Record a larger peak as if by another instance of the task, then fail
+    if os.path.exists(f):
+        return
+    run_history = pypeliner.history.RunHistory(history_filename)
+    run_history.record(task_name, '', task_name, 0, 'success', memory=memory)
+    run_history.close()
+    touch(f)
+    raise Exception('failed once')
+
+
 def job1(i1, o1, o2, o3):
     checkexists(i1)
     touch(o1)
@@ -0,0 +1,393 @@
+import unittest
+import shutil
+import os
+import tempfile
+
+import pypeliner.database
+import pypeliner.graph
+import pypeliner.identifiers
+import pypeliner.runskip
+import pypeliner.storage
+import pypeliner.workflow
+import pypeliner.managed as mgd
+
+from pypeliner.tests.tasks import *
+
+
+class GraphResource(object):
+    is_temp = False
+    exists = True
+    createtime = 0
+    def __init__(self, name, node=pypeliner.identifiers.Node()):
+        self.id = (name, node)
+
+
+class GraphJob(object):
+    def __init__(self, name, inputs, outputs, node=pypeliner.identifiers.Node()):
+        self.id = (node, name)
+        self.displayname = '/' + node.displayname + '/' + name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.is_required_downstream = False
+    @property
+    def output_resources(self):
+        return iter(self.outputs)
+    def out_of_date(self):
+        return False
+
+
+class StatusJob(GraphJob):
+    """ Job with a settable out of date status, counting status queries """
+    def __init__(self, name, inputs, outputs, is_out_of_date=False):
+        GraphJob.__init__(self, name, inputs, outputs)
+        self.is_out_of_date = is_out_of_date
+        self.num_out_of_date_calls = 0
+    def out_of_date(self):
+        self.num_out_of_date_calls += 1
+        return self.is_out_of_date
+
+
+def create_chain_graph(num_jobs, out_of_date=()):
+    """ Graph of jobs each depending on the output of the previous job, with
+    the jobs at the given indices out of date.
+    """
+    resources = [GraphResource('input')] + [GraphResource('output_{0}'.format(idx)) for idx in xrange(num_jobs)]
+    jobs = [StatusJob('job_{0}'.format(idx), [resources[idx]], [resources[idx + 1]], is_out_of_date=idx in out_of_date)
+        for idx in xrange(num_jobs)]
+    graph = pypeliner.graph.DependencyGraph()
+    graph.regenerate(dict([(job.id, job) for job in jobs]))
+    return graph, jobs
+
+
+def create_split_merge_graph(num_chunks):
+    split_outputs = []
+    jobs = []
+    merge_inputs = []
+    for chunk in xrange(num_chunks):
+        node = pypeliner.identifiers.Node() + pypeliner.identifiers.AxisInstance('chunk', chunk)
+        split_file = GraphResource('split', node)
+        transform_file = GraphResource('transform', node)
+        split_outputs.append(split_file)
+        merge_inputs.append(transform_file)
+        jobs.append(GraphJob('transform', [split_file], [transform_file], node=node))
+    jobs.append(GraphJob('split', [GraphResource('input')], split_outputs))
+    jobs.append(GraphJob('merge', merge_inputs, [GraphResource('output')]))
+    graph = pypeliner.graph.DependencyGraph()
+    graph.regenerate(dict([(job.id, job) for job in jobs]))
+    return graph
+
+
+class graph_test(unittest.TestCase):
+
+    def test_traverse_forward(self):
+
+        graph = create_split_merge_graph(100)
+
+        created = set(graph.inputs)
+        for job in graph.traverse_jobs_forward():
+            for input in job.inputs:
+                self.assertIn(input.id, created)
+            created.update([output.id for output in job.outputs])
+
+        self.assertEqual(len(graph.jobs_forward), 102)
+        self.assertEqual(graph.jobs_forward[0].id[1], 'split')
+        self.assertEqual(graph.jobs_forward[-1].id[1], 'merge')
+
+    def test_traverse_reverse(self):
+
+        graph = create_split_merge_graph(100)
+
+        visited_jobs = set()
+        for job in graph.traverse_jobs_reverse():
+            for output in job.outputs:
+                for dependent_job_id in graph.dependant_jobs[output.id]:
+                    self.assertIn(dependent_job_id, visited_jobs)
+            visited_jobs.add(job.id)
+
+        self.assertEqual(len(graph.jobs_reverse), 102)
+        self.assertEqual(graph.jobs_reverse[0].id[1], 'merge')
+        self.assertEqual(graph.jobs_reverse[-1].id[1], 'split')
+
+    def test_pop_next_job(self):
+
+        graph = create_split_merge_graph(10)
+
+        split_job = graph.pop_next_job()
+        self.assertEqual(split_job.id[1], 'split')
+        self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+
+        graph.notify_completed(split_job.id)
+
+        transform_jobs = [graph.pop_next_job() for _ in xrange(10)]
+        self.assertEqual(set([job.id[1] for job in transform_jobs]), set(['transform']))
+        self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+
+        for job in transform_jobs:
+            graph.notify_completed(job.id)
+
+        merge_job = graph.pop_next_job()
+        self.assertEqual(merge_job.id[1], 'merge')
+        graph.notify_completed(merge_job.id)
+
+        self.assertTrue(graph.finished)
+
+    def test_ready_queue_regenerate(self):
+
+        graph = create_split_merge_graph(4)
+
+        split_job = graph.pop_next_job()
+        graph.notify_completed(split_job.id)
+        running_jobs = [graph.pop_next_job() for _ in xrange(2)]
+
+        # Running and completed jobs are not ready again after regenerating,
+        # and a new job with created inputs is ready
+        jobs = dict(graph.jobs)
+        extra_job = GraphJob('extra', [split_job.outputs[0]], [GraphResource('extra')])
+        jobs[extra_job.id] = extra_job
+        graph.regenerate(jobs)
+
+        ready_jobs = [graph.pop_next_job() for _ in xrange(3)]
+        self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+        self.assertEqual(sorted(job.id[1] for job in ready_jobs), ['extra', 'transform', 'transform'])
+
+        transform_jobs = running_jobs + [job for job in ready_jobs if job.id[1] == 'transform']
+        self.assertEqual(len(set(job.id for job in transform_jobs)), 4)
+
+        # The merge is ready only once all of its inputs are created
+        for job in transform_jobs[:-1]:
+            graph.notify_completed(job.id)
+            self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+        graph.notify_completed(transform_jobs[-1].id)
+        self.assertEqual(graph.pop_next_job().id[1], 'merge')
+
+    def test_ready_queue_no_inputs(self):
+
+        # Jobs with no inputs run before all other jobs
+        no_inputs_job = GraphJob('no_inputs', [], [GraphResource('created')])
+        input_job = GraphJob('input', [GraphResource('input')], [GraphResource('output')])
+        graph = pypeliner.graph.DependencyGraph()
+        graph.regenerate(dict([(job.id, job) for job in (no_inputs_job, input_job)]))
+
+        self.assertEqual(graph.pop_next_job().id[1], 'no_inputs')
+        self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+
+        graph.regenerate(dict(graph.jobs))
+        self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+
+        graph.notify_completed(no_inputs_job.id)
+        self.assertEqual(graph.pop_next_job().id[1], 'input')
+
+    def test_stale_completed(self):
+
+        graph, jobs = create_chain_graph(3, out_of_date=(0,))
+        self.assertEqual(graph.stale, set([job.id for job in jobs]))
+
+        # Dependants are up to date if a completed job did not recreate its outputs
+        graph.notify_completed(graph.pop_next_job().id)
+        self.assertEqual(graph.stale, set())
+        self.assertEqual([job.num_out_of_date_calls for job in jobs], [1, 1, 1])
+
+        graph, jobs = create_chain_graph(3, out_of_date=(0,))
+
+        # Dependants of recreated outputs are queried, jobs with stale inputs
+        # are stale without being queried
+        job = graph.pop_next_job()
+        job.outputs[0].createtime = 1
+        jobs[1].is_out_of_date = True
+        graph.notify_completed(job.id)
+        self.assertEqual(graph.stale, set([jobs[1].id, jobs[2].id]))
+        self.assertEqual([job.num_out_of_date_calls for job in jobs], [1, 1, 0])
+
+    def test_stale_regenerate(self):
+
+        graph, jobs = create_chain_graph(3, out_of_date=(2,))
+        self.assertEqual(graph.stale, set([jobs[2].id]))
+        self.assertEqual(graph.required, set())
+
+        # Missing outputs upstream of a stale job are required, and retained
+        # job instances keep their cached status
+        jobs[0].outputs[0].exists = False
+        jobs[1].outputs[0].exists = False
+        graph.regenerate(dict(graph.jobs))
+        self.assertEqual(graph.required, set([jobs[0].id, jobs[1].id]))
+        self.assertEqual([job.num_out_of_date_calls for job in jobs], [1, 1, 1])
+
+        # Recreated job instances are queried again
+        new_job = StatusJob('job_1', jobs[1].inputs, jobs[1].outputs, is_out_of_date=True)
+        regenerated_jobs = dict(graph.jobs)
+        regenerated_jobs[new_job.id] = new_job
+        graph.regenerate(regenerated_jobs)
+        self.assertEqual(graph.stale, set([jobs[1].id, jobs[2].id]))
+        self.assertEqual(graph.required, set([jobs[0].id, jobs[1].id]))
+        self.assertEqual(new_job.num_out_of_date_calls, 1)
+        self.assertEqual(jobs[1].num_out_of_date_calls, 1)
+
+        # Completing a required job creates its output, no longer required
+        job = graph.pop_next_job()
+        self.assertTrue(job.is_required_downstream)
+        job.outputs[0].exists = True
+        graph.notify_completed(job.id)
+        self.assertEqual(graph.required, set([jobs[1].id]))
+        self.assertEqual(graph.stale, set([jobs[1].id, jobs[2].id]))
+
+    def test_stale_retried(self):
+
+        graph, jobs = create_chain_graph(2)
+        self.assertEqual(graph.stale, set())
+
+        # Output times are recorded when first popped, so outputs recreated by
+        # a failed attempt, before a retry completes, invalidate dependants,
+        # and the running job is not ready after regenerating
+        job = graph.pop_next_job()
+        job.outputs[0].createtime = 1
+        graph.regenerate(dict(graph.jobs))
+        self.assertRaises(pypeliner.graph.NoJobs, graph.pop_next_job)
+
+        jobs[1].is_out_of_date = True
+        graph.notify_completed(job.id)
+        self.assertEqual(graph.stale, set([jobs[1].id]))
+        self.assertEqual(jobs[1].num_out_of_date_calls, 2)
+        self.assertEqual(graph.pop_next_job().id, jobs[1].id)
+
+    def test_pop_next_job_critical_path(self):
+
+        jobs = [
+            GraphJob('short', [GraphResource('input')], [GraphResource('short_output')]),
+            GraphJob('long_1', [GraphResource('input')], [GraphResource('long_output_1')]),
+            GraphJob('long_2', [GraphResource('long_output_1')], [GraphResource('long_output_2')]),
+        ]
+        weights = {'short': 5, 'long_1': 2, 'long_2': 4}
+
+        graph = pypeliner.graph.DependencyGraph(job_weight=lambda job: weights[job.id[1]])
+        graph.regenerate(dict([(job.id, job) for job in jobs]))
+
+        self.assertEqual(graph.job_priority[jobs[1].id], 6)
+        self.assertEqual(graph.pop_next_job().id[1], 'long_1')
+        self.assertEqual(graph.pop_next_job().id[1], 'short')
+
+    def test_upcoming_jobs(self):
+
+        graph = create_split_merge_graph(10)
+
+        upcoming = graph.get_upcoming_jobs(5)
+        self.assertEqual([job.id[1] for job in upcoming], ['split'])
+
+        split_job = graph.pop_next_job()
+        upcoming = graph.get_upcoming_jobs(5)
+        self.assertEqual(len(upcoming), 5)
+        self.assertEqual(set([job.id[1] for job in upcoming]), set(['transform']))
+
+        graph.notify_completed(split_job.id)
+        transform_jobs = [graph.pop_next_job() for _ in xrange(9)]
+        upcoming = graph.get_upcoming_jobs(5)
+        self.assertEqual([job.id[1] for job in upcoming], ['transform'])
+
+        graph.pop_next_job()
+        upcoming = graph.get_upcoming_jobs(5)
+        self.assertEqual([job.id[1] for job in upcoming], ['merge'])
+
+    def test_cycle(self):
+
+        # Cycle between instances of the last chunk only
+        jobs = []
+        for chunk in xrange(10):
+            node = pypeliner.identifiers.Node() + pypeliner.identifiers.AxisInstance('chunk', chunk)
+            inputs = [GraphResource('input', node)]
+            if chunk == 9:
+                inputs.append(GraphResource('b', node))
+            jobs.append(GraphJob('a', inputs, [GraphResource('a', node)], node=node))
+            jobs.append(GraphJob('b', [GraphResource('a', node)], [GraphResource('b', node)], node=node))
+
+        graph = pypeliner.graph.DependencyGraph()
+        with self.assertRaises(pypeliner.graph.DependencyCycleException) as context:
+            graph.regenerate(dict([(job.id, job) for job in jobs]))
+        self.assertIn('chunk:9/a', str(context.exception))
+
+
+class workflow_instance_test(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.workflow_dir = os.path.join(self.temp_dir, 'pipeline')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_regenerate_updated_axes(self):
+
+        workflow = pypeliner.workflow.Workflow()
+
+        workflow.setobj(obj=mgd.OutputChunks('a'), value=[1, 2])
+        workflow.setobj(obj=mgd.OutputChunks('b'), value=[1, 2])
+
+        workflow.transform(
+            name='on_a',
+            axes=('a',),
+            func=do_stuff,
+            ret=mgd.TempOutputObj('a_obj', 'a'),
+            args=('a',))
+
+        workflow.transform(
+            name='merge_a',
+            func=merge_stuff,
+            ret=mgd.TempOutputObj('a_merged'),
+            args=(mgd.TempInputObj('a_obj', 'a'),))
+
+        workflow.transform(
+            name='on_b',
+            axes=('b',),
+            func=do_stuff,
+            ret=mgd.TempOutputObj('b_obj', 'b'),
+            args=('b',))
+
+        storage = pypeliner.storage.create('local', self.workflow_dir)
+        with storage, pypeliner.database.WorkflowDatabaseFactory(
+                os.path.join(self.temp_dir, 'tmp'), self.workflow_dir,
+                os.path.join(self.temp_dir, 'log'), storage) as db_factory:
+
+            workflow_instance = pypeliner.graph.WorkflowInstance(workflow, db_factory, pypeliner.runskip.BasicRunSkip())
+            nodemgr = workflow_instance.db.nodemgr
+            root = pypeliner.identifiers.Node()
+
+            def get_jobs():
+                return dict(workflow_instance.graph.jobs)
+
+            def get_chunks(jobs, name):
+                return sorted(job_id[0][0][1] for job_id in jobs if job_id[1] == name)
+
+            nodemgr.store_axis_chunks('a', root, [1, 2])
+            nodemgr.store_axis_chunks('b', root, [1, 2])
+            workflow_instance.regenerate()
+            jobs = get_jobs()
+
+            self.assertEqual(get_chunks(jobs, 'on_a'), [1, 2])
+            self.assertEqual(get_chunks(jobs, 'on_b'), [1, 2])
+
+            # Storing the same chunks keeps all instances
+            nodemgr.store_axis_chunks('a', root, [2, 1])
+            workflow_instance.regenerate()
+            regenerated_jobs = get_jobs()
+
+            self.assertEqual(set(regenerated_jobs), set(jobs))
+            for job_id, job in jobs.iteritems():
+                self.assertIs(regenerated_jobs[job_id], job)
+
+            # Updating axis a recreates instances depending on a, directly or
+            # through their arguments, and keeps instances on axis b
+            nodemgr.store_axis_chunks('a', root, [1, 2, 3])
+            workflow_instance.regenerate()
+            regenerated_jobs = get_jobs()
+
+            self.assertEqual(get_chunks(regenerated_jobs, 'on_a'), [1, 2, 3])
+            self.assertEqual(get_chunks(regenerated_jobs, 'on_b'), [1, 2])
+            for job_id, job in jobs.iteritems():
+                if job_id[1] == 'on_b':
+                    self.assertIs(regenerated_jobs[job_id], job)
+                elif job_id[1] in ('on_a', 'merge_a'):
+                    self.assertIsNot(regenerated_jobs.get(job_id), job)
+
+            self.assertEqual(nodemgr.pop_updated_axes(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import os
+import subprocess
+import sys
+
+
+script_directory = os.path.dirname(os.path.abspath(__file__))
+package_directory = os.path.dirname(os.path.dirname(script_directory))
+
+
+def run_python(script):
+    """ Run a script in a fresh interpreter, returning its stripped output. """
+    return subprocess.check_output([sys.executable, '-c', script], cwd=package_directory).strip()
+
+
+class import_test(unittest.TestCase):
+
+    def test_submodule_not_imported(self):
+        output = run_python(
+            'import sys, pypeliner.delegator\n'
+            'print "pypeliner.scheduler" in sys.modules\n')
+        self.assertEqual(output, 'False')
+
+    def test_package_module(self):
+        output = run_python(
+            'import sys, types, pypeliner\n'
+            'assert type(sys.modules["pypeliner"]) is types.ModuleType\n'
+            'assert pypeliner.app.Pypeline is sys.modules["pypeliner.app"].Pypeline\n'
+            'assert pypeliner.app is sys.modules["pypeliner.app"]\n'
+            'assert pypeliner.execqueue.factory.create is not None\n'
+            'reload(pypeliner)\n'
+            'assert pypeliner.app is sys.modules["pypeliner.app"]\n'
+            'print isinstance(pypeliner.__version__, str)\n')
+        self.assertEqual(output, 'True')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import sys
+import threading
+
+import pypeliner.execqueue.inprocess
+
+
+class StagedJob(object):
+    def __init__(self):
+        self.threads = dict()
+    def stage_in(self):
+        self.threads['stage_in'] = threading.current_thread()
+    def __call__(self):
+        self.threads['call'] = threading.current_thread()
+        sys.stdout.write('')
+    def stage_out(self):
+        self.threads['stage_out'] = threading.current_thread()
+
+
+class inprocess_test(unittest.TestCase):
+
+    def test_staged_in_calling_thread(self):
+        exec_queue = pypeliner.execqueue.inprocess.InProcessJobQueue(num_threads=2)
+
+        with exec_queue:
+            exec_queue.send({'mem': 1}, 'staged', StagedJob(), None)
+            self.assertEqual(exec_queue.wait(), 'staged')
+            job = exec_queue.receive('staged')
+            self.assertTrue(exec_queue.empty)
+
+        self.assertIs(job.threads['stage_in'], threading.current_thread())
+        self.assertIs(job.threads['stage_out'], threading.current_thread())
+        self.assertIsNot(job.threads['call'], threading.current_thread())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import shutil
+import os
+import subprocess
+import sys
+import tempfile
+
+import pypeliner.execqueue.qsub
+import pypeliner.execqueue.utils
+import pypeliner.helpers
+
+
+# Runs each task of an array in turn, printing the job id as sge or pbs pro
+fake_qsub = """#!/bin/bash
+echo "$@" >> "$(dirname "$0")/qsub.log"
+array_option=
+num_tasks=1
+sync=n
+while [ $# -gt 1 ]; do
+    case "$1" in
+        -t|-J) array_option="$1"; num_tasks="${2#1-}"; shift 2 ;;
+        -sync) sync="$2"; shift 2 ;;
+        *) shift ;;
+    esac
+done
+for task_id in $(seq 1 $num_tasks); do
+    if [ "$array_option" == "-J" ]; then
+        PBS_ARRAY_INDEX=$task_id "$1"
+    else
+        SGE_TASK_ID=$task_id "$1"
+    fi
+done
+if [ "$array_option" == "-J" ]; then
+    echo "1[].server"
+elif [ "$sync" == "n" ]; then
+    echo "Your job-array 1.1-$num_tasks:1 (\\"array\\") has been submitted"
+fi
+"""
+
+
+# No jobs are listed as running
+fake_qstat = """#!/bin/bash
+exit 0
+"""
+
+
+class ArrayJob(object):
+    def __init__(self):
+        self.success = False
+    def __call__(self):
+        self.success = True
+
+
+class qsub_test(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bin_dir = os.path.join(self.temp_dir, 'bin')
+        pypeliner.helpers.makedirs(self.bin_dir)
+        for name, script in (('qsub', fake_qsub), ('qstat', fake_qstat), ('qacct', fake_qstat), ('qdel', fake_qstat)):
+            with open(os.path.join(self.bin_dir, name), 'w') as script_file:
+                script_file.write(script)
+            pypeliner.helpers.set_executable(os.path.join(self.bin_dir, name))
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.temp_dir)
+
+    def read_qsub_log(self):
+        with open(os.path.join(self.bin_dir, 'qsub.log'), 'r') as qsub_log:
+            return [line.split() for line in qsub_log]
+
+    def run_array(self, exec_queue, num_jobs=3):
+        names = ['array_{0}'.format(idx) for idx in xrange(num_jobs)]
+        temps_dirs = [os.path.join(self.temp_dir, 'temps dir', name) for name in names]
+        for temps_dir in temps_dirs:
+            pypeliner.helpers.makedirs(temps_dir)
+
+        with exec_queue:
+            exec_queue.send_array({'mem': 1}, names, [ArrayJob() for name in names], temps_dirs)
+            self.assertEqual(exec_queue.length, num_jobs)
+
+            finished = set()
+            while not exec_queue.empty:
+                name = exec_queue.wait()
+                self.assertTrue(exec_queue.receive(name).success)
+                finished.add(name)
+
+        self.assertEqual(finished, set(names))
+
+    def test_qsub_array(self):
+        # Synchronous qsub only reports completion of a whole array, so jobs
+        # are submitted separately
+        self.run_array(pypeliner.execqueue.qsub.QsubJobQueue([sys.modules[__name__]], native_spec=''))
+        submit_commands = self.read_qsub_log()
+        self.assertEqual(len(submit_commands), 3)
+        for submit_command in submit_commands:
+            self.assertNotIn('-t', submit_command)
+
+    def test_asyncqsub_array(self):
+        self.run_array(pypeliner.execqueue.qsub.AsyncQsubJobQueue([sys.modules[__name__]], native_spec=''))
+        submit_command = self.read_qsub_log()[0]
+        self.assertEqual(submit_command[submit_command.index('-t') + 1], '1-3')
+
+    def test_pbs_array(self):
+        self.run_array(pypeliner.execqueue.qsub.PbsJobQueue([sys.modules[__name__]], native_spec=''))
+        submit_command = self.read_qsub_log()[0]
+        self.assertEqual(submit_command[submit_command.index('-J') + 1], '1-3')
+        self.assertNotIn('-t', submit_command)
+
+    def test_array_script_quoting(self):
+        output_filename = os.path.join(self.temp_dir, 'output $HOME; "quoted"')
+        script_filename = os.path.join(self.temp_dir, 'array.sh')
+        pypeliner.execqueue.utils.write_array_script(
+            script_filename,
+            [['echo', 'first'], ['echo', 'two words', '$HOME', "it's"]],
+            [output_filename] * 2,
+            [os.devnull] * 2)
+
+        env = dict(os.environ, SGE_TASK_ID='2')
+        subprocess.check_call(['bash', script_filename], env=env)
+
+        with open(output_filename, 'r') as output_file:
+            self.assertEqual(output_file.read(), "two words $HOME it's\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -36,6 +36,31 @@ def run_basic(exec_queue, base_temps_dir):
     print 'success'
 
 
+def run_array(exec_queue, base_temps_dir, num_jobs=4):
+
+    assert exec_queue.empty
+
+    names = ['array_{}'.format(idx) for idx in xrange(num_jobs)]
+    jobs = [test_queue.BasicJob() for name in names]
+    temps_dirs = [os.path.join(base_temps_dir, name) for name in names]
+    for temps_dir in temps_dirs:
+        pypeliner.helpers.makedirs(temps_dir)
+    exec_queue.send_array({'mem': 1}, names, jobs, temps_dirs)
+
+    assert exec_queue.length == num_jobs
+
+    finished = set()
+    while not exec_queue.empty:
+        name = exec_queue.wait()
+        recieved = exec_queue.receive(name)
+        assert recieved.success == True
+        finished.add(name)
+
+    assert finished == set(names)
+
+    print 'success'
+
+
 if __name__ == '__main__':
     import test_queue
 
@@ -62,5 +87,6 @@ if __name__ == '__main__':
 
     with exec_queue:
         run_basic(exec_queue, base_temps_dir)
+        run_array(exec_queue, base_temps_dir)
 
 
@@ -1,10 +1,16 @@
 import unittest
+import collections
 import shutil
 import os
+import sys
 import logging
+import shelve
 import time
 
 import pypeliner
+import pypeliner.execqueue.local
+import pypeliner.history
+import pypeliner.instrument
 import pypeliner.runskip
 import pypeliner.workflow
 import pypeliner.managed as mgd
@@ -16,6 +22,16 @@ script_directory = os.path.dirname(os.path.abspath(__file__))
 pipeline_dir = os.path.join(script_directory, 'pipeline')
 
 
+class MemRecordingJobQueue(pypeliner.execqueue.local.LocalJobQueue):
+    """ Local queue recording the memory requested for each job sent """
+    def __init__(self, modules=None):
+        super(MemRecordingJobQueue, self).__init__(modules)
+        self.mems = collections.defaultdict(list)
+    def send(self, ctx, name, sent, temps_dir):
+        self.mems[name].append(ctx['mem'])
+        super(MemRecordingJobQueue, self).send(ctx, name, sent, temps_dir)
+
+
 class scheduler_test(unittest.TestCase):
 
     input_filename = os.path.join(script_directory, 'scheduler_test.input')
@@ -47,6 +63,8 @@ class scheduler_test(unittest.TestCase):
 
     ctx = dict({'mem':1})
 
+    lazy_jobs = False
+
     def setUp(self):
 
         try:
@@ -71,18 +89,23 @@ class scheduler_test(unittest.TestCase):
             except OSError:
                 pass
 
-    def run_workflow(self, workflow, cleanup=None, runskip=None):
+    def run_workflow(self, workflow, cleanup=None, runskip=None, max_mem=None, max_cpus=None, cache_dir=None, digests=False, exec_queue=None):
 
         scheduler = pypeliner.scheduler.Scheduler()
         scheduler.workflow_dir = pipeline_dir
         scheduler.temps_dir = os.path.join(pipeline_dir, 'tmp')
         scheduler.max_jobs = 10
+        scheduler.max_mem = max_mem
+        scheduler.max_cpus = max_cpus
+        scheduler.lazy_jobs = self.lazy_jobs
+        scheduler.cache_dir = cache_dir
 
         if cleanup is not None:
             scheduler.cleanup = cleanup
 
-        exec_queue = pypeliner.execqueue.factory.create('local', [pypeliner.tests.tasks])
-        storage = pypeliner.storage.create('local', pipeline_dir)
+        if exec_queue is None:
+            exec_queue = pypeliner.execqueue.factory.create('local', [pypeliner.tests.tasks])
+        storage = pypeliner.storage.create('local', pipeline_dir, digests=digests)
 
         if runskip is None:
             runskip = pypeliner.runskip.BasicRunSkip()
@@ -245,6 +268,545 @@ class scheduler_test(unittest.TestCase):
 
         self.assertEqual(output, ['line1\n', 'line2\n', 'line3\n', 'line4\n', 'line5\n', 'line6\n', 'line7\n', 'line8\n', 'line1\n', 'line2\n', 'line3\n', 'line4\n', 'line5\n', 'line6\n', 'line7\n', 'line8\n'])
 
+    def test_run_history(self):
+
+        workflow = pypeliner.workflow.Workflow()
+
+        workflow.transform(
+            name='read',
+            func=do_file_stuff,
+            args=(
+                mgd.InputFile(self.input_filename),
+                mgd.OutputFile(self.output_filename),
+                'a',
+            )
+        )
+
+        self.run_workflow(workflow)
+
+        run_history = pypeliner.history.RunHistory(os.path.join(pipeline_dir, 'history.db'))
+        runs = run_history.query(task_name='read')
+        run_history.close()
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0]['status'], 'success')
+        self.assertEqual(runs[0]['attempt'], 0)
+        self.assertIsNotNone(runs[0]['duration'])
+        self.assertIsNotNone(runs[0]['queue_wait'])
+
+        stats = pypeliner.instrument.stats.as_dict()
+        self.assertEqual(stats['counters']['jobs.completed'], 1)
+        self.assertEqual(stats['timers']['exec_queue.send']['calls'], 1)
+        self.assertIn('graph.pop_next_job', stats['timers'])
+
+    def test_mem_history(self):
+
+        pypeliner.helpers.makedirs(pipeline_dir)
+        history_filename = os.path.join(pipeline_dir, 'history.db')
+
+        # Memory of failed attempts is not used in predictions
+        run_history = pypeliner.history.RunHistory(history_filename)
+        for task_name in ('lowered', 'floored'):
+            run_history.record(task_name, '', task_name, 0, 'success', memory=2.2)
+            run_history.record(task_name, '', task_name, 1, 'fail', memory=10.)
+        run_history.close()
+
+        workflow = pypeliner.workflow.Workflow(default_ctx={'mem': 8, 'mem_history_factor': 1.5, 'mem_retry_factor': 1})
+
+        workflow.transform(
+            name='lowered',
+            func=do_nothing)
+
+        workflow.transform(
+            name='floored',
+            ctx={'mem_history_min': 6},
+            func=do_nothing)
+
+        # No recorded peak on submit, a larger peak recorded before the retry
+        workflow.transform(
+            name='retried',
+            ctx={'mem': 4},
+            func=record_peak_fail_once,
+            args=(history_filename, 'retried', 5., os.path.join(pipeline_dir, 'retried.failed')))
+
+        exec_queue = MemRecordingJobQueue([pypeliner.tests.tasks])
+        self.run_workflow(workflow, exec_queue=exec_queue)
+
+        self.assertEqual(exec_queue.mems['/lowered'], [4])
+        self.assertEqual(exec_queue.mems['/floored'], [6])
+        self.assertEqual(exec_queue.mems['/retried'], [4, 8])
+
+    def plan_workflow(self, workflow):
+
+        scheduler = pypeliner.scheduler.Scheduler()
+        scheduler.workflow_dir = pipeline_dir
+        scheduler.temps_dir = os.path.join(pipeline_dir, 'tmp')
+        scheduler.max_jobs = 10
+
+        storage = pypeliner.storage.create('local', pipeline_dir)
+
+        with storage:
+            return scheduler.plan(workflow, storage, pypeliner.runskip.BasicRunSkip())
+
+    def test_plan(self):
+
+        input_filename = os.path.join(pipeline_dir, 'plan.input')
+        pypeliner.helpers.makedirs(pipeline_dir)
+        shutil.copyfile(self.input_filename, input_filename)
+        os.utime(input_filename, (time.time() - 100, time.time() - 100))
+
+        workflow = pypeliner.workflow.Workflow()
+
+        workflow.transform(
+            name='step1',
+            func=copy_file,
+            args=(
+                mgd.InputFile(input_filename),
+                mgd.TempOutputFile('copy1')))
+
+        workflow.transform(
+            name='step2',
+            func=copy_file,
+            args=(
+                mgd.TempInputFile('copy1'),
+                mgd.OutputFile(self.output_filename)))
+
+        plan = self.plan_workflow(workflow)
+
+        self.assertEqual(plan.summary['num_run'], 2)
+        self.assertEqual(plan.summary['num_skip'], 0)
+        self.assertEqual(plan.summary['num_unknown_duration'], 2)
+        self.assertFalse(os.path.exists(self.output_filename))
+
+        self.run_workflow(workflow, cleanup=False)
+
+        plan = self.plan_workflow(workflow)
+
+        self.assertEqual(plan.summary['num_run'], 0)
+        self.assertEqual(plan.summary['num_skip'], 2)
+
+        # Modifying the input reruns both jobs, with recorded durations
+        os.utime(input_filename, None)
+
+        plan = self.plan_workflow(workflow)
+
+        self.assertEqual([entry['run'] for entry in plan.entries], [True, True])
+        self.assertEqual(plan.entries[1]['reason'], 'inputs recreated by planned jobs')
+        self.assertEqual(plan.summary['num_unknown_duration'], 0)
+        self.assertGreaterEqual(plan.summary['critical_path'], plan.entries[0]['duration'])
+
+    def create_plan_setobj_workflow(self, value, chunks):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.setobj(obj=mgd.TempOutputObj('value'), value=value)
+        workflow.setobj(obj=mgd.OutputChunks('byfile'), value=chunks)
+
+        workflow.transform(
+            name='write',
+            axes=('byfile',),
+            func=write_stuff,
+            args=(
+                mgd.TempInputObj('value'),
+                mgd.OutputFile(os.path.join(pipeline_dir, 'plan.{byfile}.output'), 'byfile')))
+
+        workflow.subworkflow(
+            name='subworkflow',
+            func=create_workflow_independent_jobs,
+            args=(2,))
+
+        return workflow
+
+    def snapshot_dirs(self, *dirs):
+        """ Modification times and contents of files, with shelves compared by
+        their entries, as the dbm files of a shelf depend on the order entries
+        were written.
+        """
+        snapshot = dict()
+        for base_dir in dirs:
+            for dirpath, dirnames, filenames in os.walk(base_dir):
+                snapshot[dirpath] = None
+                for filename in filenames:
+                    filename = os.path.join(dirpath, filename)
+                    if '.shelf' in filename:
+                        shelf_filename = filename[:filename.index('.shelf') + len('.shelf')]
+                        snapshot[shelf_filename] = dict(shelve.open(shelf_filename, 'r'))
+                        continue
+                    with open(filename, 'rb') as f:
+                        snapshot[filename] = (os.path.getmtime(filename), f.read())
+        return snapshot
+
+    def test_plan_unchanged(self):
+
+        self.run_workflow(self.create_plan_setobj_workflow('a', (1, 2)))
+
+        logs_dir = pypeliner.scheduler.Scheduler().logs_dir
+        snapshot = self.snapshot_dirs(pipeline_dir, logs_dir)
+
+        plan = self.plan_workflow(self.create_plan_setobj_workflow('a', (1, 2)))
+
+        objects = [entry['run'] for entry in plan.entries if entry['type'] == 'object']
+        self.assertEqual(objects, [False, False])
+        self.assertEqual(plan.summary['num_subworkflows'], 1)
+
+        # Changed objects and chunks are planned but not set
+        plan = self.plan_workflow(self.create_plan_setobj_workflow('b', (1, 2, 3)))
+
+        objects = [entry['run'] for entry in plan.entries if entry['type'] == 'object']
+        self.assertEqual(objects, [True, True])
+        writes = [entry['run'] for entry in plan.entries if entry['task'] == 'write']
+        self.assertEqual(writes, [True, True])
+
+        self.assertEqual(self.snapshot_dirs(pipeline_dir, logs_dir), snapshot)
+
+    def test_resource_budget(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx={'mem': 1, 'ncpus': 1})
+
+        workflow.transform(
+            name='split',
+            func=split_file_byline,
+            args=(
+                mgd.InputFile(self.input_filename),
+                1,
+                mgd.TempOutputFile('input_filename', 'line')))
+
+        workflow.transform(
+            name='do',
+            axes=('line',),
+            ctx={'mem': 2},
+            func=do_file_stuff,
+            args=(
+                mgd.TempInputFile('input_filename', 'line'),
+                mgd.TempOutputFile('output_filename', 'line'),
+                'a'))
+
+        # Memory request larger than the budget
+        workflow.transform(
+            name='merge',
+            ctx={'mem': 8},
+            func=merge_file_byline,
+            args=(
+                mgd.TempInputFile('output_filename', 'line'),
+                mgd.OutputFile(self.output_filename)))
+
+        self.run_workflow(workflow, max_mem=4, max_cpus=2)
+
+        with open(self.output_filename, 'r') as output_file:
+            output = output_file.readlines()
+
+        self.assertEqual(output, ['0aline{0}\n'.format(idx) for idx in range(1, 9)])
+
+    def test_batch_jobs(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='split',
+            func=split_file_byline,
+            args=(
+                mgd.InputFile(self.input_filename),
+                1,
+                mgd.TempOutputFile('input_filename', 'line')))
+
+        workflow.transform(
+            name='do',
+            axes=('line',),
+            ctx={'mem': 1, 'batch': 3, 'batch_threads': 2},
+            func=do_file_stuff,
+            args=(
+                mgd.TempInputFile('input_filename', 'line'),
+                mgd.TempOutputFile('output_filename', 'line'),
+                'a'))
+
+        workflow.transform(
+            name='merge',
+            func=merge_file_byline,
+            args=(
+                mgd.TempInputFile('output_filename', 'line'),
+                mgd.OutputFile(self.output_filename)))
+
+        self.run_workflow(workflow)
+
+        with open(self.output_filename, 'r') as output_file:
+            output = output_file.readlines()
+
+        self.assertEqual(output, ['0aline{0}\n'.format(idx) for idx in range(1, 9)])
+
+        stats = pypeliner.instrument.stats.as_dict()
+        self.assertEqual(stats['counters']['jobs.batches'], 3)
+        self.assertEqual(stats['counters']['jobs.completed'], 10)
+
+        # Memory of batched jobs is not recorded
+        run_history = pypeliner.history.RunHistory(os.path.join(pipeline_dir, 'history.db'))
+        self.assertEqual([run['memory'] is None for run in run_history.query(task_name='do')], [True] * 8)
+        self.assertEqual([run['memory'] is None for run in run_history.query(task_name='split')], [False])
+        run_history.close()
+
+    def test_unhashable_ctx(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='split',
+            func=split_file_byline,
+            args=(
+                mgd.InputFile(self.input_filename),
+                1,
+                mgd.TempOutputFile('input_filename', 'line')))
+
+        workflow.transform(
+            name='do',
+            axes=('line',),
+            ctx={'mem': 1, 'batch': 2, 'tags': ['a', 'b'], 'labels': {'a': 'b'}},
+            func=do_file_stuff,
+            args=(
+                mgd.TempInputFile('input_filename', 'line'),
+                mgd.TempOutputFile('output_filename', 'line'),
+                'a'))
+
+        workflow.transform(
+            name='merge',
+            func=merge_file_byline,
+            args=(
+                mgd.TempInputFile('output_filename', 'line'),
+                mgd.OutputFile(self.output_filename)))
+
+        self.run_workflow(workflow)
+
+        with open(self.output_filename, 'r') as output_file:
+            output = output_file.readlines()
+
+        self.assertEqual(output, ['0aline{0}\n'.format(idx) for idx in range(1, 9)])
+
+    def test_inprocess_jobs(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='read',
+            ctx={'mem': 1, 'inprocess': True},
+            func=read_stuff,
+            ret=mgd.TempOutputObj('input_data'),
+            args=(mgd.InputFile(self.input_filename),))
+
+        workflow.transform(
+            name='do',
+            ctx={'mem': 1, 'inprocess': True},
+            func=do_stuff,
+            ret=mgd.TempOutputObj('output_data'),
+            args=(mgd.TempInputObj('input_data').prop('some_string'),))
+
+        workflow.transform(
+            name='write',
+            func=write_stuff,
+            args=(
+                mgd.TempInputObj('output_data'),
+                mgd.OutputFile(self.output_filename)))
+
+        pid_filename = os.path.join(pipeline_dir, '{}.pid')
+        for inprocess in (True, False):
+            workflow.transform(
+                name='write_pid_{}'.format(inprocess),
+                ctx={'mem': 1, 'inprocess': inprocess},
+                func=write_pid,
+                args=(mgd.OutputFile(pid_filename.format(inprocess)),))
+
+        stdout, stderr = sys.stdout, sys.stderr
+
+        self.run_workflow(workflow)
+
+        # Output streams redirected for in process jobs are restored
+        self.assertIs(sys.stdout, stdout)
+        self.assertIs(sys.stderr, stderr)
+
+        with open(self.output_filename, 'r') as output_file:
+            output = output_file.readlines()
+
+        self.assertEqual(output, ['line1\n', 'line2\n', 'line3\n', 'line4\n', 'line5\n', 'line6\n', 'line7\n', 'line8-'])
+
+        for inprocess in (True, False):
+            with open(pid_filename.format(inprocess), 'r') as pid_file:
+                self.assertEqual(int(pid_file.read()) == os.getpid(), inprocess)
+
+        # Memory of in process jobs is not recorded
+        run_history = pypeliner.history.RunHistory(os.path.join(pipeline_dir, 'history.db'))
+        for inprocess in (True, False):
+            runs = run_history.query(task_name='write_pid_{}'.format(inprocess))
+            self.assertEqual([run['memory'] is None for run in runs], [inprocess])
+        run_history.close()
+
+    def test_job_cache(self):
+
+        cache_dir = os.path.join(script_directory, 'job_cache')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='read',
+            func=read_stuff,
+            ret=mgd.TempOutputObj('input_data'),
+            args=(mgd.InputFile(self.input_filename),))
+
+        workflow.transform(
+            name='do',
+            func=do_file_stuff,
+            args=(
+                mgd.InputFile(self.input_filename),
+                mgd.TempOutputFile('output_filename'),
+                'a'))
+
+        workflow.transform(
+            name='write',
+            func=merge_file_byline,
+            args=(
+                {1: mgd.TempInputFile('output_filename')},
+                mgd.OutputFile(self.output_filename)))
+
+        workflow.transform(
+            name='nocache',
+            ctx={'mem': 1, 'cache': False},
+            func=do_stuff,
+            ret=mgd.TempOutputObj('output_data'),
+            args=(mgd.TempInputObj('input_data').prop('some_string'),))
+
+        try:
+            for num_cached in (0, 3):
+                # Run in a new pipeline directory, restoring from the cache
+                shutil.rmtree(pipeline_dir, ignore_errors=True)
+                pypeliner.helpers.saferemove(self.output_filename)
+
+                self.run_workflow(workflow, cache_dir=cache_dir)
+
+                with open(self.output_filename, 'r') as output_file:
+                    output = output_file.readlines()
+
+                self.assertEqual(output, ['{0}aline{1}\n'.format(idx - 1, idx) for idx in range(1, 9)])
+
+                stats = pypeliner.instrument.stats.as_dict()
+                self.assertEqual(stats['counters'].get('jobs.cached', 0), num_cached)
+                self.assertEqual(stats['counters'].get('jobs.completed', 0), 4 - num_cached)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_job_cache_rerun_dependents(self):
+
+        cache_dir = os.path.join(script_directory, 'job_cache')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+        input_filename = os.path.join(pipeline_dir, 'cache.input')
+        cached_filename = os.path.join(pipeline_dir, 'cache.cached')
+        pypeliner.helpers.makedirs(pipeline_dir)
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='cached',
+            func=copy_file,
+            args=(
+                mgd.InputFile(input_filename),
+                mgd.OutputFile(cached_filename)))
+
+        workflow.transform(
+            name='uncached',
+            ctx={'mem': 1, 'cache': False},
+            func=copy_file,
+            args=(
+                mgd.InputFile(cached_filename),
+                mgd.OutputFile(self.output_filename)))
+
+        try:
+            # Restoring the first contents from the cache reruns the dependent job
+            for contents, num_cached in (('x\n', 0), ('y\n', 0), ('x\n', 1)):
+                with open(input_filename, 'w') as input_file:
+                    input_file.write(contents)
+
+                self.run_workflow(workflow, cache_dir=cache_dir)
+
+                stats = pypeliner.instrument.stats.as_dict()
+                self.assertEqual(stats['counters'].get('jobs.cached', 0), num_cached)
+                self.assertEqual(stats['counters'].get('jobs.completed', 0), 2 - num_cached)
+
+                for filename in (cached_filename, self.output_filename):
+                    with open(filename, 'r') as output_file:
+                        self.assertEqual(output_file.read(), contents)
+
+            # Writing to an output does not modify the cached file
+            with open(cached_filename, 'r+') as cached_file:
+                cached_file.write('z\n')
+            input_time = time.time() + 10
+            os.utime(input_filename, (input_time, input_time))
+            self.run_workflow(workflow, cache_dir=cache_dir)
+            self.assertEqual(pypeliner.instrument.stats.as_dict()['counters'].get('jobs.cached', 0), 1)
+            with open(cached_filename, 'r') as cached_file:
+                self.assertEqual(cached_file.read(), 'x\n')
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_checksums(self):
+
+        input_filename = os.path.join(pipeline_dir, 'checksums.input')
+        pypeliner.helpers.makedirs(pipeline_dir)
+        shutil.copyfile(self.input_filename, input_filename)
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='do',
+            func=do_file_stuff,
+            args=(
+                mgd.InputFile(input_filename),
+                mgd.OutputFile(self.output_filename),
+                'a'))
+
+        # Rerun only after the contents of the input change
+        for modify, num_completed in ((None, 1), ('touch', 0), ('append', 1)):
+            if modify == 'touch':
+                input_time = time.time() + 10
+                os.utime(input_filename, (input_time, input_time))
+            elif modify == 'append':
+                with open(input_filename, 'a') as input_file:
+                    input_file.write('line9\n')
+
+            self.run_workflow(workflow, digests=True)
+
+            stats = pypeliner.instrument.stats.as_dict()
+            self.assertEqual(stats['counters'].get('jobs.completed', 0), num_completed)
+
+        with open(self.output_filename, 'r') as output_file:
+            self.assertEqual(output_file.readlines()[-1], '8aline9\n')
+
+    def test_sampled_checksums(self):
+
+        input_filename = os.path.join(pipeline_dir, 'sampled.input')
+        pypeliner.helpers.makedirs(pipeline_dir)
+        with open(input_filename, 'wb') as input_file:
+            input_file.write('\0' * (5 * 1024 * 1024))
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.transform(
+            name='copy',
+            func=copy_file,
+            args=(
+                mgd.InputFile(input_filename, sample_blocks=1),
+                mgd.OutputFile(self.output_filename)))
+
+        # Blocks at 0, 2MB and 4MB are sampled, changes elsewhere are not detected
+        for offset, num_completed in ((None, 1), (1024 * 1024, 0), (2 * 1024 * 1024, 1)):
+            if offset is not None:
+                with open(input_filename, 'r+b') as input_file:
+                    input_file.seek(offset)
+                    input_file.write('x')
+                input_time = time.time() + 10
+                os.utime(input_filename, (input_time, input_time))
+
+            self.run_workflow(workflow, digests=True)
+
+            stats = pypeliner.instrument.stats.as_dict()
+            self.assertEqual(stats['counters'].get('jobs.completed', 0), num_completed)
+
     def test_dict_args(self):
 
         workflow = pypeliner.workflow.Workflow()
@@ -308,6 +870,144 @@ class scheduler_test(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    def test_background_sub_workflow(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        ready_filename = os.path.join(pipeline_dir, 'ready')
+
+        # Sub workflow creation blocks until another job has run
+        workflow.subworkflow(
+            name='sub_workflow',
+            func=create_workflow_after_file,
+            args=(
+                ready_filename,
+                mgd.InputFile(self.input_filename)))
+
+        workflow.transform(
+            name='touch',
+            func=touch,
+            args=(
+                ready_filename,
+                mgd.InputFile(self.input_filename)))
+
+        self.run_workflow(workflow)
+
+    def test_background_sub_workflow_wakeup(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx={'mem': 1, 'inprocess': True})
+
+        ready_filename = os.path.join(pipeline_dir, 'ready')
+
+        workflow.subworkflow(
+            name='sub_workflow',
+            func=create_workflow_after_file,
+            args=(
+                ready_filename,
+                mgd.InputFile(self.input_filename)))
+
+        # Jobs finishing while the sub workflow is created are received
+        # without waiting for a poll interval
+        workflow.transform(
+            name='copy_0',
+            func=copy_file,
+            args=(
+                mgd.InputFile(self.input_filename),
+                mgd.TempOutputFile('copy_0')))
+
+        for idx in range(1, 10):
+            workflow.transform(
+                name='copy_{}'.format(idx),
+                func=copy_file,
+                args=(
+                    mgd.TempInputFile('copy_{}'.format(idx - 1)),
+                    mgd.TempOutputFile('copy_{}'.format(idx))))
+
+        workflow.transform(
+            name='touch',
+            func=touch,
+            args=(
+                ready_filename,
+                mgd.TempInputFile('copy_9')))
+
+        start = time.time()
+        self.run_workflow(workflow)
+        self.assertLess(time.time() - start, 5)
+
+    def pop_sub_workflow_chunks(self, fair_share):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        workflow.setobj(obj=mgd.OutputChunks('byfile'), value=(1, 2))
+
+        workflow.subworkflow(
+            name='sub_workflow',
+            axes=('byfile',),
+            func=create_workflow_independent_jobs,
+            args=(
+                3,
+                mgd.InputInstance('byfile')))
+
+        exec_queue = pypeliner.execqueue.factory.create('local', [pypeliner.tests.tasks])
+        storage = pypeliner.storage.create('local', pipeline_dir)
+        runskip = pypeliner.runskip.BasicRunSkip()
+
+        chunks = []
+        with storage, pypeliner.database.WorkflowDatabaseFactory(
+                os.path.join(pipeline_dir, 'tmp'), pipeline_dir, os.path.join(pipeline_dir, 'log'), storage) as db_factory:
+            workflow_instance = pypeliner.graph.WorkflowInstance(workflow, db_factory, runskip, fair_share=fair_share)
+            while True:
+                try:
+                    job = workflow_instance.pop_next_job()
+                except pypeliner.graph.NoJobs:
+                    break
+                chunks.append(job.workflow.node[0][1])
+
+        return chunks
+
+    def test_fair_share(self):
+
+        chunks = self.pop_sub_workflow_chunks('none')
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(len(set(chunks[:3])), 1)
+
+        for fair_share in ('round_robin', 'least_running'):
+            chunks = self.pop_sub_workflow_chunks(fair_share)
+            self.assertEqual(len(chunks), 6)
+            for idx in xrange(5):
+                self.assertNotEqual(chunks[idx], chunks[idx + 1])
+
+    def test_lazy_jobs(self):
+
+        workflow = pypeliner.workflow.Workflow(default_ctx=self.ctx)
+
+        for idx in (1, 2, 3):
+            workflow.transform(
+                name='do_file_stuff_{}'.format(idx),
+                func=do_file_stuff,
+                args=(
+                    (mgd.TempInputFile('temp_file{}'.format(idx - 1)), mgd.InputFile(self.input_filename))[idx == 1],
+                    mgd.TempOutputFile('temp_file{}'.format(idx)),
+                    str(idx)))
+
+        storage = pypeliner.storage.create('local', pipeline_dir)
+        runskip = pypeliner.runskip.BasicRunSkip()
+
+        with storage, pypeliner.database.WorkflowDatabaseFactory(
+                os.path.join(pipeline_dir, 'tmp'), pipeline_dir, os.path.join(pipeline_dir, 'log'), storage) as db_factory:
+            workflow_instance = pypeliner.graph.WorkflowInstance(workflow, db_factory, runskip, lazy=True)
+            self.assertEqual(workflow_instance.deferred, set(['do_file_stuff_2', 'do_file_stuff_3']))
+            self.assertEqual(len(workflow_instance.graph.jobs), 1)
+
+            job = workflow_instance.pop_next_job()
+            self.assertEqual(job.job_def.name, 'do_file_stuff_1')
+            self.assertRaises(pypeliner.graph.NoJobs, workflow_instance.pop_next_job)
+            self.assertFalse(workflow_instance.finished)
+
+            workflow_instance.notify_completed(job.id)
+            self.assertEqual(workflow_instance.deferred, set(['do_file_stuff_3']))
+            self.assertEqual(len(workflow_instance.graph.jobs), 2)
+
     def test_specify_input_filename(self):
 
         workflow = pypeliner.workflow.Workflow()
@@ -1446,6 +2146,11 @@ class scheduler_test(unittest.TestCase):
         self.run_workflow(workflow)
 
 
+class lazy_scheduler_test(scheduler_test):
+
+    lazy_jobs = True
+
+
 if __name__ == '__main__':
     unittest.main()
 
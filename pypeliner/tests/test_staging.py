@@ -0,0 +1,110 @@
+import unittest
+import shutil
+import os
+import tempfile
+import time
+
+import pypeliner.staging
+
+
+class RemoteStore(object):
+    is_remote = True
+    def __init__(self, filename, remote_filename):
+        self.filename = filename
+        self.remote_filename = remote_filename
+        self.staged_filename = None
+    def get_exists(self):
+        return os.path.exists(self.remote_filename)
+    def get_size(self):
+        return os.path.getsize(self.remote_filename)
+    def stage(self, staged_filename):
+        shutil.copyfile(self.remote_filename, staged_filename)
+
+
+class SlowRemoteStore(RemoteStore):
+    def stage(self, staged_filename):
+        time.sleep(0.2)
+        RemoteStore.stage(self, staged_filename)
+
+
+class StagingResource(object):
+    def __init__(self, store):
+        self.stores = [store]
+
+
+class StagingJob(object):
+    def __init__(self, name, stores):
+        self.displayname = name
+        self.input_resources = [StagingResource(store) for store in stores]
+
+
+class staging_test(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.staging_dir = os.path.join(self.temp_dir, 'staging')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_store(self, name, size):
+        remote_filename = os.path.join(self.temp_dir, name + '.remote')
+        with open(remote_filename, 'w') as f:
+            f.write('x' * size)
+        return RemoteStore(os.path.join(self.temp_dir, name), remote_filename)
+
+    def test_stage_jobs(self):
+
+        store_1 = self.create_store('input_1', 10)
+        store_2 = self.create_store('input_2', 10)
+        store_3 = self.create_store('input_3', 10)
+
+        job_1 = StagingJob('job_1', [store_1, store_2])
+        job_2 = StagingJob('job_2', [store_2, store_3])
+
+        stager = pypeliner.staging.InputStager(self.staging_dir, max_bytes=25)
+        stager.stage_jobs([job_1, job_2])
+
+        # Staging input 3 would exceed the size limit
+        self.assertEqual(stager.staged_bytes, 20)
+        self.assertNotIn(store_3.filename, stager.staged)
+
+        for staged in stager.staged.itervalues():
+            staged.done.wait(10)
+
+        stager.prepare(job_1)
+        self.assertTrue(os.path.exists(store_1.staged_filename))
+        self.assertTrue(os.path.exists(store_2.staged_filename))
+
+        # Input 2 is kept for job 2
+        stager.release(job_1)
+        self.assertFalse(os.path.exists(store_1.staged_filename))
+        self.assertTrue(os.path.exists(store_2.staged_filename))
+
+        stager.stage_jobs([job_2])
+        self.assertEqual(stager.staged_bytes, 20)
+        self.assertIn(store_3.filename, stager.staged)
+
+        stager.close()
+        self.assertFalse(os.path.exists(self.staging_dir))
+
+    def test_close_while_staging(self):
+
+        store = self.create_store('input', 10)
+        store = SlowRemoteStore(store.filename, store.remote_filename)
+
+        stager = pypeliner.staging.InputStager(self.staging_dir)
+        stager.stage_jobs([StagingJob('job', [store])])
+
+        # Staging is still in progress, close waits for it
+        staged = stager.staged[store.filename]
+        self.assertFalse(staged.done.is_set())
+        stager.close()
+
+        self.assertTrue(staged.done.is_set())
+        self.assertFalse(staged.failed)
+        self.assertFalse(os.path.exists(self.staging_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
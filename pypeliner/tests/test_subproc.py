@@ -0,0 +1,47 @@
+import unittest
+import shutil
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pypeliner.execqueue.local
+
+
+class SleepJob(object):
+    def __init__(self, duration):
+        self.duration = duration
+        self.success = False
+    def __call__(self):
+        time.sleep(self.duration)
+        self.success = True
+
+
+class subproc_test(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_other_subprocesses(self):
+        exec_queue = pypeliner.execqueue.local.LocalJobQueue([sys.modules[__name__]])
+
+        with exec_queue:
+            exec_queue.send({'mem': 1}, 'sleep', SleepJob(0.5), self.temp_dir)
+
+            # Finishes while the queue is waiting, and is not reaped by the queue
+            process = subprocess.Popen(['sh', '-c', 'exit 3'])
+
+            self.assertIsNone(exec_queue.wait(immediate=True))
+            self.assertEqual(exec_queue.wait(), 'sleep')
+            self.assertTrue(exec_queue.receive('sleep').success)
+            self.assertTrue(exec_queue.empty)
+
+        self.assertEqual(process.wait(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
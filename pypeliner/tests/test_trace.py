@@ -0,0 +1,45 @@
+import unittest
+import shutil
+import os
+import json
+import tempfile
+
+import pypeliner.trace
+
+
+class trace_test(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.trace_filename = os.path.join(self.temp_dir, 'trace.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_lanes(self):
+        tracer = pypeliner.trace.TraceWriter(self.trace_filename)
+        t = tracer.start_time
+
+        # Two overlapping jobs and a third after the first, on one host
+        tracer.add_attempt('/a', '', 0, 'success', 'host1', t, t + 1, t + 2, 3, t + 6, t + 7)
+        tracer.add_attempt('/b', '', 0, 'success', 'host1', t + 1, t + 2, t + 3, 5, t + 9, t + 10)
+        tracer.add_attempt('/c', '', 0, 'fail', 'host1', t + 8, t + 9, t + 10, 1, t + 12, t + 13)
+        tracer.add_attempt('/sub/d', 'sub', 0, 'success', 'host2', t, t + 1, t + 2, 1, t + 4, t + 5)
+        tracer.close()
+
+        with open(self.trace_filename) as f:
+            events = json.load(f)
+
+        spans = dict([(event['name'], event) for event in events if event['ph'] == 'X'])
+        self.assertEqual(spans['/a']['tid'], spans['/c']['tid'])
+        self.assertNotEqual(spans['/a']['tid'], spans['/b']['tid'])
+        self.assertNotEqual(spans['/a']['pid'], spans['/sub/d']['pid'])
+        self.assertEqual(spans['/c']['args']['status'], 'fail')
+
+        runs = [event for event in events if event['name'] == 'run']
+        self.assertEqual(len(runs), 4)
+        self.assertEqual(runs[0]['dur'], 3000000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Trace of a pipeline run
+
+Writes job attempts to a file in the Chrome trace event json format, which
+can be loaded into chrome://tracing or the Perfetto trace viewer.
+
+Each host is shown as a process, and the jobs of each subworkflow namespace
+on that host are shown in a group of lanes, with as many lanes as jobs of
+that namespace overlapped on that host.  Each job attempt is a span from
+submission to completion, with nested spans for submitting the job, waiting
+in the queue, running the job and finalizing the job.  Times of the run are
+measured on the host running the job, and may be skewed relative to the
+other times if host clocks differ.
+
+Events are written as attempts finish, so the trace of a run that was
+interrupted remains readable.
+
+"""
+
+import json
+import os
+import time
+
+import pypeliner.helpers
+
+
+class TraceWriter(object):
+    """ Write a trace of job attempts to a file.
+
+    :param filename: trace event json filename
+
+    """
+    def __init__(self, filename):
+        pypeliner.helpers.makedirs(os.path.dirname(filename))
+        self.trace_file = open(filename, 'w')
+        self.trace_file.write('[')
+        self.num_events = 0
+        self.start_time = time.time()
+        self.hosts = dict()
+        self.lanes = dict()
+        self.num_lanes = dict()
+
+    def _write_event(self, event):
+        if self.num_events > 0:
+            self.trace_file.write(',')
+        self.trace_file.write('\n' + json.dumps(event))
+        self.num_events += 1
+
+    def _timestamp(self, t):
+        return int((t - self.start_time) * 1e6)
+
+    def _get_pid(self, hostname):
+        if hostname not in self.hosts:
+            pid = len(self.hosts) + 1
+            self.hosts[hostname] = pid
+            self._write_event({'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0,
+                               'args': {'name': hostname}})
+        return self.hosts[hostname]
+
+    def _get_tid(self, pid, namespace, begin, end):
+        """ Find a lane of a namespace on a host free from begin to end.  Attempts
+        are added as they finish, so a lane is free if it ends before begin.
+        """
+        lanes = self.lanes.setdefault((pid, namespace), list())
+        for idx, (tid, lane_end) in enumerate(lanes):
+            if lane_end <= begin:
+                lanes[idx] = (tid, end)
+                return tid
+        tid = self.num_lanes.get(pid, 0) + 1
+        self.num_lanes[pid] = tid
+        lanes.append((tid, end))
+        lane_name = '{0} #{1}'.format(namespace or '/', len(lanes))
+        self._write_event({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid,
+                           'args': {'name': lane_name}})
+        return tid
+
+    def _write_span(self, name, pid, tid, begin, end, args=None):
+        event = {'ph': 'X', 'name': name, 'cat': 'job', 'pid': pid, 'tid': tid,
+                 'ts': self._timestamp(begin), 'dur': max(self._timestamp(end) - self._timestamp(begin), 0)}
+        if args is not None:
+            event['args'] = args
+        self._write_event(event)
+
+    def add_attempt(self, name, namespace, attempt, status, hostname,
+                    submit_time, sent_time, start_time, duration, receive_time, end_time):
+        """ Add spans for an attempt of a job.
+
+        :param name: display name of the job
+        :param namespace: display name of the subworkflow namespace of the job
+        :param attempt: index of the attempt, 0 for the first
+        :param status: 'success', 'fail' or 'error'
+        :param hostname: host on which the job ran, None if unknown
+        :param submit_time: time at which submission started
+        :param sent_time: time at which submission finished
+        :param start_time: time the job started on the host, None if unknown
+        :param duration: run time of the job, None if unknown
+        :param receive_time: time at which the job was received from the queue
+        :param end_time: time at which the job was finalized
+
+        """
+        if hostname is None:
+            hostname = 'unknown'
+        pid = self._get_pid(hostname)
+        tid = self._get_tid(pid, namespace, submit_time, end_time)
+        args = {'attempt': attempt, 'status': status, 'host': hostname}
+        self._write_span(name, pid, tid, submit_time, end_time, args=args)
+        self._write_span('submit', pid, tid, submit_time, sent_time)
+        if start_time is not None and duration is not None:
+            start_time = min(max(start_time, sent_time), receive_time)
+            run_end_time = min(start_time + duration, receive_time)
+            self._write_span('queue', pid, tid, sent_time, start_time)
+            self._write_span('run', pid, tid, start_time, run_end_time)
+        self._write_span('finalize', pid, tid, receive_time, end_time)
+        self.trace_file.flush()
+
+    def close(self):
+        self.trace_file.write('\n]\n')
+        self.trace_file.close()
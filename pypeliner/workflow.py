@@ -104,7 +104,14 @@ class Workflow(object):
                     is given to the exec queue and provides a way of communicating jobs
                     specific requirements such as memory and cpu usage.  Setting
                     ``ctx['local'] = True`` will result in the job being run locally on
-                    the calling machine even when a cluster is being used.
+                    the calling machine even when a cluster is being used.  Setting
+                    ``ctx['duration']`` provides an estimate in seconds of the job's
+                    duration, used by the critical path schedule for tasks without
+                    recorded durations.  Setting ``ctx['mem_history_factor']`` requests
+                    memory for the job and its retries as the peak memory recorded for
+                    previous successful runs of the same task multiplied by the given
+                    factor.  The prediction replaces ``ctx['mem']``, even if lower, and
+                    is at least ``ctx['mem_history_min']`` if set.
         :param func: The function to call for this job.
         :param ret: The return value 
         :param args: The list of positional arguments to be used for the function call.
@@ -128,7 +135,7 @@ class Workflow(object):
             raise ValueError('Job already defined')
         self.job_definitions[name] = pypeliner.jobs.JobDefinition(name, axes, job_ctx, func, pypeliner.jobs.CallSet(ret=ret, args=args, kwargs=kwargs))
 
-    def subworkflow(self, name='', axes=(), func=None, args=None, kwargs=None):
+    def subworkflow(self, name='', axes=(), func=None, args=None, kwargs=None, ctx=None):
         """ Add a sub workflow to the pipeline.  A sub workflow is a set of jobs that
         takes the input dependencies and creates/updates output dependents.  The python 
         function ``func`` should return a workflow object containing the set of jobs.
@@ -142,21 +149,32 @@ class Workflow(object):
         :param func: The function to call for this job.
         :param args: The list of positional arguments to be used for the function call.
         :param kwargs: The list of keyword arguments to be used for the function call.
+        :param ctx: context of the sub workflow as a dictionary.
 
         Any value in args or kwargs that is an instance of
         :py:class:`pypeliner.managed.Managed` will be resolved to a pipeline managed
         file or object at runtime.  See :py:mod:`pypeliner.managed`.
 
+        Context is used by the scheduler when sharing jobs between sub workflows.
+        Setting ctx['share'] gives each instance of the sub workflow the given
+        relative share of submitted jobs, default 1.
+
         """
         if name in self.job_definitions:
             raise ValueError('Job already defined')
-        self.job_definitions[name] = pypeliner.jobs.SubWorkflowDefinition(name, axes, func, pypeliner.jobs.CallSet(args=args, kwargs=kwargs))
+        self.job_definitions[name] = pypeliner.jobs.SubWorkflowDefinition(name, axes, ctx, func, pypeliner.jobs.CallSet(args=args, kwargs=kwargs))
 
-    def _create_job_instances(self, graph, db):
+    def _create_job_instances(self, graph, db, axes=None, skip=()):
         """ Create job instances from job definitions given resource and node managers,
-        and a log directory.
+        and a log directory.  If axes is given, only create instances for job
+        definitions that depend on those axes.  Job definitions with names in skip
+        are ignored.
         """
         for job_def in self.job_definitions.itervalues():
+            if job_def.name in skip:
+                continue
+            if axes is not None and not job_def.depends_on_axes(axes):
+                continue
             for job_inst in job_def.create_job_instances(graph, db):
                 yield job_inst
 
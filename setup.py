@@ -3,7 +3,7 @@ import versioneer
 
 setup(
     name='pypeliner',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     version=versioneer.get_version(),
     cmdclass=versioneer.get_cmdclass(),
     description='A library for creating informatic workflows or pipelines.',